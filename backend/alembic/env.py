@@ -14,10 +14,12 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 # Import your models
 from app.models.user import User
 from app.db.database import Base
+from app.core.config import settings
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
+config.set_main_option("sqlalchemy.url", settings.DATABASE_URL)
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -0,0 +1,33 @@
+"""add billing history keyset index
+
+Revision ID: b3f1c9d27a64
+Revises: 6526352581f0
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f1c9d27a64'
+down_revision: Union[str, None] = '6526352581f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped by create_all already have the index
+    op.create_index(
+        'ix_billing_history_user_id_payment_date_id',
+        'billing_history',
+        ['user_id', 'payment_date', 'id'],
+        unique=False,
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_billing_history_user_id_payment_date_id', table_name='billing_history')
@@ -0,0 +1,34 @@
+"""add app meta table
+
+Revision ID: c8e4b2f6a913
+Revises: a5d2e8f17c43
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e4b2f6a913'
+down_revision: Union[str, None] = 'a5d2e8f17c43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped by create_all already have the table
+    if 'app_meta' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'app_meta',
+            sa.Column('key', sa.String(), nullable=False),
+            sa.Column('value', sa.String(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+            sa.PrimaryKeyConstraint('key'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('app_meta')
@@ -0,0 +1,41 @@
+"""add usage rollup tables
+
+Revision ID: d41e7a8f05b2
+Revises: b3f1c9d27a64
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41e7a8f05b2'
+down_revision: Union[str, None] = 'b3f1c9d27a64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped by create_all already have the tables
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    for table_name in ('usage_rollups_hourly', 'usage_rollups_daily'):
+        if table_name in existing:
+            continue
+        op.create_table(
+            table_name,
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('bucket_start', sa.DateTime(), nullable=False),
+            sa.Column('api_calls', sa.Integer(), nullable=False),
+            sa.Column('storage_used', sa.Integer(), nullable=False),
+            sa.Column('team_members_used', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('user_id', 'bucket_start'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('usage_rollups_daily')
+    op.drop_table('usage_rollups_hourly')
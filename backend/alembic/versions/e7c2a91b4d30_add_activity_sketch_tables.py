@@ -0,0 +1,47 @@
+"""add activity sketch tables
+
+Revision ID: e7c2a91b4d30
+Revises: d41e7a8f05b2
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c2a91b4d30'
+down_revision: Union[str, None] = 'd41e7a8f05b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped by create_all already have the tables
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'activity_sketches' not in existing:
+        op.create_table(
+            'activity_sketches',
+            sa.Column('tenant_id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('registers', sa.LargeBinary(), nullable=False),
+            sa.ForeignKeyConstraint(['tenant_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('tenant_id', 'kind', 'day'),
+        )
+    if 'tenant_end_users' not in existing:
+        op.create_table(
+            'tenant_end_users',
+            sa.Column('tenant_id', sa.Integer(), nullable=False),
+            sa.Column('user_hash', sa.BigInteger(), nullable=False),
+            sa.Column('first_seen', sa.Date(), nullable=False),
+            sa.ForeignKeyConstraint(['tenant_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('tenant_id', 'user_hash'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('tenant_end_users')
+    op.drop_table('activity_sketches')
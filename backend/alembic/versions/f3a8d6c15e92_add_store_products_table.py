@@ -0,0 +1,39 @@
+"""add store products table
+
+Revision ID: f3a8d6c15e92
+Revises: e7c2a91b4d30
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a8d6c15e92'
+down_revision: Union[str, None] = 'e7c2a91b4d30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped by create_all already have the table
+    if 'store_products' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'store_products',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.BigInteger(), nullable=False),
+            sa.Column('title', sa.String(), nullable=True),
+            sa.Column('handle', sa.String(), nullable=True),
+            sa.Column('variant_titles', sa.JSON(), nullable=True),
+            sa.Column('data', sa.JSON(), nullable=False),
+            sa.Column('extracted_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('user_id', 'product_id'),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('store_products')
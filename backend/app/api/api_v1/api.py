@@ -1,12 +1,16 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
+from app.api.deps import enforce_api_quota
 from app.api.api_v1.endpoints import auth, users, organizations, sdk_wizard, analysis, billing, dashboard
 
 api_router = APIRouter()
+# Product APIs count against the plan's call quota; auth, account and billing
+# stay reachable so an over-quota user can still see usage and upgrade
+quota = [Depends(enforce_api_quota)]
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(organizations.router, prefix="/org", tags=["organizations"])
-api_router.include_router(sdk_wizard.router, prefix="/sdk-wizard", tags=["sdk-wizard"])
-api_router.include_router(analysis.router, prefix="/analysis", tags=["analysis"])
+api_router.include_router(sdk_wizard.router, prefix="/sdk-wizard", tags=["sdk-wizard"], dependencies=quota)
+api_router.include_router(analysis.router, prefix="/analysis", tags=["analysis"], dependencies=quota)
 api_router.include_router(billing.router, prefix="/billing", tags=["billing"])
-api_router.include_router(dashboard.router, prefix="/dashboard", tags=["dashboard"]) 
\ No newline at end of file
+api_router.include_router(dashboard.router, prefix="/dashboard", tags=["dashboard"], dependencies=quota) 
\ No newline at end of file
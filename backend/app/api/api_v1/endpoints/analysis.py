@@ -1,42 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 from datetime import datetime, timedelta
-import random
 
-from app.core.auth import get_current_user
+from app.api.deps import get_current_user, get_db
+from app.core.config import settings
 from app.schemas.user import User
+from app.services.activity import ACTIVE, NEW, activity_recorder, distinct_users
+from app.services.mentions import get_mention_tracker, top_mentions
+from app.services.product_matcher import ProductMatcher, get_product_matcher
+from app.services.request_metrics import request_sampler
+from app.services.segmentation import session_recorder, user_segments
+from app.services.timeseries import (
+    INTENT_CATEGORIES, downsample, get_host_series, intent_trends, latency_summary, open_tenant_series,
+    product_trends, record_intent_queries, sales_performance, system_metrics, to_records
+)
 
 router = APIRouter()
 
+class ActivityEvent(BaseModel):
+    user_id: str = Field(..., min_length=1)
+    timestamp: Optional[datetime] = None
+
+class ActivityRequest(BaseModel):
+    events: List[ActivityEvent] = Field(..., max_length=settings.ACTIVITY_MAX_EVENTS)
+
+class SessionEvent(BaseModel):
+    user_id: str = Field(..., min_length=1)
+    duration_seconds: float = Field(..., ge=0)
+    features: List[str] = []
+    started_at: Optional[datetime] = None
+
+class SessionsRequest(BaseModel):
+    sessions: List[SessionEvent] = Field(..., max_length=settings.SEGMENTATION_MAX_SESSIONS)
+
+class IntentQuery(BaseModel):
+    category: str
+    timestamp: Optional[datetime] = None
+
+class IntentQueriesRequest(BaseModel):
+    queries: List[IntentQuery] = Field(..., max_length=settings.INTENT_MAX_QUERIES)
+
+class MentionExtractRequest(BaseModel):
+    queries: List[str] = Field(..., max_length=settings.MENTIONS_EXTRACT_MAX_QUERIES)
+    record: bool = True
+
 def generate_date_range(start_date: Optional[datetime], end_date: Optional[datetime], days: int = 30):
     end = end_date or datetime.now()
     start = start_date or (end - timedelta(days=days))
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    if (end - start).days > settings.ANALYSIS_MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Date range cannot exceed {settings.ANALYSIS_MAX_RANGE_DAYS} days",
+        )
     return start, end
 
+
 @router.get("/product")
 async def get_product_engagement_trends(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    max_points: int = Query(settings.ANALYSIS_DEFAULT_MAX_POINTS, ge=3),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get product engagement trends data
     """
     start, end = generate_date_range(start_date, end_date)
-    
-    # Generate sample data for the last 30 days
-    dates = [(start + timedelta(days=x)) for x in range((end - start).days + 1)]
-    trends = [
-        {
-            "date": date.strftime("%Y-%m-%d"),
-            "views": random.randint(100, 1000),
-            "clicks": random.randint(50, 500),
-            "conversions": random.randint(10, 100),
-            "engagement_rate": round(random.uniform(0.1, 0.5), 2)
-        }
-        for date in dates
-    ]
-    
+    series = await open_tenant_series(current_user.id)
+    trends = to_records(downsample(
+        product_trends(series, start.date(), end.date()), "views", max_points
+    ))
+
     return {
         "trends": trends,
         "period": {
@@ -49,25 +88,18 @@ async def get_product_engagement_trends(
 async def get_sales_performance(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    max_points: int = Query(settings.ANALYSIS_DEFAULT_MAX_POINTS, ge=3),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get sales performance data
     """
     start, end = generate_date_range(start_date, end_date)
-    
-    # Generate sample sales data
-    performance = [
-        {
-            "date": (start + timedelta(days=x)).strftime("%Y-%m-%d"),
-            "revenue": round(random.uniform(1000, 10000), 2),
-            "orders": random.randint(10, 100),
-            "average_order_value": round(random.uniform(50, 200), 2),
-            "growth_rate": round(random.uniform(-0.1, 0.3), 2)
-        }
-        for x in range((end - start).days + 1)
-    ]
-    
+    series = await open_tenant_series(current_user.id)
+    performance = to_records(downsample(
+        sales_performance(series, start.date(), end.date()), "revenue", max_points
+    ))
+
     return {
         "performance": performance,
         "period": {
@@ -80,28 +112,16 @@ async def get_sales_performance(
 async def get_intent_query_trends(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    granularity: Literal["hour", "day", "week", "month"] = "day",
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get intent query trends data
+    Get intent query trends data, per hour, day, week or month
     """
     start, end = generate_date_range(start_date, end_date)
-    
-    # Sample intent categories
-    intent_categories = ["product deep dive", "product search", "product discovery", "question about store", "normal conversation"]
-    
-    trends = [
-        {
-            "date": (start + timedelta(days=x)).strftime("%Y-%m-%d"),
-            "intents": {
-                category: random.randint(10, 100)
-                for category in intent_categories
-            },
-            "total_queries": random.randint(50, 500)
-        }
-        for x in range((end - start).days + 1)
-    ]
-    
+    series = await open_tenant_series(current_user.id)
+    trends = intent_trends(series, start, end, granularity)
+
     return {
         "trends": trends,
         "period": {
@@ -110,76 +130,88 @@ async def get_intent_query_trends(
         }
     }
 
+@router.post("/intent")
+async def record_intent_queries_batch(
+    batch: IntentQueriesRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Record queries classified by intent; they are counted towards the intent
+    trends of the hour, day, week and month of each query
+    """
+    categories = [query.category.lower() for query in batch.queries]
+    unknown = sorted(set(categories) - set(INTENT_CATEGORIES))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown intent categories: {', '.join(unknown)}",
+        )
+    now = datetime.now()
+    # Buckets are in the server's local time, like the rest of the series
+    times = [
+        query.timestamp.astimezone().replace(tzinfo=None) if query.timestamp and query.timestamp.tzinfo
+        else query.timestamp or now
+        for query in batch.queries
+    ]
+    series = await open_tenant_series(current_user.id)
+    await run_in_threadpool(record_intent_queries, series, categories, times)
+
+    return {"recorded": len(batch.queries)}
+
 @router.get("/user-segmentation")
 async def get_user_segmentation(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get user segmentation data
-    """
-    # Sample user segments
-    segments = [
-        {
-            "name": "Power Users",
-            "count": random.randint(100, 1000),
-            "percentage": round(random.uniform(0.1, 0.3), 2),
-            "avg_session_duration": random.randint(10, 60),
-            "features_used": random.randint(5, 15)
-        },
-        {
-            "name": "Regular Users",
-            "count": random.randint(500, 2000),
-            "percentage": round(random.uniform(0.3, 0.5), 2),
-            "avg_session_duration": random.randint(5, 30),
-            "features_used": random.randint(3, 8)
-        },
-        {
-            "name": "Occasional Users",
-            "count": random.randint(200, 800),
-            "percentage": round(random.uniform(0.1, 0.2), 2),
-            "avg_session_duration": random.randint(1, 15),
-            "features_used": random.randint(1, 4)
-        },
-        {
-            "name": "New Users",
-            "count": random.randint(50, 300),
-            "percentage": round(random.uniform(0.05, 0.15), 2),
-            "avg_session_duration": random.randint(1, 10),
-            "features_used": random.randint(1, 3)
-        }
-    ]
-    
-    return {
-        "segments": segments,
-        "total_users": sum(segment["count"] for segment in segments)
-    }
+    Get user segmentation data, computed from the tenant's end-user sessions
+    """
+    return await run_in_threadpool(user_segments, current_user.id)
 
 @router.get("/system")
 async def get_system_performance(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    max_points: int = Query(settings.ANALYSIS_DEFAULT_MAX_POINTS, ge=3),
+    resolution: Literal["day", "minute"] = "day",
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get system performance data
+    Get system performance data: latency percentiles and error rate of the
+    tenant's API requests, CPU and memory use of the API processes, and
+    active/new users. `minute` resolution covers the last day as seen by
+    the worker answering the request, regardless of the date range.
     """
-    start, end = generate_date_range(start_date, end_date)
-    
-    # Generate sample system metrics
-    metrics = [
-        {
-            "date": (start + timedelta(days=x)).strftime("%Y-%m-%d"),
-            "response_time": round(random.uniform(100, 500), 2),
-            "error_rate": round(random.uniform(0.001, 0.05), 4),
-            "cpu_usage": round(random.uniform(20, 80), 2),
-            "memory_usage": round(random.uniform(30, 90), 2),
-            "active_users": random.randint(100, 1000)
+    if resolution == "minute":
+        metrics = to_records(downsample(
+            request_sampler.recent(current_user.id), "response_time", max_points
+        ))
+        return {
+            "metrics": metrics,
+            "period": {
+                "start": metrics[0]["date"] if metrics else None,
+                "end": metrics[-1]["date"] if metrics else None
+            }
         }
-        for x in range((end - start).days + 1)
-    ]
-    
+
+    start, end = generate_date_range(start_date, end_date)
+    series = await open_tenant_series(current_user.id)
+    columns = system_metrics(series, start.date(), end.date(), get_host_series())
+    # Per-day distinct users come from the HyperLogLog sketches, and the
+    # window totals from their union, so users active on several days count once
+    columns["active_users"], unique_active_users = await distinct_users(
+        db, current_user.id, ACTIVE, start.date(), end.date()
+    )
+    columns["new_users"], new_users = await distinct_users(
+        db, current_user.id, NEW, start.date(), end.date()
+    )
+    metrics = to_records(downsample(columns, "response_time", max_points))
+
     return {
         "metrics": metrics,
+        "latency": latency_summary(series, start.date(), end.date()),
+        "unique_active_users": unique_active_users,
+        "new_users": new_users,
         "period": {
             "start": start.isoformat(),
             "end": end.isoformat()
@@ -188,43 +220,97 @@ async def get_system_performance(
 
 @router.get("/mentions")
 async def get_most_mentioned_products(
-    limit: int = 10,
+    limit: int = Query(10, ge=1, le=settings.MENTIONS_SKETCH_SIZE),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get most mentioned products data
+    Get most mentioned products data, compared with the preceding period
+    of the same length
     """
     start, end = generate_date_range(start_date, end_date)
-    
-    # Sample product names
-    product_names = [
-        "iPhone 15 Pro", "MacBook Pro M3", "iPad Air", "Apple Watch Series 9",
-        "AirPods Pro", "Apple Vision Pro", "iMac 24-inch", "Mac Studio",
-        "Apple TV 4K", "HomePod mini", "Magic Keyboard", "Magic Mouse",
-        "AirTag", "Apple Pencil", "Studio Display"
-    ]
-    
-    # Generate sample mention data
-    products = [
-        {
-            "name": name,
-            "mentions": random.randint(50, 500),
-            "sentiment_score": round(random.uniform(-1, 1), 2),
-            "trend": random.choice(["up", "down", "stable"]),
-            "growth_rate": round(random.uniform(-0.2, 0.4), 2)
-        }
-        for name in product_names[:limit]
-    ]
-    
-    # Sort by mentions
-    products.sort(key=lambda x: x["mentions"], reverse=True)
-    
+    products = await run_in_threadpool(
+        top_mentions, current_user.id, start.date(), end.date(), limit
+    )
+
     return {
         "products": products,
         "period": {
             "start": start.isoformat(),
             "end": end.isoformat()
         }
-    } 
\ No newline at end of file
+    }
+
+def _extract_mentions(
+    matcher: ProductMatcher, tenant_id: int, queries: List[str], record: bool
+) -> List[List[str]]:
+    matches = matcher.match_batch(queries)
+    if record:
+        tracker = get_mention_tracker(tenant_id)
+        for names in matches:
+            for name in names:
+                tracker.record(name)
+    return matches
+
+@router.post("/mentions/extract")
+async def extract_product_mentions(
+    extract: MentionExtractRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Find the catalog products mentioned in a batch of queries and, unless
+    `record` is false, count them towards the most mentioned products
+    """
+    matcher = await get_product_matcher(db, current_user.id)
+    matches = await run_in_threadpool(
+        _extract_mentions, matcher, current_user.id, extract.queries, extract.record
+    )
+
+    return {
+        "matches": [
+            {"query": query, "products": products}
+            for query, products in zip(extract.queries, matches)
+        ],
+        "catalog_size": len(matcher)
+    }
+
+@router.post("/activity")
+async def record_user_activity(
+    activity: ActivityRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Record end users seen by the tenant's store; they are counted towards
+    the active and new users of the day of each event
+    """
+    by_day = {}
+    for event in activity.events:
+        day = (event.timestamp or datetime.now()).date()
+        by_day.setdefault(day, []).append(event.user_id)
+    for day, user_ids in by_day.items():
+        activity_recorder.record(current_user.id, user_ids, day)
+
+    return {"recorded": len(activity.events)}
+
+@router.post("/sessions")
+async def record_user_sessions(
+    batch: SessionsRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Record finished end-user sessions; they feed user segmentation and
+    count the users as active on the day each session started
+    """
+    by_day = {}
+    for session in batch.sessions:
+        day = (session.started_at or datetime.now()).date()
+        session_recorder.record(
+            current_user.id, session.user_id, session.duration_seconds, session.features, day
+        )
+        by_day.setdefault(day, []).append(session.user_id)
+    for day, user_ids in by_day.items():
+        activity_recorder.record(current_user.id, user_ids, day)
+
+    return {"recorded": len(batch.sessions)}
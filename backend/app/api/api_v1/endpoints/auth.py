@@ -2,7 +2,8 @@ from datetime import timedelta
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.user import UserLogin, UserCreate
 from app.schemas.token import Token
@@ -14,18 +15,28 @@ from app.models.user import User
 router = APIRouter()
 
 @router.post("/signin", response_model=Token)
-def signin(
+async def signin(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_in: UserLogin,
 ) -> Any:
-    user = db.query(User).filter(User.username == user_in.username).first()
-    if not user or not security.verify_password(user_in.password, user.hashed_password):
+    result = await db.execute(select(User).filter(User.username == user_in.username))
+    user = result.scalars().first()
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await security.verify_and_update_password(
+            user_in.password, user.hashed_password
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash uses outdated settings, upgrade it transparently
+        user.hashed_password = new_hash
+        await db.commit()
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     refresh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     
@@ -50,25 +61,27 @@ def signin(
     }
 
 @router.post("/signup", response_model=Token)
-def signup(
+async def signup(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_in: UserCreate,
 ) -> Any:
-    user = db.query(User).filter(User.username == user_in.username).first()
+    result = await db.execute(select(User).filter(User.username == user_in.username))
+    user = result.scalars().first()
     if user:
         raise HTTPException(
             status_code=400,
             detail="Username already registered",
         )
+    hashed_password = await security.get_password_hash_async(user_in.password)
     user = User(
         username=user_in.username,
         email=user_in.email,
-        hashed_password=security.get_password_hash(user_in.password),
+        hashed_password=hashed_password,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     refresh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     
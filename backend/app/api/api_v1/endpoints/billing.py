@@ -1,10 +1,14 @@
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_active_user, get_db
+from app.api.pagination import decode_cursor, encode_cursor, set_next_cursor
+from app.core.config import settings
 from app.models.billing import BillingPlan, BillingHistory, UserSubscription, UsageStats
 from app.models.user import User
 from app.schemas.billing import (
@@ -12,45 +16,80 @@ from app.schemas.billing import (
     BillingHistoryCreate, BillingHistoryResponse,
     UserSubscriptionCreate, UserSubscriptionResponse, UserSubscriptionUpdate,
     UsageStatsCreate, UsageStatsResponse, UsageStatsUpdate,
-    CurrentPlanResponse
+    CurrentPlanResponse, UserSubscriptionInDB, BillingHistoryInDB, UsageRollupResponse
 )
+from app.services.billing_cache import (
+    get_current_plan_snapshot, invalidate_current_plan, set_current_plan_snapshot
+)
+from app.services.billing_export import stream_billing_history
+from app.services.metering import usage_meter
+from app.services.plan_catalog import PlanCatalog, get_plan, get_plan_catalog, refresh_plan_catalog
+from app.services.quota import invalidate_quota
+from app.services.usage_rollups import get_daily_usage
 
 router = APIRouter()
 
 
+def _with_plan(row, in_db_schema, response_schema, catalog: PlanCatalog):
+    """Serialize a subscription/history row, taking its nested plan from the catalog."""
+    return response_schema(
+        **in_db_schema.model_validate(row).model_dump(),
+        plan=catalog.get(row.plan_id),
+    )
+
+
 @router.get("/plans", response_model=List[BillingPlanResponse])
-def get_billing_plans(
-    db: Session = Depends(get_db),
+async def get_billing_plans(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
 ):
     """
-    Retrieve all billing plans.
+    Retrieve all billing plans, ordered by id.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the
+    next page; `skip` is still honoured when no cursor is given.
     """
-    plans = db.query(BillingPlan).offset(skip).limit(limit).all()
+    catalog = await get_plan_catalog(db)
+    etag = catalog.etag(cursor or skip, limit)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    if cursor:
+        (after_id,) = decode_cursor(cursor, int)
+        plans = [plan for plan in catalog.plans if plan.id > after_id][:limit]
+    else:
+        plans = catalog.plans[skip:skip + limit]
+    
+    response.headers["ETag"] = etag
+    if len(plans) == limit:
+        set_next_cursor(response, encode_cursor(plans[-1].id))
     return plans
 
 
 @router.get("/plans/{plan_id}", response_model=BillingPlanResponse)
-def get_billing_plan(
+async def get_billing_plan(
     plan_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     Retrieve a specific billing plan by ID.
     """
-    plan = db.query(BillingPlan).filter(BillingPlan.id == plan_id).first()
+    plan = await get_plan(db, plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Billing plan not found")
     return plan
 
 
 @router.post("/plans", response_model=BillingPlanResponse)
-def create_billing_plan(
+async def create_billing_plan(
     plan_in: BillingPlanCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -58,91 +97,119 @@ def create_billing_plan(
     """
     plan = BillingPlan(**plan_in.dict())
     db.add(plan)
-    db.commit()
-    db.refresh(plan)
-    return plan
+    await db.commit()
+    catalog = await refresh_plan_catalog(db)
+    return catalog.get(plan.id)
 
 
 @router.put("/plans/{plan_id}", response_model=BillingPlanResponse)
-def update_billing_plan(
+async def update_billing_plan(
     plan_id: int,
     plan_in: BillingPlanUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     Update a billing plan.
     """
-    plan = db.query(BillingPlan).filter(BillingPlan.id == plan_id).first()
+    plan = await db.get(BillingPlan, plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Billing plan not found")
     
     for field, value in plan_in.dict(exclude_unset=True).items():
         setattr(plan, field, value)
     
-    db.commit()
-    db.refresh(plan)
-    return plan
+    await db.commit()
+    catalog = await refresh_plan_catalog(db)
+    return catalog.get(plan.id)
 
 
 @router.get("/current-plan", response_model=CurrentPlanResponse)
-def get_current_plan(
-    db: Session = Depends(get_db),
+async def get_current_plan(
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     Get the current user's subscription plan, subscription details, and usage stats.
     """
-    subscription = db.query(UserSubscription).filter(
-        UserSubscription.user_id == current_user.id,
-        UserSubscription.status == "active"
-    ).first()
-    
-    if not subscription:
-        raise HTTPException(status_code=404, detail="No active subscription found")
+    catalog = await get_plan_catalog(db)
+    snapshot = get_current_plan_snapshot(current_user.id)
+    if snapshot is None:
+        # Subscription and usage stats in one round trip; the plan comes from the catalog
+        result = await db.execute(
+            select(UserSubscription, UsageStats)
+            .outerjoin(UsageStats, UsageStats.user_id == UserSubscription.user_id)
+            .filter(
+                UserSubscription.user_id == current_user.id,
+                UserSubscription.status == "active"
+            )
+        )
+        row = result.first()
+        
+        if not row:
+            raise HTTPException(status_code=404, detail="No active subscription found")
+        
+        subscription, usage_stats = row
+        if not usage_stats:
+            raise HTTPException(status_code=404, detail="Usage stats not found")
+        
+        snapshot = (
+            UserSubscriptionInDB.model_validate(subscription),
+            UsageStatsResponse.model_validate(usage_stats),
+        )
+        set_current_plan_snapshot(current_user.id, *snapshot)
+        api_calls_used = usage_stats.api_calls_used
+    else:
+        # The snapshot holds the plan and limits; the call count moves with
+        # every request, so it is read on its own
+        api_calls_used = await db.scalar(
+            select(UsageStats.api_calls_used).filter(UsageStats.user_id == current_user.id)
+        )
     
-    plan = db.query(BillingPlan).filter(BillingPlan.id == subscription.plan_id).first()
+    subscription, usage_stats = snapshot
+    usage_stats = usage_stats.model_copy(update={
+        "api_calls_used": (api_calls_used or 0) + usage_meter.pending_calls(current_user.id)
+    })
+    plan = catalog.get(subscription.plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Billing plan not found")
     
-    usage_stats = db.query(UsageStats).filter(
-        UsageStats.user_id == current_user.id
-    ).first()
-    
-    if not usage_stats:
-        raise HTTPException(status_code=404, detail="Usage stats not found")
-    
     return {
         "plan": plan,
-        "subscription": subscription,
+        "subscription": _with_plan(
+            subscription, UserSubscriptionInDB, UserSubscriptionResponse, catalog
+        ),
         "usage_stats": usage_stats
     }
 
 
 @router.post("/subscribe/{plan_id}", response_model=UserSubscriptionResponse)
-def subscribe_to_plan(
+async def subscribe_to_plan(
     plan_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     Subscribe to a billing plan.
     """
-    plan = db.query(BillingPlan).filter(BillingPlan.id == plan_id).first()
+    plan = await get_plan(db, plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Billing plan not found")
     
     # Check if user already has an active subscription
-    existing_subscription = db.query(UserSubscription).filter(
-        UserSubscription.user_id == current_user.id,
-        UserSubscription.status == "active"
-    ).first()
+    result = await db.execute(
+        select(UserSubscription).filter(
+            UserSubscription.user_id == current_user.id,
+            UserSubscription.status == "active"
+        )
+    )
+    existing_subscription = result.scalars().first()
     
     if existing_subscription:
         # Update existing subscription
         existing_subscription.status = "canceled"
         existing_subscription.end_date = datetime.utcnow()
-        db.commit()
+        await db.commit()
     
     # Create new subscription
     start_date = datetime.utcnow()
@@ -157,13 +224,14 @@ def subscribe_to_plan(
     )
     
     db.add(subscription)
-    db.commit()
-    db.refresh(subscription)
+    await db.commit()
+    await db.refresh(subscription)
     
     # Create or update usage stats
-    usage_stats = db.query(UsageStats).filter(
-        UsageStats.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(UsageStats).filter(UsageStats.user_id == current_user.id)
+    )
+    usage_stats = result.scalars().first()
     
     if not usage_stats:
         usage_stats = UsageStats(
@@ -179,32 +247,84 @@ def subscribe_to_plan(
         usage_stats.storage_limit = 100
         usage_stats.team_members_limit = 10
     
-    db.commit()
+    await db.commit()
+    invalidate_current_plan(current_user.id)
+    invalidate_quota(current_user.id)
     
-    return subscription
+    catalog = await get_plan_catalog(db)
+    return _with_plan(subscription, UserSubscriptionInDB, UserSubscriptionResponse, catalog)
 
 
 @router.get("/history", response_model=List[BillingHistoryResponse])
-def get_billing_history(
-    db: Session = Depends(get_db),
+async def get_billing_history(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
 ):
     """
-    Get the user's billing history.
+    Get the user's billing history, newest payment first.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the
+    next page in constant time; `skip` is still honoured when no cursor is
+    given.
     """
-    history = db.query(BillingHistory).filter(
-        BillingHistory.user_id == current_user.id
-    ).offset(skip).limit(limit).all()
+    query = (
+        select(BillingHistory)
+        .filter(BillingHistory.user_id == current_user.id)
+        .order_by(BillingHistory.payment_date.desc(), BillingHistory.id.desc())
+    )
+    if cursor:
+        payment_date, history_id = decode_cursor(cursor, datetime.fromisoformat, int)
+        query = query.filter(
+            tuple_(BillingHistory.payment_date, BillingHistory.id)
+            < tuple_(payment_date, history_id)
+        )
+    else:
+        query = query.offset(skip)
+    
+    result = await db.execute(query.limit(limit))
+    history = result.scalars().all()
+    if len(history) == limit:
+        last = history[-1]
+        set_next_cursor(response, encode_cursor(last.payment_date.isoformat(), last.id))
     
-    return history
+    catalog = await get_plan_catalog(db)
+    return [
+        _with_plan(entry, BillingHistoryInDB, BillingHistoryResponse, catalog)
+        for entry in history
+    ]
+
+
+@router.get("/history/export")
+async def export_billing_history(
+    db: AsyncSession = Depends(get_db),
+    format: Literal["ndjson", "csv"] = "ndjson",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Stream the user's full billing history as NDJSON or CSV, oldest first.
+    Rows are fetched and written in batches, so exports of any size run in
+    constant memory.
+    """
+    catalog = await get_plan_catalog(db)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"billing-history.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        stream_billing_history(current_user.id, catalog, format, start_date, end_date),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.post("/history", response_model=BillingHistoryResponse)
-def create_billing_history(
+async def create_billing_history(
     history_in: BillingHistoryCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
@@ -212,22 +332,24 @@ def create_billing_history(
     """
     history = BillingHistory(**history_in.dict())
     db.add(history)
-    db.commit()
-    db.refresh(history)
-    return history
+    await db.commit()
+    await db.refresh(history)
+    catalog = await get_plan_catalog(db)
+    return _with_plan(history, BillingHistoryInDB, BillingHistoryResponse, catalog)
 
 
 @router.get("/usage", response_model=UsageStatsResponse)
-def get_usage_stats(
-    db: Session = Depends(get_db),
+async def get_usage_stats(
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     Get the user's usage statistics.
     """
-    usage_stats = db.query(UsageStats).filter(
-        UsageStats.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(UsageStats).filter(UsageStats.user_id == current_user.id)
+    )
+    usage_stats = result.scalars().first()
     
     if not usage_stats:
         raise HTTPException(status_code=404, detail="Usage stats not found")
@@ -235,18 +357,34 @@ def get_usage_stats(
     return usage_stats
 
 
+@router.get("/usage/history", response_model=List[UsageRollupResponse])
+async def get_usage_history(
+    db: AsyncSession = Depends(get_db),
+    days: int = Query(90, ge=1, le=settings.USAGE_DAILY_RETENTION_DAYS),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get the user's daily usage (API calls, storage, team members) for the
+    last `days` days, read from the pre-aggregated daily rollups.
+    """
+    return await get_daily_usage(
+        db, current_user.id, days, pending_calls=usage_meter.pending_calls(current_user.id)
+    )
+
+
 @router.put("/usage", response_model=UsageStatsResponse)
-def update_usage_stats(
+async def update_usage_stats(
     usage_in: UsageStatsUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
     """
     Update the user's usage statistics.
     """
-    usage_stats = db.query(UsageStats).filter(
-        UsageStats.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(UsageStats).filter(UsageStats.user_id == current_user.id)
+    )
+    usage_stats = result.scalars().first()
     
     if not usage_stats:
         raise HTTPException(status_code=404, detail="Usage stats not found")
@@ -254,6 +392,8 @@ def update_usage_stats(
     for field, value in usage_in.dict(exclude_unset=True).items():
         setattr(usage_stats, field, value)
     
-    db.commit()
-    db.refresh(usage_stats)
+    await db.commit()
+    await db.refresh(usage_stats)
+    invalidate_current_plan(current_user.id)
+    invalidate_quota(current_user.id)
     return usage_stats 
\ No newline at end of file
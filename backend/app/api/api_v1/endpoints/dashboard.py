@@ -1,49 +1,58 @@
-from fastapi import APIRouter, Depends
-from typing import List, Dict, Any, Optional
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Literal, Optional
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_db
+from app.services.activity import NEW, distinct_users
+from app.services.timeseries import INTENT_CATEGORIES, get_tenant_series, intent_counts
 
 router = APIRouter()
 
+def format_count(value: int) -> str:
+    """Short form used by the dashboard cards, e.g. 714k or 1.35m."""
+    for threshold, suffix in ((1_000_000, "m"), (1_000, "k")):
+        if value >= threshold:
+            return f"{value / threshold:.3g}{suffix}"
+    return str(value)
+
 @router.get("/stats", response_model=Dict[str, Any])
-def get_dashboard_stats(current_user: Any = Depends(get_current_user)):
+async def get_dashboard_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: Any = Depends(get_current_user),
+):
     """
     Get dashboard statistics for the workbench page.
     """
+    today = date.today()
+    _, new_users = await distinct_users(db, current_user.id, NEW, today - timedelta(days=6), today)
     return {
         "weekly_sales": "714k",
-        "new_users": "1.35m",
+        "new_users": format_count(new_users),
         "new_orders": "1.72m",
         "bug_reports": "234"
     }
 
 @router.get("/intent-usage-area", response_model=Dict[str, Any])
-def get_intent_usage_area(current_user: Any = Depends(get_current_user)):
+def get_intent_usage_area(
+    year: Optional[int] = Query(None, ge=1970, le=9999),
+    granularity: Literal["hour", "day", "week", "month"] = "month",
+    current_user: Any = Depends(get_current_user),
+):
     """
-    Get intent usage area chart data.
+    Get intent usage area chart data for one year, per month by default.
     """
+    year = year or datetime.now().year
+    _, counts = intent_counts(
+        get_tenant_series(current_user.id),
+        datetime(year, 1, 1),
+        datetime(year, 12, 31, 23),
+        granularity,
+    )
     return {
-        "2022": [
-            {
-                "name": "Product Deep Dive",
-                "data": [450, 520, 580, 620, 680, 750, 820, 890, 950, 1020, 1080, 1150],
-            },
-            {
-                "name": "Product Search",
-                "data": [320, 380, 420, 480, 540, 600, 660, 720, 780, 840, 900, 960],
-            },
-            {
-                "name": "Product Discovery",
-                "data": [280, 340, 400, 460, 520, 580, 640, 700, 760, 820, 880, 940],
-            },
-            {
-                "name": "Question About Store",
-                "data": [150, 180, 210, 240, 270, 300, 330, 360, 390, 420, 450, 480],
-            },
-            {
-                "name": "Normal Conversation",
-                "data": [200, 240, 280, 320, 360, 400, 440, 480, 520, 560, 600, 640],
-            },
+        str(year): [
+            {"name": category.title(), "data": row}
+            for category, row in zip(INTENT_CATEGORIES, counts.tolist())
         ]
     }
 
@@ -1,19 +1,32 @@
-from typing import Any, List
+from typing import Any, List, Optional
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import schemas
+from app.api.pagination import decode_cursor, encode_cursor, set_next_cursor
 from app.db.database import get_db
 from app.models.organization import Organization
 
 router = APIRouter()
 
 @router.get("/", response_model=List[schemas.Organization])
-def get_organizations(
-    db: Session = Depends(get_db),
+async def get_organizations(
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
 ) -> Any:
-    organizations = db.query(Organization).offset(skip).limit(limit).all()
-    return organizations 
\ No newline at end of file
+    query = select(Organization).order_by(Organization.id)
+    if cursor:
+        (after_id,) = decode_cursor(cursor, int)
+        query = query.filter(Organization.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query.limit(limit))
+    organizations = result.scalars().all()
+    if len(organizations) == limit:
+        set_next_cursor(response, encode_cursor(organizations[-1].id))
+    return organizations
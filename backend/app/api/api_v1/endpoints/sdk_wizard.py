@@ -1,16 +1,20 @@
 from typing import Any, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-import requests
-from bs4 import BeautifulSoup
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import json
 from pydantic import BaseModel
 
-from app.db.database import get_db
+from app.api.deps import get_current_user, get_db, invalidate_user
 from app.models.sdk_wizard import SdkWizardData
 from app.models.user import User
 from app.schemas.sdk_wizard import SdkWizardDataCreate, SdkWizardDataUpdate, SdkWizardDataInDB
-from app.core.security import get_current_user
+from app.services.catalog import CATALOG_EXTRACTION
+from app.services.jobs import get_job, job_runner, stream_job
+from app.services.product_matcher import refresh_product_matcher
+from app.services.store_validation import validate_store
 
 router = APIRouter()
 
@@ -29,85 +33,56 @@ class SdkDashboardResponse(BaseModel):
     recent_activities: list
 
 @router.post("/validate-connection", response_model=dict)
-def validate_connection(
+async def validate_connection(
     *,
     validation_data: ConnectionValidationRequest,
+    refresh: bool = False,
     current_user: User = Depends(get_current_user)
 ) -> Any:
     """
     Validate the connection to the e-commerce platform without creating SDK wizard data.
+
+    Results are reused for a few minutes (failures for seconds) per store
+    and credentials; pass `refresh=true` to check the store again.
     """
-    try:
-        if validation_data.platform.lower() == "shopify":
-            # Try to access the store URL
-            response = requests.get(validation_data.store_url, timeout=10)
-            
-            # Check if the response is successful and contains HTML
-            if response.status_code == 200 and 'text/html' in response.headers.get('content-type', ''):
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Look for Shopify-specific elements
-                shopify_elements = soup.find_all('script', {'src': lambda x: x and 'shopify' in x.lower()})
-                if shopify_elements:
-                    return {
-                        "success": True,
-                        "message": "Successfully connected to Shopify store"
-                    }
-                else:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="The provided URL does not appear to be a Shopify store"
-                    )
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Could not access the store URL"
-                )
-                
-        elif validation_data.platform.lower() == "woocommerce":
-            # Validate WooCommerce credentials
-            if not validation_data.woo_commerce_secret_key or not validation_data.woo_commerce_client_key:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="WooCommerce API keys are required"
-                )
-                
-            # Try to access WooCommerce API
-            woo_api_url = f"{validation_data.store_url.rstrip('/')}/wp-json/wc/v3/products"
-            auth = (validation_data.woo_commerce_client_key, validation_data.woo_commerce_secret_key)
-            
-            response = requests.get(woo_api_url, auth=auth, timeout=10)
-            if response.status_code == 200:
-                return {
-                    "success": True,
-                    "message": "Successfully connected to WooCommerce store"
-                }
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Invalid WooCommerce credentials or API access"
-                )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Platform {validation_data.platform} is not supported yet"
-            )
-            
-    except requests.exceptions.RequestException as e:
+    platform = validation_data.platform.lower()
+    if platform not in ("shopify", "woocommerce"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Platform {validation_data.platform} is not supported yet"
+        )
+    if platform == "woocommerce" and (
+        not validation_data.woo_commerce_secret_key or not validation_data.woo_commerce_client_key
+    ):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Connection failed: {str(e)}"
+            detail="WooCommerce API keys are required"
+        )
+
+    try:
+        result = await validate_store(
+            platform,
+            validation_data.store_url,
+            validation_data.woo_commerce_client_key,
+            validation_data.woo_commerce_secret_key,
+            refresh=refresh,
         )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Validation failed: {str(e)}"
         )
+    if not result.success:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result.message)
+    return {
+        "success": True,
+        "message": result.message
+    }
 
 @router.post("/data", response_model=SdkWizardDataInDB)
-def create_sdk_wizard_data(
+async def create_sdk_wizard_data(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     sdk_wizard_data_in: SdkWizardDataCreate,
     current_user: User = Depends(get_current_user)
 ) -> Any:
@@ -115,7 +90,8 @@ def create_sdk_wizard_data(
     Create new SDK wizard data for the current user.
     """
     # Check if user already has SDK wizard data
-    existing_data = db.query(SdkWizardData).filter(SdkWizardData.user_id == current_user.id).first()
+    result = await db.execute(select(SdkWizardData).filter(SdkWizardData.user_id == current_user.id))
+    existing_data = result.scalars().first()
     if existing_data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -128,20 +104,22 @@ def create_sdk_wizard_data(
         user_id=current_user.id
     )
     db.add(sdk_wizard_data)
-    db.commit()
-    db.refresh(sdk_wizard_data)
+    await db.commit()
+    await db.refresh(sdk_wizard_data)
+    await refresh_product_matcher(db, current_user.id)
     
     return sdk_wizard_data
 
 @router.get("/data", response_model=SdkWizardDataInDB)
-def get_sdk_wizard_data(
-    db: Session = Depends(get_db),
+async def get_sdk_wizard_data(
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ) -> Any:
     """
     Get SDK wizard data for the current user.
     """
-    sdk_wizard_data = db.query(SdkWizardData).filter(SdkWizardData.user_id == current_user.id).first()
+    result = await db.execute(select(SdkWizardData).filter(SdkWizardData.user_id == current_user.id))
+    sdk_wizard_data = result.scalars().first()
     if not sdk_wizard_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -150,16 +128,17 @@ def get_sdk_wizard_data(
     return sdk_wizard_data
 
 @router.put("/data", response_model=SdkWizardDataInDB)
-def update_sdk_wizard_data(
+async def update_sdk_wizard_data(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     sdk_wizard_data_in: SdkWizardDataUpdate,
     current_user: User = Depends(get_current_user)
 ) -> Any:
     """
     Update SDK wizard data for the current user.
     """
-    sdk_wizard_data = db.query(SdkWizardData).filter(SdkWizardData.user_id == current_user.id).first()
+    result = await db.execute(select(SdkWizardData).filter(SdkWizardData.user_id == current_user.id))
+    sdk_wizard_data = result.scalars().first()
     if not sdk_wizard_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -170,21 +149,23 @@ def update_sdk_wizard_data(
     for field, value in sdk_wizard_data_in.model_dump(exclude_unset=True).items():
         setattr(sdk_wizard_data, field, value)
     
-    db.commit()
-    db.refresh(sdk_wizard_data)
+    await db.commit()
+    await db.refresh(sdk_wizard_data)
+    await refresh_product_matcher(db, current_user.id)
     
     return sdk_wizard_data
 
 @router.post("/complete", response_model=dict)
-def complete_sdk_wizard(
-    db: Session = Depends(get_db),
+async def complete_sdk_wizard(
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ) -> Any:
     """
     Mark the SDK wizard as complete for the current user and trigger the Airflow DAG.
     """
     # Get the SDK wizard data
-    sdk_wizard_data = db.query(SdkWizardData).filter(SdkWizardData.user_id == current_user.id).first()
+    result = await db.execute(select(SdkWizardData).filter(SdkWizardData.user_id == current_user.id))
+    sdk_wizard_data = result.scalars().first()
     if not sdk_wizard_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -192,8 +173,11 @@ def complete_sdk_wizard(
         )
     
     # Update user's has_submitted_website flag
-    current_user.has_submitted_website = True
-    db.commit()
+    await db.execute(
+        update(User).where(User.id == current_user.id).values(has_submitted_website=True)
+    )
+    await db.commit()
+    invalidate_user(current_user.username)
     
     # Prepare data for Airflow DAG
     dag_data = {
@@ -212,87 +196,93 @@ def complete_sdk_wizard(
     # Trigger the Airflow DAG
     from app.services.airflow_trigger import trigger_sdk_wizard_workflow
     try:
-        trigger_sdk_wizard_workflow(dag_data)
+        await run_in_threadpool(trigger_sdk_wizard_workflow, dag_data)
     except Exception as e:
         # Log the error but don't fail the request
         print(f"Error triggering Airflow DAG: {str(e)}")
     
     return {"message": "SDK wizard completed successfully"}
 
-@router.post("/extract-data", response_model=dict)
-def extract_platform_data(
+@router.post("/extract-data", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+async def extract_platform_data(
     *,
     extract_data: ExtractDataRequest,
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ) -> Any:
     """
-    Extract data from the platform's products.json endpoint for Shopify stores.
+    Queue extraction of the whole catalog from the platform's products.json
+    endpoint for Shopify stores. Returns the job straight away; poll
+    GET /extract-data/{job_id} or follow GET /extract-data/{job_id}/events.
+    While a job is queued or running, submitting again returns that job.
     """
-    try:
-        if extract_data.platform.lower() == "shopify":
-            # Construct the products.json URL using the store_url from the request
-            store_url = extract_data.store_url.rstrip('/')
-            products_url = f"{store_url}/products.json"
-            print(f"Fetching products from: {products_url}")
-            
-            # Fetch products from the Shopify store
-            response = requests.get(products_url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Failed to fetch products from Shopify store: {response.status_code}"
-                )
-            
-            # Parse the response
-            data = response.json()
-            products = data.get('products', [])
-            
-            if not products:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="No products found in the Shopify store"
-                )
-
-            # Get only the first product
-            first_product = products[0] if products else None
-            
-            # Update the SDK wizard data with extracted fields if it exists
-            sdk_wizard_data = db.query(SdkWizardData).filter(SdkWizardData.user_id == current_user.id).first()
-            if sdk_wizard_data and first_product:
-                # Use the first product as a template for fields
-                sdk_wizard_data.fields = [first_product]  # Store as a list
-                sdk_wizard_data.is_data_extracted = True
-                db.commit()
+    if extract_data.platform.lower() != "shopify":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Platform {extract_data.platform} is not supported yet"
+        )
+    job = await job_runner.submit(
+        current_user.id, CATALOG_EXTRACTION, {"store_url": extract_data.store_url}
+    )
+    return {
+        "success": True,
+        "job_id": job["id"],
+        "job": job,
+        "message": "Product data extraction queued"
+    }
 
-            return {
-                "success": True,
-                "data": [first_product] if first_product else [],  # Return only the first product in an array
-                "message": "Successfully extracted product data"
-            }
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Platform {extract_data.platform} is not supported yet"
-            )
+@router.get("/extract-data/{job_id}", response_model=dict)
+async def get_extraction_job(
+    *,
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Status of an extraction job: progress while it runs, then its result
+    (totals and the first product) or its error.
+    """
+    job = await get_job(db, job_id, current_user.id, CATALOG_EXTRACTION)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Extraction job not found"
+        )
+    return job
 
-    except Exception as e:
+@router.get("/extract-data/{job_id}/events")
+async def stream_extraction_job(
+    *,
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Server-sent events for an extraction job: `progress` events as it runs
+    and a final `done` event carrying the finished job.
+    """
+    if await get_job(db, job_id, current_user.id, CATALOG_EXTRACTION) is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to extract data: {str(e)}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Extraction job not found"
         )
+    return StreamingResponse(
+        stream_job(job_id, current_user.id, CATALOG_EXTRACTION),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/dashboard", response_model=SdkDashboardResponse)
-def get_sdk_dashboard(
+async def get_sdk_dashboard(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ) -> Any:
     """
     Get SDK management dashboard data including statistics and recent activities.
     """
     # Get SDK data for the current user
-    sdk_data = db.query(SdkWizardData).filter(SdkWizardData.user_id == current_user.id).first()
+    result = await db.execute(select(SdkWizardData).filter(SdkWizardData.user_id == current_user.id))
+    sdk_data = result.scalars().first()
     
     # If no SDK data exists, return default values
     if not sdk_data:
@@ -1,20 +1,22 @@
 from typing import Any, List
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import schemas
-from app.db.database import get_db
+from app.api.deps import get_db, invalidate_user
 from app.models.user import User
 
 router = APIRouter()
 
 @router.get("/{user_id}", response_model=schemas.User)
-def get_user(
+async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> Any:
-    user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).filter(User.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=404,
@@ -23,11 +25,12 @@ def get_user(
     return user
 
 @router.put("/{user_id}/website-submission", response_model=schemas.User)
-def update_website_submission(
+async def update_website_submission(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> Any:
-    user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).filter(User.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=404,
@@ -35,6 +38,7 @@ def update_website_submission(
         )
     
     user.has_submitted_website = True
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    invalidate_user(user.username)
     return user 
\ No newline at end of file
@@ -1,32 +1,47 @@
-from typing import Generator
+import hashlib
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.middleware import METERED_USER_KEY
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.db.database import SessionLocal
+from app.db.database import get_db
 from app.models.user import User
+from app.services.quota import check_quota
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/signin")
 
-def get_db() -> Generator:
-    try:
-        db = SessionLocal()
-        yield db
-    finally:
-        db.close()
+# Already-verified tokens (sha256 digest -> subject), each evicted at its `exp`
+token_cache = TTLCache(
+    maxsize=settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+# Authenticated users keyed by token subject. Cached instances are detached
+# from any session, so treat them as read-only and write through `db` instead.
+user_cache = TTLCache(
+    maxsize=settings.AUTH_USER_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL
+)
 
-async def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
-) -> User:
+
+def invalidate_user(username: str) -> None:
+    """Drop a cached principal; call this whenever the user row changes."""
+    user_cache.pop(username)
+
+
+def decode_token_subject(token: str) -> str:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    digest = hashlib.sha256(token.encode()).digest()
+    username = token_cache.get(digest)
+    if username is not None:
+        return username
+
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -36,11 +51,32 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+
+    token_cache.set(digest, username, expires_at=payload.get("exp"))
+    return username
+
+async def get_current_user(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+) -> User:
+    username = decode_token_subject(token)
+    user = user_cache.get(username)
+    if user is not None:
+        setattr(request.state, METERED_USER_KEY, user.id)
+        return user
+
+    result = await db.execute(select(User).filter(User.username == username))
+    user = result.scalars().first()
     if user is None:
-        raise credentials_exception
-    
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    user_cache.set(username, user)
+    setattr(request.state, METERED_USER_KEY, user.id)
     return user
 
 async def get_current_active_user(
@@ -48,4 +84,39 @@ async def get_current_active_user(
 ) -> User:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user 
\ No newline at end of file
+    return current_user
+
+
+async def enforce_api_quota(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> None:
+    """
+    Charge the call against the user's API quota, answering 429 once it is
+    spent. Remaining quota is reported in X-RateLimit-* headers.
+    """
+    if not settings.QUOTA_ENABLED:
+        return
+    decision = await check_quota(db, current_user.id)
+    if decision.limit is None:
+        return
+    headers = {
+        "X-RateLimit-Limit": str(decision.limit),
+        "X-RateLimit-Remaining": str(decision.remaining),
+    }
+    if decision.metered:
+        # check_quota has already counted this call
+        setattr(request.state, METERED_USER_KEY, None)
+    if not decision.allowed:
+        # Rejected calls are not metered as used
+        setattr(request.state, METERED_USER_KEY, None)
+        if decision.retry_after is not None:
+            headers["Retry-After"] = str(decision.retry_after)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="API call quota exceeded",
+            headers=headers,
+        )
+    response.headers.update(headers)
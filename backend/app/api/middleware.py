@@ -0,0 +1,66 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metering import UsageMeter
+from app.services.request_metrics import RequestSampler
+
+# Set on `request.state` by the auth dependency once a caller is authenticated
+METERED_USER_KEY = "metered_user_id"
+
+
+class UsageMeteringMiddleware:
+    """
+    Count every authenticated API call against its user. The auth dependency
+    records who the caller is; after the response this only bumps an
+    in-memory counter, and the meter writes the totals back in batches.
+    """
+
+    def __init__(self, app: ASGIApp, meter: UsageMeter):
+        self.app = app
+        self.meter = meter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            user_id = scope.get("state", {}).get(METERED_USER_KEY)
+            if user_id is not None:
+                self.meter.record(user_id)
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every HTTP request and note its status for the request sampler.
+    Latency runs until the response has been sent; a request that fails
+    before starting its response counts as a 500.
+    """
+
+    def __init__(self, app: ASGIApp, sampler: RequestSampler):
+        self.app = app
+        self.sampler = sampler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.sampler.record(
+                scope.get("state", {}).get(METERED_USER_KEY),
+                (time.perf_counter() - started) * 1000,
+                status,
+            )
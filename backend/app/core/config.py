@@ -8,6 +8,12 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-here"  # Change this in production
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30  # 30 days
+    AUTH_TOKEN_CACHE_SIZE: int = 10000  # verified JWTs kept until their exp
+    AUTH_USER_CACHE_SIZE: int = 10000  # authenticated users kept in memory
+    AUTH_USER_CACHE_TTL: int = 60  # seconds; bounds staleness across workers
+    PASSWORD_HASH_WORKERS: int = 2  # bcrypt processes per API worker
+    PASSWORD_HASH_MAX_PENDING: int = 32  # queued + running hashes before 503
+    PASSWORD_HASH_RETRY_AFTER: int = 1  # seconds, sent with the 503
     BACKEND_CORS_ORIGINS: List[str] = [
         "http://localhost:3001",
         "http://localhost:3000",
@@ -16,6 +22,108 @@ class Settings(BaseSettings):
     ]
     ALGORITHM: str = "HS256"  # Adding the missing ALGORITHM setting
 
+    # Database settings
+    DATABASE_URL: str = "sqlite:///./app.db"
+    DATABASE_READ_URL: Optional[str] = None  # Optional read-only engine for GET requests
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30  # seconds
+    DB_POOL_RECYCLE: int = 1800  # seconds
+    SQLITE_BUSY_TIMEOUT: int = 5000  # milliseconds
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # bytes
+    SQLITE_CACHE_SIZE: int = -64000  # negative means KiB, so 64 MB per connection
+
+    # Billing plan catalog cache; writes refresh it in-process, the TTL
+    # bounds how long other workers can serve a stale catalog
+    PLAN_CATALOG_TTL: int = 300  # seconds
+    PLAN_CATALOG_MISS_RELOAD_INTERVAL: int = 5  # seconds; unknown plan ids reload the catalog at most this often
+    CURRENT_PLAN_CACHE_SIZE: int = 10000  # users whose /billing/current-plan is cached
+    CURRENT_PLAN_CACHE_TTL: int = 30  # seconds
+
+    # API call metering; calls are counted in memory and written back in batches
+    METERING_SHARDS: int = 16  # lock stripes for the in-memory counters
+    METERING_FLUSH_INTERVAL: float = 5.0  # seconds between write-backs
+    METERING_FLUSH_BATCH_SIZE: int = 500  # users per UPDATE batch
+    METERING_MAX_PENDING_USERS: int = 10000  # flush early once this many users are buffered
+
+    # Usage rollups; hourly rows are folded into daily ones, then expired
+    USAGE_COMPACTION_INTERVAL: int = 3600  # seconds between compaction passes
+    USAGE_HOURLY_RETENTION_DAYS: int = 7
+    USAGE_DAILY_RETENTION_DAYS: int = 400
+
+    # Per-tenant daily analytics in memory-mapped column files
+    TIMESERIES_DIR: Optional[str] = None  # defaults to <sqlite db>.timeseries/
+    TIMESERIES_OPEN_TENANTS: int = 1000  # tenants kept open per worker
+    TIMESERIES_OPEN_FILES: Optional[int] = None  # files kept mapped per worker; defaults to 1/4 of the fd limit
+    # Seed a tenant's analytics with random demo history the first time it is
+    # opened. For demo installs only: the demo values are stored like real ones
+    ANALYTICS_DEMO_DATA: bool = False
+    TIMESERIES_DEMO_DAYS: int = 365  # days of demo history, with ANALYTICS_DEMO_DATA
+    MENTIONS_SKETCH_SIZE: int = 1000  # products tracked per tenant per day
+    MENTIONS_CACHED_SKETCHES: int = 2000  # day/month sketches kept loaded per tenant
+    MENTIONS_CHECKPOINT_INTERVAL: int = 30  # seconds
+    MENTIONS_EXTRACT_MAX_QUERIES: int = 5000  # queries per /analysis/mentions/extract call
+    PRODUCT_MATCHER_CACHE_SIZE: int = 1000  # tenants whose product matchers stay built
+    PRODUCT_MATCHER_TTL: int = 60  # seconds before a worker re-reads the catalog
+    INTENT_MAX_QUERIES: int = 5000  # queries per /analysis/intent call
+    ANALYSIS_MAX_RANGE_DAYS: int = 5 * 366  # longest start_date..end_date accepted
+    ANALYSIS_DEFAULT_MAX_POINTS: int = 500  # points per series before downsampling
+
+    # Distinct end users per tenant per day, as HyperLogLog sketches in SQLite
+    HLL_PRECISION: int = 14  # 2**14 registers: 16 KiB per sketch, ~0.81% standard error
+    ACTIVITY_FLUSH_INTERVAL: float = 10.0  # seconds between sketch write-backs
+    ACTIVITY_MAX_PENDING: int = 100000  # buffered user ids before flushing early
+    ACTIVITY_MAX_EVENTS: int = 5000  # events per /analysis/activity call
+
+    # Request latency/status and process CPU/RSS behind /analysis/system
+    SYSTEM_METRICS_RING_SIZE: int = 65536  # request samples buffered between folds
+    SYSTEM_METRICS_INTERVAL: float = 5.0  # seconds between folds and process samples
+    SYSTEM_METRICS_MINUTES: int = 1440  # per-minute aggregates kept in memory
+    SYSTEM_METRICS_TENANTS: int = 1000  # tenants whose per-minute aggregates are kept
+
+    # User segmentation from per-end-user session aggregates
+    SEGMENTATION_FLUSH_INTERVAL: float = 30.0  # seconds between applying buffered sessions
+    SEGMENTATION_CHUNK_ROWS: int = 1_000_000  # rows held in memory when re-segmenting everyone
+    SEGMENTATION_NEW_USER_DAYS: int = 7  # users first seen this recently are "new"
+    SEGMENTATION_MAX_SESSIONS: int = 5000  # sessions per /analysis/sessions call
+    SEGMENTATION_DEMO_USERS: int = 20000  # demo end users, with ANALYTICS_DEMO_DATA
+
+    # Outbound HTTP to customer stores, over one pooled client per worker
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100
+    HTTP_CLIENT_MAX_KEEPALIVE: int = 20  # idle connections kept open for reuse
+    HTTP_CLIENT_MAX_PER_HOST: int = 6  # concurrent requests to one store
+    HTTP_CLIENT_KEEPALIVE_EXPIRY: float = 30.0  # seconds an idle connection is kept
+    HTTP_CLIENT_CONNECT_TIMEOUT: float = 5.0  # seconds; also the wait for a free connection
+    HTTP_CLIENT_READ_TIMEOUT: float = 10.0  # seconds between bytes received
+    HTTP_CLIENT_TOTAL_TIMEOUT: float = 20.0  # seconds for a whole exchange, redirects included
+    HTTP_CLIENT_HTTP2: bool = True  # used when the h2 package is installed
+    HTTP_CLIENT_USER_AGENT: str = "PercheBot/1.0"
+    STOREFRONT_DETECT_MAX_BYTES: int = 512 * 1024  # page read looking for Shopify scripts, at most
+    VALIDATION_CACHE_SIZE: int = 10000  # validate-connection results kept per worker
+    VALIDATION_CACHE_TTL: int = 300  # seconds a successful check is reused; 0 disables
+    VALIDATION_NEGATIVE_CACHE_TTL: int = 15  # seconds a failed check is reused; short so fixes show up
+
+    # Store catalog extraction from the platform into store_products
+    CATALOG_PAGE_SIZE: int = 250  # products per page; Shopify's maximum
+    CATALOG_FETCH_CONCURRENCY: int = 4  # pages in flight; keep under HTTP_CLIENT_MAX_PER_HOST
+    CATALOG_MAX_PRODUCTS: int = 200_000  # extraction stops after this many pages' worth
+
+    # Background jobs (catalog extraction), persisted in the jobs table
+    JOB_WORKERS: int = 2  # jobs run at once per worker process
+    JOB_POLL_INTERVAL: float = 2.0  # seconds between looks for queued or stale jobs
+    JOB_HEARTBEAT_INTERVAL: float = 1.0  # seconds between heartbeat/progress writes
+    JOB_STALE_AFTER: float = 30.0  # seconds without a heartbeat before a running job is re-queued
+    JOB_MAX_ATTEMPTS: int = 3  # runs before an interrupted job is failed
+    JOB_STREAM_INTERVAL: float = 1.0  # seconds between status reads on an events stream
+
+    # API call quota; calls charged against api_calls_limit are counted in a
+    # memory-mapped file shared by workers
+    QUOTA_ENABLED: bool = True
+    QUOTA_STORE_PATH: Optional[str] = None  # defaults to <sqlite db>.quota
+    QUOTA_STORE_SLOTS: int = 65536  # users held in the file
+    QUOTA_STORE_WAYS: int = 8  # slots a user may take, in bucket user_id % (slots / ways)
+    QUOTA_LOCK_STRIPES: int = 64
+
     # Airflow settings
     AIRFLOW_URL: str = "http://localhost:8080"
     AIRFLOW_BASIC_AUTH: str = "YWRtaW46YWRtaW4="  # Base64 encoded "admin:admin"
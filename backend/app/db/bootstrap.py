@@ -0,0 +1,94 @@
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.db.database import Base, SessionLocal, engine, local_data_path
+from app.db.init_db import init_db
+from app.models.app_meta import AppMeta
+# Register every table with Base.metadata before fingerprinting
+from app.models import analytics, billing, job, organization, sdk_wizard, user  # noqa: F401
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever init_db seeds different data, so existing databases get re-seeded
+SEED_VERSION = "1"
+FINGERPRINT_KEY = "schema_fingerprint"
+
+
+def schema_fingerprint(bind: Engine) -> str:
+    """Hash of the DDL for every mapped table, plus the seed version."""
+    digest = hashlib.sha256(SEED_VERSION.encode())
+    for table in Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(bind)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            digest.update(str(CreateIndex(index).compile(bind)).encode())
+    return digest.hexdigest()
+
+
+def _stored_fingerprint(bind: Engine) -> Optional[str]:
+    try:
+        with bind.connect() as connection:
+            return connection.execute(
+                select(AppMeta.value).where(AppMeta.key == FINGERPRINT_KEY)
+            ).scalar()
+    except DBAPIError:
+        # Fresh database, app_meta does not exist yet
+        return None
+
+
+@contextmanager
+def _init_lock() -> Iterator[None]:
+    """Exclusive lock shared by every worker process on this host."""
+    if fcntl is None:
+        yield
+        return
+    with open(local_data_path(".init.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def ensure_database_ready() -> bool:
+    """
+    Create tables and seed default data unless the database already carries
+    the current fingerprint. Only the first worker to take the lock does the
+    work; the rest find a matching fingerprint and return straight away.
+    Returns True if this process initialized the database.
+    """
+    expected = schema_fingerprint(engine)
+    if _stored_fingerprint(engine) == expected:
+        return False
+
+    with _init_lock():
+        # Another worker may have finished while we were waiting for the lock
+        if _stored_fingerprint(engine) == expected:
+            return False
+
+        logger.info("Initializing database schema and seed data")
+        Base.metadata.create_all(bind=engine)
+        # create_all skips existing tables entirely, including indexes added
+        # to them since; create those too
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        db = SessionLocal()
+        try:
+            init_db(db)
+            db.merge(AppMeta(key=FINGERPRINT_KEY, value=expected))
+            db.commit()
+        finally:
+            db.close()
+    return True
@@ -1,20 +1,151 @@
-from sqlalchemy import create_engine
+import hashlib
+import os
+import tempfile
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from fastapi import Request
+from sqlalchemy import Table, create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
+from app.core.config import settings
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Async drivers used for the API engines, keyed by the sync backend name
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def to_async_url(url: str) -> URL:
+    """Swap the driver of a sync database URL for its asyncio counterpart."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if parsed.get_driver_name() in ("aiosqlite", "asyncpg", "aiomysql"):
+        return parsed
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend '{backend}'")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def _is_memory_sqlite(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def local_data_path(suffix: str) -> str:
+    """
+    Path for host-local state shared by the worker processes (locks, mmaps):
+    next to the SQLite file, or in the temp dir for other databases.
+    """
+    url = make_url(settings.DATABASE_URL)
+    if url.get_backend_name() == "sqlite" and not _is_memory_sqlite(url):
+        return os.path.abspath(url.database) + suffix
+    name = hashlib.sha1(settings.DATABASE_URL.encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"perche-admin-{name}{suffix}")
+
+
+def _set_sqlite_pragmas(engine: Engine, read_only: bool = False) -> None:
+    """
+    Tune every new SQLite connection: WAL lets readers run alongside a writer,
+    synchronous=NORMAL is durable under WAL, busy_timeout makes writers wait
+    instead of failing with "database is locked", and mmap/cache keep hot
+    pages in memory across requests.
+    """
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def _engine_options(url: URL) -> Dict[str, Any]:
+    if _is_memory_sqlite(url):
+        # A pool of separate in-memory databases makes no sense; share one connection
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+
+    options: Dict[str, Any] = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["pool_pre_ping"] = True
+    return options
+
+
+def create_db_engine(url: str, read_only: bool = False) -> Engine:
+    """Create a sync engine, used for schema creation and seeding at startup."""
+    parsed = make_url(url)
+    engine = create_engine(parsed, **_engine_options(parsed))
+    if parsed.get_backend_name() == "sqlite":
+        _set_sqlite_pragmas(engine, read_only=read_only)
+    return engine
+
+
+def create_async_db_engine(url: str, read_only: bool = False) -> AsyncEngine:
+    """Create an async engine for the API endpoints."""
+    parsed = to_async_url(url)
+    options = _engine_options(parsed)
+    if "poolclass" not in options and parsed.get_backend_name() == "sqlite":
+        # aiosqlite defaults to NullPool for file databases, which would open
+        # a fresh connection (and thread) per request.
+        options["poolclass"] = AsyncAdaptedQueuePool
+    engine = create_async_engine(parsed, **options)
+    if parsed.get_backend_name() == "sqlite":
+        _set_sqlite_pragmas(engine.sync_engine, read_only=read_only)
+    return engine
+
+
+engine = create_db_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine(settings.DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+# Optional read-only engine; safe (GET) requests are routed to it when configured
+read_async_engine: Optional[AsyncEngine] = None
+ReadAsyncSessionLocal = AsyncSessionLocal
+if settings.DATABASE_READ_URL:
+    read_async_engine = create_async_db_engine(settings.DATABASE_READ_URL, read_only=True)
+    ReadAsyncSessionLocal = async_sessionmaker(
+        read_async_engine, autoflush=False, expire_on_commit=False
+    )
+
 Base = declarative_base()
 
+
+def upsert_insert(table: Table):
+    """INSERT supporting on_conflict_do_update/do_nothing on the configured dialect."""
+    # Both dialects spell the upsert the same way; only the import differs
+    dialect = postgresql if async_engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(table)
+
+
+async def dispose_engines() -> None:
+    await async_engine.dispose()
+    if read_async_engine is not None:
+        await read_async_engine.dispose()
+
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    session_factory = ReadAsyncSessionLocal if request.method in SAFE_METHODS else AsyncSessionLocal
+    async with session_factory() as db:
         yield db
-    finally:
-        db.close() 
\ No newline at end of file
@@ -1,33 +1,83 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.api.api_v1.api import api_router
-from app.db.database import Base, engine, SessionLocal
-from app.db.init_db import init_db
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
-# Initialize database with default data
-db = SessionLocal()
-init_db(db)
-db.close()
-
-app = FastAPI(
-    title="Perche Admin API",
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
-)
-
-# Set all CORS enabled origins
-if settings.BACKEND_CORS_ORIGINS:
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=[str(origin) for origin in settings.BACKEND_CORS_ORIGINS],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-        expose_headers=["*"]
+from app.api.middleware import RequestMetricsMiddleware, UsageMeteringMiddleware
+from app.db.bootstrap import ensure_database_ready
+from app.db.database import dispose_engines
+from app.core.security import shutdown_hash_executor
+from app.services.activity import activity_recorder
+from app.services.http_client import close_http_client, start_http_client
+from app.services.jobs import job_runner
+from app.services.mentions import checkpoint_mentions, run_mention_checkpoints
+from app.services.metering import usage_meter
+from app.services.quota import quota_store
+from app.services.request_metrics import request_sampler
+from app.services.segmentation import session_recorder
+from app.services.usage_rollups import usage_compactor
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create tables and seed default data once per schema/seed version;
+    # other workers see the stored fingerprint and skip straight past this
+    await run_in_threadpool(ensure_database_ready)
+    start_http_client()
+    usage_meter.start()
+    usage_compactor.start()
+    activity_recorder.start()
+    request_sampler.start()
+    session_recorder.start()
+    # Re-queued jobs from before a restart are picked up from the jobs table
+    job_runner.start()
+    mention_checkpoints = asyncio.create_task(run_mention_checkpoints())
+    yield
+    mention_checkpoints.cancel()
+    # Running jobs go back to the queue and use the HTTP client until then
+    await job_runner.stop()
+    await close_http_client()
+    await run_in_threadpool(checkpoint_mentions)
+    await usage_compactor.stop()
+    await session_recorder.stop()
+    await activity_recorder.stop()
+    await request_sampler.stop()
+    # Write back API calls still buffered in memory before the engines close
+    await usage_meter.stop()
+    quota_store.close()
+    # Close pooled aiosqlite connections so their worker threads exit
+    await dispose_engines()
+    shutdown_hash_executor()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="Perche Admin API",
+        openapi_url=f"{settings.API_V1_STR}/openapi.json",
+        lifespan=lifespan,
     )
 
-app.include_router(api_router, prefix=settings.API_V1_STR) 
\ No newline at end of file
+    # Set all CORS enabled origins
+    if settings.BACKEND_CORS_ORIGINS:
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=[str(origin) for origin in settings.BACKEND_CORS_ORIGINS],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=["*"]
+        )
+
+    app.add_middleware(UsageMeteringMiddleware, meter=usage_meter)
+    # Outermost, so the measured latency covers every other middleware too
+    app.add_middleware(RequestMetricsMiddleware, sampler=request_sampler)
+
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    return app
+
+
+app = create_app()
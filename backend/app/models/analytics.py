@@ -0,0 +1,22 @@
+from sqlalchemy import BigInteger, Column, Date, ForeignKey, Integer, LargeBinary, String
+
+from app.db.database import Base
+
+
+class ActivitySketch(Base):
+    """HyperLogLog sketch of a tenant's distinct end users on one day."""
+    __tablename__ = "activity_sketches"
+
+    tenant_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    kind = Column(String, primary_key=True)  # "active" or "new"
+    day = Column(Date, primary_key=True)
+    registers = Column(LargeBinary, nullable=False)  # precision byte + zlib'd registers
+
+
+class TenantEndUser(Base):
+    """First day each end user of a tenant was seen, keyed by a 64-bit hash of their id."""
+    __tablename__ = "tenant_end_users"
+
+    tenant_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    user_hash = Column(BigInteger, primary_key=True)  # signed view of the unsigned hash
+    first_seen = Column(Date, nullable=False)
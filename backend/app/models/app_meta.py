@@ -0,0 +1,12 @@
+from sqlalchemy import Column, DateTime, String
+from sqlalchemy.sql import func
+
+from app.db.database import Base
+
+class AppMeta(Base):
+    """Key/value bookkeeping for the application itself (e.g. the schema/seed fingerprint)."""
+    __tablename__ = "app_meta"
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,5 +1,5 @@
 import json
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.types import TypeDecorator, TEXT
@@ -66,6 +66,11 @@ class BillingHistory(Base):
     user = relationship("User", back_populates="billing_history")
     plan = relationship("BillingPlan")
 
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest payment first
+        Index("ix_billing_history_user_id_payment_date_id", "user_id", "payment_date", "id"),
+    )
+
 
 class UsageStats(Base):
     __tablename__ = "usage_stats"
@@ -81,4 +86,25 @@ class UsageStats(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-    user = relationship("User", back_populates="usage_stats") 
\ No newline at end of file
+    user = relationship("User", back_populates="usage_stats") 
+
+class UsageRollupHourly(Base):
+    """API calls counted per user per hour, with the storage/team gauges seen in that hour."""
+    __tablename__ = "usage_rollups_hourly"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # UTC, truncated to the hour
+    api_calls = Column(Integer, nullable=False, default=0)
+    storage_used = Column(Integer, nullable=False, default=0)  # in MB, latest value
+    team_members_used = Column(Integer, nullable=False, default=0)  # latest value
+
+
+class UsageRollupDaily(Base):
+    """Hourly rollups folded into days: summed calls, peak storage and team size."""
+    __tablename__ = "usage_rollups_daily"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # UTC midnight
+    api_calls = Column(Integer, nullable=False, default=0)
+    storage_used = Column(Integer, nullable=False, default=0)  # in MB, daily peak
+    team_members_used = Column(Integer, nullable=False, default=0)  # daily peak
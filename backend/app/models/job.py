@@ -0,0 +1,29 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, JSON, String
+
+from app.db.database import Base
+
+
+class Job(Base):
+    """Background work run by the in-process job runner; times are UTC."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Claiming the oldest queued job, and finding running ones gone stale
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+        Index("ix_jobs_user_id_kind", "user_id", "kind"),
+    )
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)  # selects the handler, e.g. "catalog_extraction"
+    params = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, failed
+    progress = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    owner = Column(String, nullable=True)  # runner holding a running job
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # refreshed while running; stale means its runner died
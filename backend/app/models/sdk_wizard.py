@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, JSON, ForeignKey
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, String, JSON, ForeignKey
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 
@@ -19,4 +19,17 @@ class SdkWizardData(Base):
     documentation_files = Column(JSON, nullable=True)  # Store array of file metadata
     
     # Relationship with User model
-    user = relationship("User", back_populates="sdk_wizard_data") 
\ No newline at end of file
+    user = relationship("User", back_populates="sdk_wizard_data")
+
+
+class StoreProduct(Base):
+    """A product of the user's store catalog, as last extracted from the platform."""
+    __tablename__ = "store_products"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    product_id = Column(BigInteger, primary_key=True)  # the platform's product id
+    title = Column(String, nullable=True)
+    handle = Column(String, nullable=True)
+    variant_titles = Column(JSON, nullable=True)  # kept apart so matching skips `data`
+    data = Column(JSON, nullable=False)
+    extracted_at = Column(DateTime, nullable=False)  # start of the extraction that saw it last
@@ -29,7 +29,7 @@ class BillingPlanInDB(BillingPlanBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 
 class BillingPlanResponse(BillingPlanInDB):
@@ -59,7 +59,7 @@ class UserSubscriptionInDB(UserSubscriptionBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 
 class UserSubscriptionResponse(UserSubscriptionInDB):
@@ -83,7 +83,7 @@ class BillingHistoryInDB(BillingHistoryBase):
     created_at: datetime
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 
 class BillingHistoryResponse(BillingHistoryInDB):
@@ -116,13 +116,23 @@ class UsageStatsInDB(UsageStatsBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 
 class UsageStatsResponse(UsageStatsInDB):
     pass
 
 
+class UsageRollupResponse(BaseModel):
+    bucket_start: datetime
+    api_calls: int
+    storage_used: int
+    team_members_used: int
+
+    class Config:
+        from_attributes = True
+
+
 class CurrentPlanResponse(BaseModel):
     plan: BillingPlanResponse
     subscription: UserSubscriptionResponse
@@ -0,0 +1,30 @@
+from typing import Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.schemas.billing import UsageStatsResponse, UserSubscriptionInDB
+
+# user_id -> (active subscription, usage stats) behind /billing/current-plan.
+# The nested plan is attached from the plan catalog at read time, so plan
+# edits never leave a stale copy here. api_calls_used changes on every
+# metered call, so it is read fresh rather than taken from the snapshot.
+_current_plan_cache = TTLCache(
+    maxsize=settings.CURRENT_PLAN_CACHE_SIZE, ttl=settings.CURRENT_PLAN_CACHE_TTL
+)
+
+
+def get_current_plan_snapshot(
+    user_id: int,
+) -> Optional[Tuple[UserSubscriptionInDB, UsageStatsResponse]]:
+    return _current_plan_cache.get(user_id)
+
+
+def set_current_plan_snapshot(
+    user_id: int, subscription: UserSubscriptionInDB, usage_stats: UsageStatsResponse
+) -> None:
+    _current_plan_cache.set(user_id, (subscription, usage_stats))
+
+
+def invalidate_current_plan(user_id: int) -> None:
+    """Call after any write to the user's subscription, limits or gauges."""
+    _current_plan_cache.pop(user_id)
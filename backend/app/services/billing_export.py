@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+
+from app.db.database import ReadAsyncSessionLocal
+from app.models.billing import BillingHistory
+from app.services.plan_catalog import PlanCatalog
+
+EXPORT_COLUMNS = ("id", "payment_date", "amount", "status", "plan_id", "plan_name", "created_at")
+
+
+def _history_query(user_id: int, start_date: Optional[datetime], end_date: Optional[datetime]):
+    # Plain columns rather than ORM entities: no identity map, no per-row objects
+    query = (
+        select(
+            BillingHistory.id,
+            BillingHistory.payment_date,
+            BillingHistory.amount,
+            BillingHistory.status,
+            BillingHistory.plan_id,
+            BillingHistory.created_at,
+        )
+        .filter(BillingHistory.user_id == user_id)
+        .order_by(BillingHistory.payment_date, BillingHistory.id)
+    )
+    if start_date:
+        query = query.filter(BillingHistory.payment_date >= start_date)
+    if end_date:
+        query = query.filter(BillingHistory.payment_date <= end_date)
+    return query
+
+
+async def _iter_partitions(query, batch_size: int):
+    # The request's session is closed before a streaming body is sent, so the
+    # export opens its own (read) session for the lifetime of the stream
+    async with ReadAsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield partition
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+async def stream_billing_history(
+    user_id: int,
+    catalog: PlanCatalog,
+    export_format: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[str]:
+    """
+    Yield a user's billing history as NDJSON or CSV, one chunk per fetched
+    batch, so memory stays flat regardless of how many rows are exported.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    if writer is not None:
+        writer.writerow(EXPORT_COLUMNS)
+
+    query = _history_query(user_id, start_date, end_date)
+    async for partition in _iter_partitions(query, batch_size):
+        for history_id, payment_date, amount, status, plan_id, created_at in partition:
+            plan = catalog.get(plan_id)
+            values = (
+                history_id,
+                _isoformat(payment_date),
+                amount,
+                status,
+                plan_id,
+                plan.name if plan else None,
+                _isoformat(created_at),
+            )
+            if writer is not None:
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))))
+                buffer.write("\n")
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,375 @@
+import asyncio
+import codecs
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import delete, func, select, update
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal, upsert_insert
+from app.models.sdk_wizard import SdkWizardData, StoreProduct
+from app.services.http_client import get_http_client, total_timeout
+from app.services.jobs import JobFailed, Report, job_runner
+from app.services.product_matcher import refresh_product_matcher
+
+logger = logging.getLogger(__name__)
+
+_products = StoreProduct.__table__
+
+
+def _upsert_products():
+    stmt = upsert_insert(_products)
+    return stmt.on_conflict_do_update(
+        index_elements=[_products.c.user_id, _products.c.product_id],
+        set_={
+            column: stmt.excluded[column]
+            for column in ("title", "handle", "variant_titles", "data", "extracted_at")
+        },
+    )
+
+
+_SEPARATORS = " \t\r\n,"
+
+
+class CatalogError(Exception):
+    """The store's catalog could not be read; the message is meant for the user."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class JsonArrayScanner:
+    """
+    Incremental parser for the elements of the array under `key` in a JSON
+    object. feed() takes text as it arrives and returns the elements
+    completed so far, so only the element being received is ever buffered.
+    Elements must be objects, arrays or strings (a number cut off mid-way
+    would parse as a shorter number).
+    """
+
+    def __init__(self, key: str):
+        self._start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._in_array = False
+        self._retry_at = 0
+        self.done = False
+
+    def feed(self, text: str) -> List[Any]:
+        buffer = self._buffer + text
+        items: List[Any] = []
+        position = 0
+        if not self._in_array:
+            match = self._start.search(buffer)
+            if match is None:
+                # Keep enough to find the key if it is split across chunks
+                self._buffer = buffer[-256:]
+                return items
+            self._in_array = True
+            position = match.end()
+        while not self.done:
+            while position < len(buffer) and buffer[position] in _SEPARATORS:
+                position += 1
+            if position == len(buffer):
+                break
+            if buffer[position] == "]":
+                self.done = True
+                position += 1
+                break
+            if len(buffer) - position < self._retry_at:
+                break
+            try:
+                item, position = self._decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Most likely an element still arriving; wait until its text
+                # has doubled rather than re-parsing it on every chunk
+                self._retry_at = 2 * (len(buffer) - position)
+                break
+            self._retry_at = 0
+            items.append(item)
+        self._buffer = "" if self.done else buffer[position:]
+        return items
+
+    def close(self, text: str = "") -> List[Any]:
+        """Parse what is left at the end of the document."""
+        self._retry_at = 0
+        items = self.feed(text)
+        if not self.done:
+            raise ValueError("JSON document ended inside the array")
+        return items
+
+
+@dataclass
+class ExtractionProgress:
+    pages: int = 0
+    products: int = 0  # stored so far, counting a product on several pages each time
+    skipped: int = 0  # entries without a numeric id
+    bytes: int = 0
+    total: Optional[int] = None  # distinct products in the catalog, once finished
+    removed: int = 0  # products gone from the store since the last extraction
+    truncated: bool = False  # stopped before the end of the catalog
+    first_product: Optional[Dict[str, Any]] = None
+    started: float = field(default_factory=time.monotonic)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "pages": self.pages,
+            "products": self.products,
+            "skipped": self.skipped,
+            "bytes": self.bytes,
+            "total": self.total,
+            "removed": self.removed,
+            "truncated": self.truncated,
+            "elapsed": round(time.monotonic() - self.started, 2),
+        }
+
+
+ProgressCallback = Callable[[ExtractionProgress], Awaitable[None]]
+
+
+def _product_id(product: Any) -> Any:
+    return product.get("id") if isinstance(product, dict) else None
+
+
+async def _fetch_page(
+    client: httpx.AsyncClient,
+    url: str,
+    params: Optional[Dict[str, Any]],
+    queue: "asyncio.Queue[Optional[List[Any]]]",
+    progress: ExtractionProgress,
+) -> Tuple[int, int, Optional[str]]:
+    """
+    Stream one page into `queue` in batches of at most a page size, even if
+    the store ignores `limit`. Returns the number of entries, a signature of
+    the product ids on the page and the next page's URL when the store
+    paginates with a Link header.
+    """
+    scanner = JsonArrayScanner("products")
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    batch: List[Any] = []
+    ids: List[Any] = []
+    count = 0
+    with total_timeout():
+        async with client.stream("GET", url, params=params) as response:
+            if response.status_code != 200:
+                raise CatalogError(f"Failed to fetch products from Shopify store: {response.status_code}")
+            async for chunk in response.aiter_bytes():
+                progress.bytes += len(chunk)
+                batch.extend(scanner.feed(decoder.decode(chunk)))
+                if len(batch) >= settings.CATALOG_PAGE_SIZE:
+                    count += len(batch)
+                    ids.extend(_product_id(product) for product in batch)
+                    await queue.put(batch)
+                    batch = []
+            try:
+                batch.extend(scanner.close(decoder.decode(b"", final=True)))
+            except ValueError:
+                raise CatalogError("The store returned an invalid products.json page")
+    count += len(batch)
+    ids.extend(_product_id(product) for product in batch)
+    if batch:
+        await queue.put(batch)
+    progress.pages += 1
+    return count, hash(tuple(ids)), response.links.get("next", {}).get("url")
+
+
+async def _fetch_catalog(
+    store_url: str,
+    queue: "asyncio.Queue[Optional[List[Any]]]",
+    progress: ExtractionProgress,
+) -> None:
+    client = get_http_client()
+    url = f"{store_url.rstrip('/')}/products.json"
+    limit = settings.CATALOG_PAGE_SIZE
+    max_pages = -(-settings.CATALOG_MAX_PRODUCTS // limit)
+
+    count, signature, next_url = await _fetch_page(client, url, {"limit": limit}, queue, progress)
+    # Pages already received, so a store that keeps sending the same
+    # products is not read CATALOG_MAX_PRODUCTS deep
+    seen = {signature}
+    if next_url:
+        # Cursor pagination (Link: <...page_info=...>; rel="next") can only
+        # be followed one page at a time
+        pages = 1
+        while next_url and pages < max_pages:
+            count, signature, next_url = await _fetch_page(client, next_url, None, queue, progress)
+            pages += 1
+            if count and signature in seen:
+                break
+            seen.add(signature)
+        progress.truncated = next_url is not None
+        return
+    if count < limit:
+        return
+
+    # Numbered pages: keep a window of requests in flight; the first short
+    # page marks the end, and pages past it come back empty. A full page
+    # seen before means the store ignores `page`, and the rest of the
+    # catalog cannot be read.
+    running: Dict[asyncio.Task, int] = {}
+    next_page, last_page = 2, max_pages
+    ended = repeated = False
+    try:
+        while True:
+            while len(running) < settings.CATALOG_FETCH_CONCURRENCY and next_page <= last_page:
+                task = asyncio.create_task(
+                    _fetch_page(client, url, {"limit": limit, "page": next_page}, queue, progress)
+                )
+                running[task] = next_page
+                next_page += 1
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                page = running.pop(task)
+                count, signature, _ = task.result()
+                if count < limit:
+                    ended = True
+                    last_page = min(last_page, page)
+                elif signature in seen:
+                    repeated = True
+                    last_page = min(last_page, page)
+                else:
+                    seen.add(signature)
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+    progress.truncated = repeated or not ended
+
+
+async def _store_pages(
+    user_id: int,
+    started_at: datetime,
+    queue: "asyncio.Queue[Optional[List[Any]]]",
+    progress: ExtractionProgress,
+    on_progress: Optional[ProgressCallback],
+) -> None:
+    # Executed with a list of rows, so the compiled statement is reused
+    # rather than compiling a VALUES clause per batch
+    stmt = _upsert_products()
+    async with AsyncSessionLocal() as db:
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            rows: Dict[int, Dict[str, Any]] = {}
+            for product in batch:
+                product_id = product.get("id") if isinstance(product, dict) else None
+                if not isinstance(product_id, int) or isinstance(product_id, bool):
+                    progress.skipped += 1
+                    continue
+                variants = product.get("variants")
+                rows[product_id] = {
+                    "user_id": user_id,
+                    "product_id": product_id,
+                    "title": product.get("title"),
+                    "handle": product.get("handle"),
+                    "variant_titles": [
+                        variant.get("title") for variant in variants if isinstance(variant, dict)
+                    ] if isinstance(variants, list) else [],
+                    "data": product,
+                    "extracted_at": started_at,
+                }
+                if progress.first_product is None:
+                    progress.first_product = product
+            if rows:
+                # One transaction per batch: what was fetched is kept even if
+                # a later page fails
+                await db.execute(stmt, list(rows.values()))
+                await db.commit()
+                progress.products += len(rows)
+            if on_progress is not None:
+                await on_progress(progress)
+
+
+async def _finish(user_id: int, started_at: datetime, progress: ExtractionProgress) -> None:
+    async with AsyncSessionLocal() as db:
+        # Only a complete pass tells which products the store no longer has;
+        # after a truncated one, the rest of the catalog is merely unread
+        if not progress.truncated:
+            result = await db.execute(
+                delete(StoreProduct)
+                .where(StoreProduct.user_id == user_id, StoreProduct.extracted_at < started_at)
+            )
+            progress.removed = result.rowcount or 0
+        progress.total = await db.scalar(
+            select(func.count()).select_from(StoreProduct).where(StoreProduct.user_id == user_id)
+        )
+        # The wizard keeps the first product as the template for its fields
+        await db.execute(
+            update(SdkWizardData)
+            .where(SdkWizardData.user_id == user_id)
+            .values(fields=[progress.first_product], is_data_extracted=True)
+        )
+        await db.commit()
+        await refresh_product_matcher(db, user_id)
+
+
+async def extract_shopify_catalog(
+    user_id: int,
+    store_url: str,
+    on_progress: Optional[ProgressCallback] = None,
+) -> ExtractionProgress:
+    """
+    Ingest a Shopify store's whole catalog from /products.json into
+    store_products. Pages are fetched a few at a time, parsed as they
+    stream in and written a page at a time, so memory stays flat however
+    large the catalog is.
+    """
+    progress = ExtractionProgress()
+    started_at = datetime.utcnow()
+    # A full queue holds back the fetchers until the writer catches up
+    queue: "asyncio.Queue[Optional[List[Any]]]" = asyncio.Queue(settings.CATALOG_FETCH_CONCURRENCY)
+
+    async def fetch() -> None:
+        await _fetch_catalog(store_url, queue, progress)
+        await queue.put(None)
+
+    tasks = [
+        asyncio.create_task(fetch()),
+        asyncio.create_task(_store_pages(user_id, started_at, queue, progress, on_progress)),
+    ]
+    try:
+        # Either side failing must stop the other, or it would wait on the queue forever
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    # The side that failed first, not the one cancelled because of it
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+
+    if progress.first_product is None:
+        raise CatalogError("No products found in the Shopify store", status_code=404)
+    await _finish(user_id, started_at, progress)
+    return progress
+
+
+CATALOG_EXTRACTION = "catalog_extraction"
+
+
+async def run_extraction_job(user_id: int, params: Dict[str, Any], report: Report) -> Dict[str, Any]:
+    async def on_progress(progress: ExtractionProgress) -> None:
+        report(progress.as_dict())
+
+    try:
+        progress = await extract_shopify_catalog(user_id, params["store_url"], on_progress)
+    except CatalogError as e:
+        raise JobFailed(str(e))
+    except (httpx.HTTPError, TimeoutError) as e:
+        raise JobFailed(f"Failed to fetch products from Shopify store: {str(e) or 'timed out'}")
+    # The first product, as the template for the wizard's fields
+    return {**progress.as_dict(), "data": [progress.first_product]}
+
+
+job_runner.register(CATALOG_EXTRACTION, run_extraction_job)
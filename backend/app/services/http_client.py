@@ -0,0 +1,143 @@
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+
+import anyio
+import httpx
+
+from app.core.config import settings
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # HTTP/2 needs httpx's optional h2 dependency
+    h2 = None
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that gives the host slot back once it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Caps concurrent requests per host on top of the pool's global limits,
+    so one slow store cannot take every pooled connection. A slot is held
+    until the response body is closed.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, per_host: int):
+        self._transport = transport
+        self._per_host = per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._users: Dict[str, int] = {}
+
+    def _leave(self, host: str) -> None:
+        self._users[host] -= 1
+        if not self._users[host]:
+            # Forget idle hosts so the table only holds hosts in use
+            del self._users[host]
+            del self._semaphores[host]
+
+    def _release(self, host: str) -> None:
+        self._semaphores[host].release()
+        self._leave(host)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self._per_host)
+        self._users[host] = self._users.get(host, 0) + 1
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            self._leave(host)
+            raise
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self._release(host)
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def create_http_client(**kwargs) -> httpx.AsyncClient:
+    """Pooled client for calls to customer stores, with strict timeouts."""
+    http2 = settings.HTTP_CLIENT_HTTP2 and h2 is not None
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+    )
+    transport = HostLimitedTransport(
+        httpx.AsyncHTTPTransport(limits=limits, http2=http2, retries=1),
+        settings.HTTP_CLIENT_MAX_PER_HOST,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT,
+        read=settings.HTTP_CLIENT_READ_TIMEOUT,
+        write=settings.HTTP_CLIENT_READ_TIMEOUT,
+        pool=settings.HTTP_CLIENT_CONNECT_TIMEOUT,
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=timeout,
+        follow_redirects=True,
+        max_redirects=5,
+        headers={"User-Agent": settings.HTTP_CLIENT_USER_AGENT},
+        **kwargs,
+    )
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def start_http_client() -> None:
+    global _client
+    if _client is None:
+        _client = create_http_client()
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("HTTP client is not running; it is started in the app lifespan")
+    return _client
+
+
+def total_timeout(seconds: Optional[float] = None):
+    """
+    Deadline for a whole exchange, redirects and body included, on top of
+    the per-phase connect/read timeouts. Raises TimeoutError when it passes.
+    """
+    return anyio.fail_after(seconds if seconds is not None else settings.HTTP_CLIENT_TOTAL_TIMEOUT)
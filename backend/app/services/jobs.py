@@ -0,0 +1,283 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal, ReadAsyncSessionLocal
+from app.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+_jobs = Job.__table__
+
+# handler(user_id, params, report) -> result; report(progress) records the latest progress
+Report = Callable[[Dict[str, Any]], None]
+Handler = Callable[[int, Dict[str, Any], Report], Awaitable[Dict[str, Any]]]
+
+
+class JobFailed(Exception):
+    """Raised by a handler to fail its job with a message meant for the user."""
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def job_as_dict(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "kind": row.kind,
+        "status": row.status,
+        "progress": row.progress,
+        "result": row.result,
+        "error": row.error,
+        "attempts": row.attempts,
+        "created_at": _isoformat(row.created_at),
+        "updated_at": _isoformat(row.updated_at),
+        "started_at": _isoformat(row.started_at),
+        "finished_at": _isoformat(row.finished_at),
+    }
+
+
+async def get_job(db: AsyncSession, job_id: str, user_id: int, kind: str) -> Optional[Dict[str, Any]]:
+    result = await db.execute(
+        select(_jobs).where(_jobs.c.id == job_id, _jobs.c.user_id == user_id, _jobs.c.kind == kind)
+    )
+    row = result.first()
+    return job_as_dict(row) if row is not None else None
+
+
+async def stream_job(job_id: str, user_id: int, kind: str) -> AsyncIterator[str]:
+    """
+    Server-sent events for a job: a `progress` event whenever it changes and
+    a final `done` event once it has succeeded or failed. The job is read
+    from the database, so any worker process can serve the stream.
+    """
+    last_update = None
+    last_sent = time.monotonic()
+    while True:
+        # A short-lived session per poll; the request's is closed before streaming starts
+        async with ReadAsyncSessionLocal() as db:
+            job = await get_job(db, job_id, user_id, kind)
+        if job is None:
+            return
+        if job["updated_at"] != last_update:
+            last_update = job["updated_at"]
+            last_sent = time.monotonic()
+            event = "done" if job["status"] in FINISHED else "progress"
+            yield f"event: {event}\ndata: {json.dumps(job)}\n\n"
+            if event == "done":
+                return
+        elif time.monotonic() - last_sent >= 15:
+            # Comment line, so proxies do not close an idle stream
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(settings.JOB_STREAM_INTERVAL)
+
+
+class JobRunner:
+    """
+    Bounded pool of async workers running the jobs persisted in the jobs table.
+
+    Jobs are claimed with a conditional UPDATE, so every worker process can
+    run its own pool without a job ever running twice. A running job's
+    heartbeat and latest progress are written every JOB_HEARTBEAT_INTERVAL;
+    jobs whose heartbeat goes stale because their process died are put back
+    in the queue, up to JOB_MAX_ATTEMPTS runs. Jobs interrupted by a clean
+    shutdown are re-queued straight away, so a restart picks them up again.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.JOB_WORKERS,
+        poll_interval: float = settings.JOB_POLL_INTERVAL,
+    ):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, Handler] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    async def submit(self, user_id: int, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a job, or return the user's job of this kind that is still unfinished."""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(_jobs)
+                .where(_jobs.c.user_id == user_id, _jobs.c.kind == kind, _jobs.c.status.in_((QUEUED, RUNNING)))
+                .order_by(_jobs.c.created_at.desc())
+                .limit(1)
+            )
+            active = result.first()
+            if active is not None:
+                return job_as_dict(active)
+            job_id = uuid.uuid4().hex
+            await db.execute(
+                _jobs.insert().values(
+                    id=job_id, user_id=user_id, kind=kind, params=params, status=QUEUED,
+                    attempts=0, created_at=now, updated_at=now,
+                )
+            )
+            await db.commit()
+            job = await get_job(db, job_id, user_id, kind)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def _claim(self) -> Optional[Any]:
+        now = datetime.utcnow()
+        oldest = (
+            select(_jobs.c.id)
+            .where(_jobs.c.status == QUEUED, _jobs.c.kind.in_(list(self._handlers)))
+            .order_by(_jobs.c.created_at)
+            .limit(1)
+            .scalar_subquery()
+        )
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(_jobs)
+                .where(_jobs.c.id == oldest, _jobs.c.status == QUEUED)
+                .values(
+                    status=RUNNING, owner=self.owner, attempts=_jobs.c.attempts + 1,
+                    started_at=now, heartbeat_at=now, updated_at=now,
+                )
+                .returning(_jobs.c.id, _jobs.c.user_id, _jobs.c.kind, _jobs.c.params)
+            )
+            job = result.first()
+            await db.commit()
+        return job
+
+    async def _update(self, job_id: str, **values: Any) -> bool:
+        """Update a job this runner still owns; False once it has lost it."""
+        values["updated_at"] = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(_jobs).where(_jobs.c.id == job_id, _jobs.c.owner == self.owner).values(**values)
+            )
+            await db.commit()
+        return result.rowcount == 1
+
+    async def _run_job(self, job_id: str, user_id: int, kind: str, params: Dict[str, Any]) -> None:
+        latest: Dict[str, Any] = {}
+
+        def report(progress: Dict[str, Any]) -> None:
+            latest["progress"] = progress
+
+        task = asyncio.create_task(self._handlers[kind](user_id, params, report))
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=settings.JOB_HEARTBEAT_INTERVAL)
+                if not task.done() and not await self._update(
+                    job_id, heartbeat_at=datetime.utcnow(), progress=latest.get("progress")
+                ):
+                    # Declared stale and handed to another runner
+                    logger.warning("Lost job %s; abandoning it", job_id)
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    return
+        except asyncio.CancelledError:
+            # Shutting down: put the job back without counting this run
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await self._update(job_id, status=QUEUED, owner=None, attempts=_jobs.c.attempts - 1)
+            raise
+
+        now = datetime.utcnow()
+        progress = latest.get("progress")
+        try:
+            if task.cancelled():
+                # Cancelled from inside the handler rather than by this runner;
+                # failing the job keeps it from being stuck in running
+                raise JobFailed("The job was cancelled")
+            result = task.result()
+        except JobFailed as e:
+            await self._update(job_id, status=FAILED, error=str(e), progress=progress, owner=None, finished_at=now)
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job_id, kind)
+            await self._update(job_id, status=FAILED, error=str(e) or type(e).__name__, progress=progress, owner=None, finished_at=now)
+        else:
+            await self._update(job_id, status=SUCCEEDED, result=result, progress=progress, owner=None, finished_at=now)
+
+    async def _requeue_stale(self) -> None:
+        now = datetime.utcnow()
+        stale = and_(
+            _jobs.c.status == RUNNING,
+            _jobs.c.heartbeat_at < now - timedelta(seconds=settings.JOB_STALE_AFTER),
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(_jobs)
+                .where(stale, _jobs.c.attempts >= settings.JOB_MAX_ATTEMPTS)
+                .values(status=FAILED, error="The job was interrupted too many times", owner=None, finished_at=now, updated_at=now)
+            )
+            result = await db.execute(
+                update(_jobs).where(stale).values(status=QUEUED, owner=None, updated_at=now)
+            )
+            await db.commit()
+        if result.rowcount:
+            logger.info("Re-queued %d stale jobs", result.rowcount)
+            self._wakeup.set()
+
+    async def _work(self) -> None:
+        while True:
+            # Cleared before claiming, so a job submitted meanwhile is not missed
+            self._wakeup.clear()
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Claiming a job failed")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run_job(job.id, job.user_id, job.kind, job.params)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Running job %s failed", job.id)
+
+    async def _sweep(self) -> None:
+        while True:
+            try:
+                await self._requeue_stale()
+            except Exception:
+                logger.exception("Re-queuing stale jobs failed")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._wakeup = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._sweep())]
+            self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+job_runner = JobRunner()
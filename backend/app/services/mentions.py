@@ -0,0 +1,410 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.timeseries import TenantSeries, get_tenant_series, seed_once
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Distinguishes this process's checkpoint files from other workers'
+WORKER_ID = uuid.uuid4().hex[:12]
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter sketch: tracks at most `capacity` items and
+    updates in O(1) per mention. Counts are upper bounds; `errors` holds how
+    much of each count may be overestimated. Items are also bucketed by count
+    so the minimum (the eviction candidate) is found without a heap.
+    """
+
+    __slots__ = ("capacity", "counts", "errors", "sentiment", "buckets", "min_count")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.sentiment: Dict[str, float] = {}
+        self.buckets: Dict[int, Set[str]] = {}
+        self.min_count = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _place(self, item: str, count: int) -> None:
+        self.counts[item] = count
+        self.buckets.setdefault(count, set()).add(item)
+
+    def _unplace(self, item: str) -> int:
+        count = self.counts.pop(item)
+        bucket = self.buckets[count]
+        bucket.discard(item)
+        if not bucket:
+            del self.buckets[count]
+        return count
+
+    def add(self, item: str, count: int = 1, sentiment: float = 0.0) -> None:
+        if item in self.counts:
+            current = self._unplace(item)
+            self._place(item, current + count)
+            self.sentiment[item] += sentiment
+            if current == self.min_count and current not in self.buckets:
+                self.min_count = current + 1 if count == 1 else min(self.buckets)
+            return
+
+        if len(self.counts) < self.capacity:
+            self.min_count = min(self.min_count, count) if self.counts else count
+            self._place(item, count)
+            self.errors[item] = 0
+            self.sentiment[item] = sentiment
+            return
+
+        # Replace an item holding the minimum count and inherit that count
+        error = self.min_count
+        victim = next(iter(self.buckets[error]))
+        self._unplace(victim)
+        del self.errors[victim]
+        del self.sentiment[victim]
+        self._place(item, error + count)
+        self.errors[item] = error
+        self.sentiment[item] = sentiment
+        if error not in self.buckets:
+            self.min_count = error + 1 if count == 1 else min(self.buckets)
+
+    @property
+    def floor(self) -> int:
+        """Upper bound on the count of any item this sketch is not tracking."""
+        return self.min_count if len(self.counts) >= self.capacity else 0
+
+    def top(self, k: int) -> List[Tuple[str, int, int, float]]:
+        """(item, count, error, sentiment sum) for the k largest counts."""
+        items = sorted(self.counts, key=self.counts.__getitem__, reverse=True)[:k]
+        return [(item, self.counts[item], self.errors[item], self.sentiment[item]) for item in items]
+
+    @classmethod
+    def merge(cls, sketches: Iterable["SpaceSaving"], capacity: int) -> "SpaceSaving":
+        """
+        Combine sketches of disjoint streams (e.g. one per day or per
+        worker). An item missing from a full sketch may still have occurred
+        there up to that sketch's floor, so the floor is added to its count
+        and error, which keeps the usual Space-Saving guarantees.
+        """
+        sketches = [sketch for sketch in sketches if len(sketch)]
+        counts: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        sentiment: Dict[str, float] = {}
+        present_floor: Dict[str, int] = {}
+        for sketch in sketches:
+            floor = sketch.floor
+            for item, count in sketch.counts.items():
+                counts[item] = counts.get(item, 0) + count
+                errors[item] = errors.get(item, 0) + sketch.errors[item]
+                sentiment[item] = sentiment.get(item, 0.0) + sketch.sentiment[item]
+                present_floor[item] = present_floor.get(item, 0) + floor
+        total_floor = sum(sketch.floor for sketch in sketches)
+        if total_floor:
+            for item in counts:
+                missing = total_floor - present_floor[item]
+                counts[item] += missing
+                errors[item] += missing
+
+        merged = cls(capacity)
+        for item in sorted(counts, key=counts.__getitem__, reverse=True)[:capacity]:
+            merged._place(item, counts[item])
+            merged.errors[item] = errors[item]
+            merged.sentiment[item] = sentiment[item]
+        merged.min_count = min(merged.buckets) if merged.buckets else 0
+        return merged
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "items": [[item, count, self.errors[item], self.sentiment[item]]
+                      for item, count in self.counts.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SpaceSaving":
+        sketch = cls(data["capacity"])
+        for item, count, error, sentiment in data["items"]:
+            sketch._place(item, count)
+            sketch.errors[item] = error
+            sketch.sentiment[item] = sentiment
+        sketch.min_count = min(sketch.buckets) if sketch.buckets else 0
+        return sketch
+
+
+def _write_json(path: str, data: dict) -> None:
+    tmp_path = f"{path}.{WORKER_ID}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+class MentionTracker:
+    """
+    Per-tenant product mention counts, one Space-Saving sketch per day.
+
+    Today's (and yesterday's) sketches live in memory and are checkpointed
+    to `<day>.<worker>.json`, one file per worker process. Once a day is
+    over, its worker files are merged into `<day>.json`, and completed
+    months are merged again into `<month>.json`, so a date range is
+    answered by merging a handful of month sketches plus the loose days.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self._live: Dict[date, SpaceSaving] = {}
+        self._dirty: Set[date] = set()
+        self._lock = threading.Lock()
+        self._loaded = TTLCache(maxsize=settings.MENTIONS_CACHED_SKETCHES, ttl=float("inf"))
+        os.makedirs(path, exist_ok=True)
+        # A tracker reopened after eviction carries on from this worker's
+        # checkpoints rather than overwriting them
+        yesterday = date.today() - timedelta(days=1)
+        for day in (yesterday, yesterday + timedelta(days=1)):
+            try:
+                with open(self._worker_file(day)) as f:
+                    self._live[day] = SpaceSaving.from_dict(json.load(f))
+            except FileNotFoundError:
+                pass
+
+    def _worker_file(self, day: date) -> str:
+        return os.path.join(self.path, f"{day.isoformat()}.{WORKER_ID}.json")
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(os.path.join(self.path, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def record(self, product: str, sentiment: float = 0.0, at: Optional[datetime] = None) -> None:
+        day = (at or datetime.now()).date()
+        with self._lock:
+            sketch = self._live.get(day)
+            if sketch is None:
+                sketch = self._live[day] = SpaceSaving(self.capacity)
+            sketch.add(product, sentiment=sentiment)
+            self._dirty.add(day)
+
+    def _load(self, path: str) -> Optional[SpaceSaving]:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._loaded.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path) as f:
+                sketch = SpaceSaving.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        self._loaded.set(path, (mtime, sketch))
+        return sketch
+
+    def _files_by_day(self) -> Dict[str, List[str]]:
+        files: Dict[str, List[str]] = {}
+        for name in os.listdir(self.path):
+            if name.endswith(".json") and name.count("-") == 2:
+                files.setdefault(name[:10], []).append(os.path.join(self.path, name))
+        return files
+
+    def _day_sketches(self, day: date, files: Dict[str, List[str]]) -> List[SpaceSaving]:
+        sketches = []
+        # This worker's own checkpoint is superseded by its live sketch
+        own_file = self._worker_file(day)
+        for path in files.get(day.isoformat(), ()):
+            if path != own_file:
+                sketch = self._load(path)
+                if sketch is not None:
+                    sketches.append(sketch)
+        with self._lock:
+            live = self._live.get(day)
+            if live is not None:
+                sketches.append(SpaceSaving.merge([live], self.capacity))
+        return sketches
+
+    def _month_sketch(self, first_day: date, files: Dict[str, List[str]]) -> SpaceSaving:
+        path = os.path.join(self.path, f"{first_day:%Y-%m}.json")
+        sketch = self._load(path)
+        if sketch is None:
+            days = []
+            day = first_day
+            while day.month == first_day.month:
+                days.extend(self._day_sketches(day, files))
+                day += timedelta(days=1)
+            sketch = SpaceSaving.merge(days, self.capacity)
+            _write_json(path, sketch.to_dict())
+        return sketch
+
+    def top(self, start: date, end: date, k: int) -> SpaceSaving:
+        """Merged sketch for start..end inclusive."""
+        # Months that ended before yesterday can no longer change
+        settled = date.today().replace(day=1) - timedelta(days=1)
+        files = self._files_by_day()
+        sketches: List[SpaceSaving] = []
+        day = start
+        while day <= end:
+            next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+            month_end = next_month - timedelta(days=1)
+            if day.day == 1 and month_end <= end and month_end < settled:
+                sketches.append(self._month_sketch(day, files))
+                day = next_month
+            else:
+                sketches.extend(self._day_sketches(day, files))
+                day += timedelta(days=1)
+        return SpaceSaving.merge(sketches, max(k, self.capacity))
+
+    def checkpoint(self) -> None:
+        """Persist dirty live sketches and fold finished days into one file each."""
+        yesterday = date.today() - timedelta(days=1)
+        with self._lock:
+            pending = [(day, self._live[day].to_dict()) for day in self._dirty]
+            self._dirty.clear()
+            for day in [day for day in self._live if day < yesterday]:
+                del self._live[day]
+        for day, data in pending:
+            _write_json(self._worker_file(day), data)
+
+        # A day is only compacted once no worker can still be writing it
+        for day, paths in self._files_by_day().items():
+            day_path = os.path.join(self.path, f"{day}.json")
+            shards = [path for path in paths if path != day_path]
+            if shards and date.fromisoformat(day) < yesterday:
+                self._compact_day(day_path, shards)
+
+    def _compact_day(self, day_path: str, shards: List[str]) -> None:
+        # Every worker compacts; the lock keeps one from reading another's
+        # new day file together with the shards already merged into it
+        with self._locked():
+            shards = [path for path in shards if os.path.exists(path)]
+            if not shards:
+                return
+            sketches = [sketch for sketch in map(self._load, [day_path] + shards) if sketch is not None]
+            _write_json(day_path, SpaceSaving.merge(sketches, self.capacity).to_dict())
+            for path in shards:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+_trackers = TTLCache(maxsize=settings.TIMESERIES_OPEN_TENANTS, ttl=float("inf"))
+_trackers_lock = threading.Lock()
+# Every tracker handed out since its last checkpoint, evicted ones included,
+# so live sketches are saved before the tracker is dropped
+_unsaved: Dict[int, MentionTracker] = {}
+
+
+def get_mention_tracker(tenant_id: int) -> MentionTracker:
+    tracker = _trackers.get(tenant_id)
+    if tracker is None:
+        with _trackers_lock:
+            tracker = _trackers.get(tenant_id)
+            if tracker is None:
+                # Evicted but not yet checkpointed: still the one to record into
+                tracker = _unsaved.get(tenant_id)
+            if tracker is None:
+                series = get_tenant_series(tenant_id)
+                tracker = MentionTracker(
+                    os.path.join(series.path, "mentions"), settings.MENTIONS_SKETCH_SIZE
+                )
+                if settings.ANALYTICS_DEMO_DATA:
+                    _seed_demo_mentions(series, tracker, tenant_id)
+            _trackers.set(tenant_id, tracker)
+            _unsaved[tenant_id] = tracker
+    return tracker
+
+
+_DEMO_PRODUCTS = [
+    "iPhone 15 Pro", "MacBook Pro M3", "iPad Air", "Apple Watch Series 9",
+    "AirPods Pro", "Apple Vision Pro", "iMac 24-inch", "Mac Studio",
+    "Apple TV 4K", "HomePod mini", "Magic Keyboard", "Magic Mouse",
+    "AirTag", "Apple Pencil", "Studio Display"
+]
+
+
+def _seed_demo_mentions(series: TenantSeries, tracker: MentionTracker, tenant_id: int) -> None:
+    """Deterministic demo history, written as finished day sketches, with ANALYTICS_DEMO_DATA on."""
+    if not seed_once(series, "mentions"):
+        return
+    rng = np.random.default_rng(tenant_id)
+    popularity = rng.dirichlet(np.ones(len(_DEMO_PRODUCTS)))
+    mood = rng.uniform(-0.6, 0.8, len(_DEMO_PRODUCTS))
+    today = date.today()
+    for offset in range(1, settings.TIMESERIES_DEMO_DAYS):
+        counts = rng.multinomial(int(rng.integers(1000, 3000)), popularity)
+        sketch = SpaceSaving(tracker.capacity)
+        for product, count, score in zip(_DEMO_PRODUCTS, counts.tolist(), mood.tolist()):
+            if count:
+                sketch.add(product, count, sentiment=score * count)
+        day = today - timedelta(days=offset)
+        _write_json(os.path.join(tracker.path, f"{day.isoformat()}.json"), sketch.to_dict())
+
+
+def top_mentions(tenant_id: int, start: date, end: date, limit: int) -> List[dict]:
+    """
+    The `limit` most mentioned products in start..end, with growth against
+    the preceding period of the same length.
+    """
+    tracker = get_mention_tracker(tenant_id)
+    current = tracker.top(start, end, limit)
+    length = (end - start).days + 1
+    previous = tracker.top(start - timedelta(days=length), start - timedelta(days=1), limit)
+    products = []
+    for name, count, _, sentiment in current.top(limit):
+        before = previous.counts.get(name, 0)
+        growth_rate = (count - before) / before if before else 0.0
+        products.append({
+            "name": name,
+            "mentions": count,
+            "sentiment_score": round(sentiment / count, 2) if count else 0.0,
+            "trend": "up" if growth_rate > 0.05 else "down" if growth_rate < -0.05 else "stable",
+            "growth_rate": round(growth_rate, 2),
+        })
+    return products
+
+
+def checkpoint_mentions() -> None:
+    with _trackers_lock:
+        trackers = list(_unsaved.items())
+    for tenant_id, tracker in trackers:
+        try:
+            tracker.checkpoint()
+        except Exception:
+            logger.exception("Failed to checkpoint mention sketches for %s", tracker.path)
+            continue
+        with _trackers_lock:
+            # Saved and no longer cached: nothing is left to lose by dropping it
+            if _trackers.peek(tenant_id) is not tracker and not tracker._dirty:
+                _unsaved.pop(tenant_id, None)
+
+
+async def run_mention_checkpoints() -> None:
+    """Background task: checkpoint every tracker on an interval."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(settings.MENTIONS_CHECKPOINT_INTERVAL)
+        await loop.run_in_executor(None, checkpoint_mentions)
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, func, update
+
+from app.core.config import settings
+from app.db.database import async_engine
+from app.models.billing import UsageStats
+from app.services.usage_rollups import add_hourly_api_calls
+
+logger = logging.getLogger(__name__)
+
+# Bound names must differ from column names in an UPDATE's SET clause
+_increment_usage = (
+    update(UsageStats.__table__)
+    .where(UsageStats.__table__.c.user_id == bindparam("b_user_id"))
+    .values(
+        api_calls_used=func.coalesce(UsageStats.__table__.c.api_calls_used, 0)
+        + bindparam("b_calls")
+    )
+)
+
+
+class _Shard:
+    __slots__ = ("lock", "counts")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Dict[int, int] = {}
+
+
+class UsageMeter:
+    """
+    Write-behind counter for API calls per user.
+
+    Requests only bump an in-memory counter in one of several lock-striped
+    shards; a background task periodically swaps the shards out and applies
+    the totals as one batched `api_calls_used = api_calls_used + n` UPDATE.
+    Counts that fail to flush are merged back and retried on the next pass.
+    """
+
+    def __init__(
+        self,
+        shards: int = settings.METERING_SHARDS,
+        flush_interval: float = settings.METERING_FLUSH_INTERVAL,
+        batch_size: int = settings.METERING_FLUSH_BATCH_SIZE,
+        max_pending_users: int = settings.METERING_MAX_PENDING_USERS,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending_users = max_pending_users
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._pending_users = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._flush_lock = asyncio.Lock()
+
+    def record(self, user_id: int, calls: int = 1) -> None:
+        shard = self._shards[user_id % len(self._shards)]
+        with shard.lock:
+            if user_id in shard.counts:
+                shard.counts[user_id] += calls
+                return
+            shard.counts[user_id] = calls
+        self._pending_users += 1
+        if self._pending_users >= self.max_pending_users and self._wakeup is not None:
+            # Too many distinct users buffered: flush early rather than grow
+            self._wakeup.set()
+
+    def pending(self) -> Dict[int, int]:
+        """Buffered, not yet flushed calls per user."""
+        totals: Dict[int, int] = {}
+        for shard in self._shards:
+            with shard.lock:
+                totals.update(shard.counts)
+        return totals
+
+    def pending_calls(self, user_id: int) -> int:
+        shard = self._shards[user_id % len(self._shards)]
+        with shard.lock:
+            return shard.counts.get(user_id, 0)
+
+    def _drain(self) -> Dict[int, int]:
+        drained: Dict[int, int] = {}
+        for shard in self._shards:
+            with shard.lock:
+                counts, shard.counts = shard.counts, {}
+            drained.update(counts)
+        self._pending_users = 0
+        return drained
+
+    def _restore(self, counts: Dict[int, int]) -> None:
+        # Merge unflushed counts back without waking the flusher, so a failing
+        # database is retried on the next interval rather than in a tight loop
+        for user_id, calls in counts.items():
+            shard = self._shards[user_id % len(self._shards)]
+            with shard.lock:
+                if user_id not in shard.counts:
+                    self._pending_users += 1
+                shard.counts[user_id] = shard.counts.get(user_id, 0) + calls
+
+    async def flush(self) -> int:
+        """Write buffered counts to usage_stats; returns the number of users flushed."""
+        async with self._flush_lock:
+            counts = self._drain()
+            if not counts:
+                return 0
+            items = list(counts.items())
+            flushed = 0
+            for start in range(0, len(items), self.batch_size):
+                batch = items[start:start + self.batch_size]
+                params: List[Dict[str, int]] = [
+                    {"b_user_id": user_id, "b_calls": calls} for user_id, calls in batch
+                ]
+                try:
+                    async with async_engine.begin() as conn:
+                        await conn.execute(_increment_usage, params)
+                        await add_hourly_api_calls(conn, batch, datetime.utcnow())
+                except Exception:
+                    logger.exception("Failed to flush API call counts; will retry")
+                    self._restore(dict(items[start:]))
+                    break
+                flushed += len(batch)
+            return flushed
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and flush whatever is still buffered."""
+        if self._task is not None:
+            # Let an in-flight flush finish instead of cancelling it mid-write
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+usage_meter = UsageMeter()
@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import time
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.billing import BillingPlan
+from app.schemas.billing import BillingPlanResponse
+
+
+class PlanCatalog:
+    """
+    Immutable snapshot of every billing plan, already validated into response
+    models. A new snapshot replaces the old one on refresh; an existing one is
+    never modified, so requests can share it freely.
+    """
+
+    def __init__(self, plans: Tuple[BillingPlanResponse, ...]):
+        self.plans = plans
+        self.by_id: Mapping[int, BillingPlanResponse] = MappingProxyType(
+            {plan.id: plan for plan in plans}
+        )
+        payload = b"".join(plan.model_dump_json().encode() for plan in plans)
+        self.version = hashlib.sha256(payload).hexdigest()[:16]
+        self.loaded_at = time.monotonic()
+
+    def get(self, plan_id: int) -> Optional[BillingPlanResponse]:
+        return self.by_id.get(plan_id)
+
+    def etag(self, *parts) -> str:
+        return '"' + "-".join([self.version, *map(str, parts)]) + '"'
+
+
+_catalog: Optional[PlanCatalog] = None
+_lock = asyncio.Lock()
+
+
+async def refresh_plan_catalog(db: AsyncSession) -> PlanCatalog:
+    """Reload the catalog from the database; call after any plan write."""
+    global _catalog
+    result = await db.execute(select(BillingPlan).order_by(BillingPlan.id))
+    plans = tuple(
+        BillingPlanResponse.model_validate(plan) for plan in result.scalars().all()
+    )
+    _catalog = PlanCatalog(plans)
+    return _catalog
+
+
+async def get_plan_catalog(db: AsyncSession) -> PlanCatalog:
+    """
+    Return the current catalog, loading it on first use. Plan writes refresh
+    it in-process; the TTL picks up writes made by other workers.
+    """
+    catalog = _catalog
+    if catalog is not None and time.monotonic() - catalog.loaded_at < settings.PLAN_CATALOG_TTL:
+        return catalog
+    async with _lock:
+        catalog = _catalog
+        if catalog is not None and time.monotonic() - catalog.loaded_at < settings.PLAN_CATALOG_TTL:
+            return catalog
+        return await refresh_plan_catalog(db)
+
+
+def _reloaded_recently(catalog: PlanCatalog) -> bool:
+    return time.monotonic() - catalog.loaded_at < settings.PLAN_CATALOG_MISS_RELOAD_INTERVAL
+
+
+async def get_plan(db: AsyncSession, plan_id: int) -> Optional[BillingPlanResponse]:
+    """
+    Look up a plan, reloading on a miss in case another worker created it.
+    Misses reload at most once per PLAN_CATALOG_MISS_RELOAD_INTERVAL, so
+    requests for unknown ids cannot keep re-reading the table.
+    """
+    catalog = await get_plan_catalog(db)
+    plan = catalog.get(plan_id)
+    if plan is None and not _reloaded_recently(catalog):
+        async with _lock:
+            catalog = _catalog
+            # Misses waiting on the lock share the reload the first one made
+            if not _reloaded_recently(catalog):
+                catalog = await refresh_plan_catalog(db)
+            plan = catalog.get(plan_id)
+    return plan
@@ -0,0 +1,280 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.sdk_wizard import SdkWizardData, StoreProduct
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercase, strip accents and collapse punctuation to single spaces, with
+    a space at each end so matches always fall on word boundaries.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = text.encode("ascii", "ignore").decode().lower()
+    return f" {_NON_WORD.sub(' ', text).strip()} "
+
+
+def _variant_titles(product: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(
+        str(variant["title"])
+        for variant in product.get("variants") or ()
+        if isinstance(variant, dict)
+        and variant.get("title")
+        and variant["title"] != "Default Title"
+    )
+
+
+def product_names(product: Dict[str, Any]) -> Set[str]:
+    """Normalized names a product can be mentioned by: title, handle and variants."""
+    title = str(product.get("title") or "")
+    names = {title}
+    handle = product.get("handle")
+    if handle:
+        names.add(str(handle).replace("-", " "))
+    for variant_title in _variant_titles(product):
+        names.add(f"{title} {variant_title}")
+    return {name for name in map(normalize, names) if name.strip()}
+
+
+class _Automaton:
+    """Aho-Corasick automaton over a fixed set of (pattern id, pattern) pairs."""
+
+    __slots__ = ("goto", "fail", "out", "ids")
+
+    def __init__(self, patterns: Iterable[Tuple[int, str]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.out: List[List[Tuple[int, int]]] = [[]]
+        self.ids: List[int] = []
+        for pattern_id, pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.out.append([])
+                state = next_state
+            self.out[state].append((pattern_id, len(pattern)))
+            self.ids.append(pattern_id)
+
+        # Breadth-first failure links; outputs are merged along them so a
+        # scan never has to walk the failure chain to report matches
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.out[self.fail[next_state]]:
+                    self.out[next_state] = self.out[next_state] + self.out[self.fail[next_state]]
+
+    def scan(self, text: str) -> Iterable[Tuple[int, int, int]]:
+        """Yield (start, end, pattern id) for every occurrence in `text`."""
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                for pattern_id, length in out[state]:
+                    yield index + 1 - length, index + 1, pattern_id
+
+
+class ProductMatcher:
+    """
+    Finds catalog products mentioned in free text.
+
+    Patterns live in a few Aho-Corasick automata of geometrically growing
+    size (the logarithmic method), so a catalog change only builds an
+    automaton for what was added and occasionally merges two levels, rather
+    than rebuilding everything. Removed patterns are tombstoned and dropped
+    at the next merge; once they outnumber live ones, everything is rebuilt.
+    Scanning costs one pass per level, i.e. O(text * log(catalog)).
+    """
+
+    def __init__(self):
+        self._levels: List[_Automaton] = []
+        self._patterns: Dict[int, Tuple[str, str]] = {}  # id -> (pattern, product key)
+        self._by_product: Dict[str, Dict[str, int]] = {}  # key -> {pattern: id}
+        self._names: Dict[str, str] = {}  # product key -> display name
+        self._sources: Dict[str, Tuple] = {}  # product key -> fields the names came from
+        self._dead: Set[int] = set()
+        self._next_id = 0
+        self._update_lock = threading.Lock()
+        # What match() reads: (levels, patterns, dead, names), replaced as a whole
+        self._view: Tuple[List[_Automaton], Dict[int, Tuple[str, str]], Set[int], Dict[str, str]] = (
+            [], {}, set(), {}
+        )
+
+    def __len__(self) -> int:
+        return len(self._by_product)
+
+    def update(self, products: Iterable[Dict[str, Any]]) -> None:
+        """Sync with the catalog, touching only products that changed."""
+        with self._update_lock:
+            self._update(products)
+
+    def _update(self, products: Iterable[Dict[str, Any]]) -> None:
+        # Batches are matched in worker threads while an update runs, so the
+        # maps they read are copied before being changed and published
+        # together at the end; what a match already holds never changes
+        self._patterns = dict(self._patterns)
+        self._dead = set(self._dead)
+        self._names = dict(self._names)
+
+        catalog: Dict[str, Dict[str, Any]] = {}
+        for product in products:
+            if not isinstance(product, dict):
+                continue
+            key = str(product.get("id") or product.get("title") or "")
+            if key:
+                catalog[key] = product
+
+        added: List[Tuple[int, str]] = []
+        for key in [key for key in self._by_product if key not in catalog]:
+            self._remove(key)
+        for key, product in catalog.items():
+            source = (product.get("title"), product.get("handle"), _variant_titles(product))
+            if self._sources.get(key) == source:
+                continue
+            self._sources[key] = source
+            self._names[key] = str(product.get("title") or key)
+            patterns = product_names(product)
+            current = self._by_product.get(key, {})
+            for pattern in set(current) - patterns:
+                self._dead.add(current.pop(pattern))
+            for pattern in patterns - set(current):
+                pattern_id = self._next_id
+                self._next_id += 1
+                self._patterns[pattern_id] = (pattern, key)
+                current[pattern] = pattern_id
+                added.append((pattern_id, pattern))
+            self._by_product[key] = current
+
+        if len(self._dead) > len(self._patterns) - len(self._dead):
+            self._rebuild()
+        elif added:
+            self._push(added)
+        self._view = (self._levels, self._patterns, self._dead, self._names)
+
+    def _remove(self, key: str) -> None:
+        self._dead.update(self._by_product.pop(key).values())
+        self._names.pop(key, None)
+        self._sources.pop(key, None)
+
+    def _live(self, automaton_patterns: Iterable[int]) -> List[Tuple[int, str]]:
+        return [
+            (pattern_id, self._patterns[pattern_id][0])
+            for pattern_id in automaton_patterns
+            if pattern_id not in self._dead
+        ]
+
+    def _push(self, added: List[Tuple[int, str]]) -> None:
+        levels = list(self._levels)
+        level = _Automaton(added)
+        # Merge while the newest level is at least half the size of the one
+        # below it, keeping level sizes roughly doubling
+        while levels and len(level.ids) * 2 >= len(levels[-1].ids):
+            below = levels.pop()
+            level = _Automaton(self._live(below.ids + level.ids))
+        levels.append(level)
+        self._levels = levels
+
+    def _rebuild(self) -> None:
+        self._patterns = {
+            pattern_id: entry
+            for pattern_id, entry in self._patterns.items()
+            if pattern_id not in self._dead
+        }
+        self._levels = [
+            _Automaton((pattern_id, pattern) for pattern_id, (pattern, _) in self._patterns.items())
+        ]
+        self._dead = set()
+
+    def match(self, text: str) -> List[str]:
+        """Names of the products mentioned in `text`, longest match first."""
+        text = normalize(text)
+        levels, patterns, dead, names = self._view
+        spans = []
+        for level in levels:
+            for start, end, pattern_id in level.scan(text):
+                if pattern_id not in dead:
+                    spans.append((end - start, start, end, patterns[pattern_id][1]))
+        # Leftmost-longest: "iphone 15 pro" wins over the "iphone 15" inside it
+        spans.sort(key=lambda span: (-span[0], span[1]))
+        taken: List[Tuple[int, int]] = []
+        found: Dict[str, None] = {}
+        for _, start, end, key in spans:
+            # Adjacent matches share their boundary space
+            if all(end <= left + 1 or start >= right - 1 for left, right in taken):
+                taken.append((start, end))
+                found.setdefault(names.get(key, key))
+        return list(found)
+
+    def match_batch(self, texts: Iterable[str]) -> List[List[str]]:
+        return [self.match(text) for text in texts]
+
+
+# Matchers stay in memory; the TTL bounds how long a worker that did not
+# see a catalog change keeps matching against the old catalog
+_matchers = TTLCache(maxsize=settings.PRODUCT_MATCHER_CACHE_SIZE, ttl=float("inf"))
+
+
+async def load_catalog(db: AsyncSession, user_id: int) -> List[Dict[str, Any]]:
+    """The extracted store catalog if there is one, else the wizard's products."""
+    result = await db.execute(
+        select(StoreProduct.product_id, StoreProduct.title, StoreProduct.handle, StoreProduct.variant_titles)
+        .filter(StoreProduct.user_id == user_id)
+    )
+    # Only the columns names are built from; full product `data` stays in the database
+    catalog = [
+        {
+            "id": product_id,
+            "title": title,
+            "handle": handle,
+            "variants": [{"title": variant_title} for variant_title in variant_titles or ()],
+        }
+        for product_id, title, handle, variant_titles in result
+    ]
+    if catalog:
+        return catalog
+    result = await db.execute(select(SdkWizardData.fields).filter(SdkWizardData.user_id == user_id))
+    return result.scalar() or []
+
+
+async def get_product_matcher(db: AsyncSession, user_id: int) -> ProductMatcher:
+    cached = _matchers.get(user_id)
+    if cached is not None and time.monotonic() - cached[1] < settings.PRODUCT_MATCHER_TTL:
+        return cached[0]
+    catalog = await load_catalog(db, user_id)
+    matcher = cached[0] if cached is not None else ProductMatcher()
+    # Building the automata for a large catalog takes seconds
+    await run_in_threadpool(matcher.update, catalog)
+    _matchers.set(user_id, (matcher, time.monotonic()))
+    return matcher
+
+
+async def refresh_product_matcher(db: AsyncSession, user_id: int) -> None:
+    """Apply a catalog change in this worker straight away."""
+    cached = _matchers.get(user_id)
+    if cached is not None:
+        await run_in_threadpool(cached[0].update, await load_catalog(db, user_id))
+        _matchers.set(user_id, (cached[0], time.monotonic()))
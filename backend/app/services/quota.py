@@ -0,0 +1,240 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.database import local_data_path
+from app.models.billing import UsageStats, UserSubscription
+from app.services.metering import usage_meter
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# One slot per user: user_id, api_calls_limit, calls used, resets_at (unix time)
+_SLOT = struct.Struct("<qqqd")
+_OWNER = struct.Struct("<q")
+# Limit marking a user without usage stats, who has no quota
+UNLIMITED = -1
+
+
+@dataclass(frozen=True)
+class QuotaDecision:
+    allowed: bool
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+    retry_after: Optional[int] = None
+    # The call is already counted in usage_meter and must not be recorded again
+    metered: bool = False
+
+
+def _decision(allowed: bool, limit: int, used: int, resets_at: float) -> QuotaDecision:
+    if limit == UNLIMITED:
+        return QuotaDecision(allowed=True)
+    retry_after = None
+    now = time.time()
+    if not allowed and resets_at > now:
+        # Spent quota only comes back with the next billing period
+        retry_after = int(resets_at - now) + 1
+    return QuotaDecision(
+        allowed=allowed, limit=limit, remaining=max(0, limit - used), retry_after=retry_after
+    )
+
+
+class QuotaStore:
+    """
+    API call quotas for every user in a memory-mapped file, shared by all
+    worker processes on the host.
+
+    Each slot holds a user's limit and the calls charged so far, starting
+    from the persisted api_calls_used, so every worker charges the same
+    count. The file is a set-associative table: a user hashes to bucket
+    `user_id % buckets` and takes any free slot among its `ways`, so a check
+    reads at most `ways` slots of 32 bytes. Users are never evicted to make
+    room, since a re-loaded slot would miss the calls other workers have not
+    flushed yet; when a bucket is full, check_quota falls back to the
+    database. Buckets are guarded by striped locks: a thread lock per stripe
+    inside the process and an fcntl byte-range lock on the same stripe
+    across processes.
+    """
+
+    def __init__(self, path: str, slots: int, ways: int, stripes: int):
+        self.path = path
+        self.ways = max(1, ways)
+        self.buckets = max(1, slots // self.ways)
+        self.stripes = max(1, stripes)
+        self._thread_locks = [threading.Lock() for _ in range(self.stripes)]
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._open_lock = threading.Lock()
+
+    def _open(self) -> mmap.mmap:
+        # Opened lazily so every worker maps the file after it has started
+        with self._open_lock:
+            if self._map is None:
+                size = self.buckets * self.ways * _SLOT.size
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+                self._fd = fd
+                self._map = mmap.mmap(fd, size)
+            return self._map
+
+    def _locked(self, bucket: int):
+        return _StripeLock(self, bucket % self.stripes)
+
+    def _find(self, buf: mmap.mmap, bucket: int, user_id: int) -> Tuple[Optional[int], Optional[int]]:
+        """Offsets of the user's slot in `bucket` and of the bucket's first free slot."""
+        free = None
+        base = bucket * self.ways * _SLOT.size
+        for offset in range(base, base + self.ways * _SLOT.size, _SLOT.size):
+            owner = _OWNER.unpack_from(buf, offset)[0]
+            if owner == user_id:
+                return offset, free
+            if owner == 0 and free is None:
+                free = offset
+        return None, free
+
+    def consume(self, user_id: int, cost: int = 1) -> Optional[QuotaDecision]:
+        """Charge `cost` calls to the user unless that exceeds their limit; None if not loaded."""
+        buf = self._map or self._open()
+        bucket = user_id % self.buckets
+        with self._locked(bucket):
+            offset, _ = self._find(buf, bucket, user_id)
+            if offset is None:
+                return None
+            _, limit, used, resets_at = _SLOT.unpack_from(buf, offset)
+            allowed = limit == UNLIMITED or used + cost <= limit
+            if allowed and limit != UNLIMITED:
+                used += cost
+                _SLOT.pack_into(buf, offset, user_id, limit, used, resets_at)
+        return _decision(allowed, limit, used, resets_at)
+
+    def load(self, user_id: int, limit: int, used: int, resets_at: float) -> bool:
+        """
+        Install a freshly hydrated slot unless another worker got there
+        first. False when every slot of the user's bucket is taken.
+        """
+        buf = self._map or self._open()
+        bucket = user_id % self.buckets
+        with self._locked(bucket):
+            offset, free = self._find(buf, bucket, user_id)
+            if offset is not None:
+                return True
+            if free is None:
+                return False
+            _SLOT.pack_into(buf, free, user_id, limit, used, resets_at)
+            return True
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop the user's slot so the next request re-reads their limit and usage."""
+        buf = self._map or self._open()
+        bucket = user_id % self.buckets
+        with self._locked(bucket):
+            offset, _ = self._find(buf, bucket, user_id)
+            if offset is not None:
+                _SLOT.pack_into(buf, offset, 0, 0, 0, 0.0)
+
+    def close(self) -> None:
+        with self._open_lock:
+            if self._map is not None:
+                self._map.close()
+                os.close(self._fd)
+                self._map = None
+                self._fd = None
+
+
+class _StripeLock:
+    __slots__ = ("store", "stripe")
+
+    def __init__(self, store: QuotaStore, stripe: int):
+        self.store = store
+        self.stripe = stripe
+
+    def __enter__(self):
+        self.store._thread_locks[self.stripe].acquire()
+        if fcntl is not None:
+            fcntl.lockf(self.store._fd, fcntl.LOCK_EX, 1, self.stripe)
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.lockf(self.store._fd, fcntl.LOCK_UN, 1, self.stripe)
+        self.store._thread_locks[self.stripe].release()
+
+
+quota_store = QuotaStore(
+    settings.QUOTA_STORE_PATH or local_data_path(".quota"),
+    settings.QUOTA_STORE_SLOTS,
+    settings.QUOTA_STORE_WAYS,
+    settings.QUOTA_LOCK_STRIPES,
+)
+
+
+def _timestamp(moment: datetime) -> float:
+    # Subscription dates are stored as naive UTC
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+async def _load_usage(db: AsyncSession, user_id: int) -> Tuple[int, int, float]:
+    """The user's limit, the calls used as stored, and when they reset."""
+    result = await db.execute(
+        select(
+            UsageStats.api_calls_limit,
+            UsageStats.api_calls_used,
+            UserSubscription.end_date,
+        )
+        .select_from(UsageStats)
+        .outerjoin(
+            UserSubscription,
+            (UserSubscription.user_id == UsageStats.user_id)
+            & (UserSubscription.status == "active"),
+        )
+        .filter(UsageStats.user_id == user_id)
+        .order_by(UserSubscription.start_date.desc())
+        .limit(1)
+    )
+    row = result.first()
+    if row is None or row.api_calls_limit is None:
+        return UNLIMITED, 0, 0.0
+    resets_at = _timestamp(row.end_date) if row.end_date is not None else 0.0
+    return row.api_calls_limit, row.api_calls_used or 0, resets_at
+
+
+async def check_quota(db: AsyncSession, user_id: int) -> QuotaDecision:
+    """Charge one API call to the user, loading their slot on first use."""
+    decision = quota_store.consume(user_id)
+    if decision is not None:
+        return decision
+    limit, used, resets_at = await _load_usage(db, user_id)
+    # Calls this worker has metered but not flushed yet
+    used += usage_meter.pending_calls(user_id)
+    if quota_store.load(user_id, limit, used, resets_at):
+        decision = quota_store.consume(user_id)
+        if decision is not None:
+            return decision
+    # No free slot in the user's bucket: judge this call on the database
+    # plus this worker's unflushed calls, which misses only those of other
+    # workers. The call is metered now rather than after its response, so
+    # calls still in flight count against the next ones
+    allowed = limit == UNLIMITED or used + 1 <= limit
+    decision = _decision(allowed, limit, used + 1 if allowed else used, resets_at)
+    if allowed and limit != UNLIMITED:
+        usage_meter.record(user_id)
+        decision = replace(decision, metered=True)
+    return decision
+
+
+def invalidate_quota(user_id: int) -> None:
+    """Call after any change to the user's api_calls_limit, api_calls_used or subscription."""
+    quota_store.invalidate(user_id)
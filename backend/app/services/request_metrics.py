@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.timeseries import (
+    LATENCY_EDGES_MS, LATENCY_VALUES_MS, get_host_series, get_tenant_series, latency_percentiles
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Requests made before authentication (or without it) are kept under this id,
+# in the host's series
+ANONYMOUS = 0
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_PHYSICAL_MEMORY = (
+    os.sysconf("SC_PHYS_PAGES") * _PAGE_SIZE if hasattr(os, "sysconf") else 0
+)
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # Peak rather than current, but the closest portable figure
+        if resource is None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _Minute:
+    """Aggregates of one minute: request counts and a latency histogram."""
+
+    __slots__ = ("requests", "errors", "histogram")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.histogram = np.zeros(len(LATENCY_VALUES_MS), dtype=np.int64)
+
+
+class RequestSampler:
+    """
+    Request latency/status and process CPU/RSS sampling for /analysis/system.
+
+    The middleware only appends (time, tenant, latency, error) to fixed-size
+    NumPy ring buffers under a lock. A background task periodically folds
+    the new samples into per-day latency histograms in the tenants'
+    series (shared by every worker) and into per-minute aggregates kept in
+    memory for the last SYSTEM_METRICS_MINUTES minutes (this worker only).
+    It samples the process's CPU and RSS on the same timer. Samples that
+    are overwritten before a fold are counted in `dropped`. Folds run in a
+    thread, so the per-minute aggregates are only changed or read under
+    `_minutes_lock`.
+    """
+
+    def __init__(
+        self,
+        capacity: int = settings.SYSTEM_METRICS_RING_SIZE,
+        interval: float = settings.SYSTEM_METRICS_INTERVAL,
+        minutes: int = settings.SYSTEM_METRICS_MINUTES,
+    ):
+        self.capacity = capacity
+        self.interval = interval
+        self.minutes = minutes
+        self.dropped = 0
+        self._at = np.zeros(capacity, dtype=np.float64)
+        self._tenant = np.zeros(capacity, dtype=np.int64)
+        self._latency = np.zeros(capacity, dtype=np.float64)
+        self._error = np.zeros(capacity, dtype=bool)
+        self._written = 0
+        self._folded = 0
+        self._lock = threading.Lock()
+        self._fold_lock = threading.Lock()
+        self._minutes_lock = threading.Lock()
+        # Closed minutes: (minute start, requests, errors, p50, p95, p99)
+        self._closed: TTLCache = TTLCache(maxsize=settings.SYSTEM_METRICS_TENANTS, ttl=float("inf"))
+        self._open: Dict[Tuple[int, int], _Minute] = {}
+        # Process samples per minute: minute start -> (cpu sum, memory sum, samples)
+        self._process: Deque[Tuple[int, float, float, int]] = deque(maxlen=minutes)
+        self._last_cpu: Optional[Tuple[float, float]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, tenant_id: Optional[int], latency_ms: float, status: int) -> None:
+        with self._lock:
+            index = self._written % self.capacity
+            self._at[index] = time.time()
+            self._tenant[index] = tenant_id or ANONYMOUS
+            self._latency[index] = latency_ms
+            self._error[index] = status >= 500
+            self._written += 1
+
+    def _take(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        with self._lock:
+            first = max(self._folded, self._written - self.capacity)
+            self.dropped += first - self._folded
+            positions = np.arange(first, self._written) % self.capacity
+            self._folded = self._written
+            return (
+                self._at[positions], self._tenant[positions],
+                self._latency[positions], self._error[positions],
+            )
+
+    def _sample_process(self, now: float) -> None:
+        cpu_time = time.process_time()
+        if self._last_cpu is not None:
+            wall = now - self._last_cpu[0]
+            if wall > 0:
+                cpu = (cpu_time - self._last_cpu[1]) / wall / (os.cpu_count() or 1) * 100
+                memory = _rss_bytes() / _PHYSICAL_MEMORY * 100 if _PHYSICAL_MEMORY else 0.0
+                hours = np.array([np.datetime64(datetime.fromtimestamp(now), "h")])
+                get_host_series().add_many("process", hours, np.array([[cpu], [memory], [1.0]]))
+                minute = int(now // 60) * 60
+                with self._minutes_lock:
+                    if self._process and self._process[-1][0] == minute:
+                        _, cpu_sum, memory_sum, samples = self._process[-1]
+                        self._process[-1] = (minute, cpu_sum + cpu, memory_sum + memory, samples + 1)
+                    else:
+                        self._process.append((minute, cpu, memory, 1))
+        self._last_cpu = (now, cpu_time)
+
+    def fold(self) -> int:
+        """Fold new samples into the aggregates; returns how many were folded."""
+        with self._fold_lock:
+            now = time.time()
+            self._sample_process(now)
+            at, tenants, latencies, errors = self._take()
+            if len(at):
+                buckets = np.searchsorted(LATENCY_EDGES_MS, latencies, side="right")
+                self._fold_days(at, tenants, buckets, errors)
+                self._fold_minutes(at, tenants, buckets, errors)
+            self._close_minutes(int(now // 60) * 60)
+            return len(at)
+
+    def _fold_days(self, at, tenants, buckets, errors) -> None:
+        # Local time, like the rest of the daily series. Other workers fold
+        # into the same files; add_many serializes with them on the series lock
+        offset = datetime.now().astimezone().utcoffset().total_seconds()
+        hours = ((at + offset) // 3600).astype("datetime64[h]")
+        days = hours.astype("datetime64[D]")
+        for tenant_id in np.unique(tenants).tolist():
+            series = get_host_series() if tenant_id == ANONYMOUS else get_tenant_series(tenant_id)
+            in_tenant = tenants == tenant_id
+            for day in np.unique(days[in_tenant]):
+                selected = in_tenant & (days == day)
+                values = np.concatenate((
+                    [selected.sum(), errors[selected].sum()],
+                    np.bincount(buckets[selected], minlength=len(LATENCY_VALUES_MS)),
+                )).astype(np.float64)[:, None]
+                series.add_many("requests", hours[selected][:1], values)
+
+    def _fold_minutes(self, at, tenants, buckets, errors) -> None:
+        minutes = (at // 60).astype(np.int64) * 60
+        keys = np.stack((tenants, minutes))
+        for tenant_id, minute in np.unique(keys, axis=1).T.tolist():
+            selected = (tenants == tenant_id) & (minutes == minute)
+            aggregate = self._open.get((tenant_id, minute))
+            if aggregate is None:
+                aggregate = self._open[(tenant_id, minute)] = _Minute()
+            aggregate.requests += int(selected.sum())
+            aggregate.errors += int(errors[selected].sum())
+            aggregate.histogram += np.bincount(buckets[selected], minlength=len(LATENCY_VALUES_MS))
+
+    def _close_minutes(self, current: int) -> None:
+        # A request is sampled when it completes, so once a minute is over
+        # no more samples can arrive for it
+        for key in [key for key in self._open if key[1] < current]:
+            tenant_id, minute = key
+            aggregate = self._open.pop(key)
+            p50, p95, p99 = (
+                float(value[0]) for value in
+                latency_percentiles(aggregate.histogram[:, None], (0.5, 0.95, 0.99))
+            )
+            with self._minutes_lock:
+                closed = self._closed.get(tenant_id)
+                if closed is None:
+                    closed = deque(maxlen=self.minutes)
+                    self._closed.set(tenant_id, closed)
+                closed.append((minute, aggregate.requests, aggregate.errors, p50, p95, p99))
+
+    def recent(self, tenant_id: int) -> Dict[str, np.ndarray]:
+        """Per-minute aggregates of the tenant's requests seen by this worker, oldest first."""
+        # Copied under the lock: a fold in the threadpool may be appending
+        with self._minutes_lock:
+            closed = list(self._closed.get(tenant_id) or ())
+            process_rows = list(self._process)
+        rows = np.array(closed, dtype=np.float64).reshape(-1, 6)
+        minutes, requests, errors, p50, p95, p99 = rows.T
+        process = {minute: (cpu, memory, samples) for minute, cpu, memory, samples in process_rows}
+        cpu = np.zeros(len(minutes))
+        memory = np.zeros(len(minutes))
+        for index, minute in enumerate(minutes.astype(np.int64).tolist()):
+            if minute in process:
+                cpu_sum, memory_sum, samples = process[minute]
+                cpu[index], memory[index] = cpu_sum / samples, memory_sum / samples
+        return {
+            "date": np.array([
+                datetime.fromtimestamp(minute).strftime("%Y-%m-%d %H:%M") for minute in minutes.tolist()
+            ], dtype=str),
+            "response_time": np.round(p50, 2),
+            "p50": np.round(p50, 2),
+            "p95": np.round(p95, 2),
+            "p99": np.round(p99, 2),
+            "requests": requests.astype(np.int64),
+            "error_rate": np.round(np.divide(errors, requests, out=np.zeros(len(requests)), where=requests > 0), 4),
+            "cpu_usage": np.round(cpu, 2),
+            "memory_usage": np.round(memory, 2),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await run_in_threadpool(self.fold)
+            except Exception:
+                logger.exception("Folding request metrics failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await run_in_threadpool(self.fold)
+
+
+request_sampler = RequestSampler()
@@ -0,0 +1,471 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.activity import hash_user
+from app.services.mentions import WORKER_ID
+from app.services.timeseries import get_tenant_series, seed_once
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS = ("Power Users", "Regular Users", "Occasional Users", "New Users")
+POWER, REGULAR, OCCASIONAL, NEW = range(len(SEGMENTS))
+
+# One row per end user in an open-addressing hash table keyed by the hash of
+# their id (0 marks an empty slot). Tables live in memory-mapped files, so a
+# store with millions of end users costs page cache rather than heap.
+_ROW = np.dtype([
+    ("key", "<u8"),
+    ("sessions", "<u4"),
+    ("duration", "<f4"),  # total seconds over all sessions
+    ("features", "<u8"),  # bitmask of the features used
+    ("first_seen", "<i4"),  # days since the epoch
+    ("segment", "i1"),
+])
+_MIN_CAPACITY = 1024
+_MAX_LOAD = 0.7
+# Sessions are binned by powers of two and features by exact count; segment
+# thresholds are bin edges, so they only move when a quantile crosses a bin
+_SESSION_BINS = 33
+_FEATURE_BINS = 65
+
+
+def feature_bit(feature: str) -> int:
+    """Bit for a feature name; with a few dozen features, collisions are rare."""
+    return 1 << (hashlib.blake2b(feature.encode(), digest_size=1).digest()[0] % 64)
+
+
+_BYTE_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.int64)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    as_bytes = np.ascontiguousarray(values, dtype=np.uint64).view(np.uint8).reshape(-1, 8)
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=1)
+
+
+def _session_bins(sessions: np.ndarray) -> np.ndarray:
+    return np.frexp(np.maximum(sessions, 1).astype(np.float64))[1] - 1
+
+
+def _histogram_quantile(histogram: np.ndarray, quantile: float) -> int:
+    cumulative = np.cumsum(histogram)
+    if not cumulative[-1]:
+        return 0
+    return int(np.searchsorted(cumulative, quantile * cumulative[-1]))
+
+
+def _empty_meta() -> dict:
+    return {
+        "capacity": _MIN_CAPACITY,
+        "users": 0,
+        "session_histogram": [0] * _SESSION_BINS,
+        "feature_histogram": [0] * _FEATURE_BINS,
+        "thresholds": None,
+        "assigned_day": None,
+        # Per segment: users, sessions, seconds, features
+        "totals": [[0.0] * 4 for _ in SEGMENTS],
+    }
+
+
+class SessionStore:
+    """
+    Per-end-user session aggregates of one tenant and their segments.
+
+    Users are segmented with threshold rules on quantiles of the whole
+    population: new if first seen within SEGMENTATION_NEW_USER_DAYS, power
+    users from the 80th session percentile with at least median feature use,
+    regular users above the median session count, occasional otherwise.
+    Quantiles come from histograms kept up to date as users change, so an
+    update only re-segments the changed users and adjusts per-segment
+    totals. Everyone is re-segmented, a chunk at a time, only when a
+    threshold moves to another bin or the day changes (users age out of
+    "new"). Updates from every worker are serialized by a lock file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._table: Optional[np.memmap] = None
+        self._meta_cache: Optional[Tuple[int, dict]] = None
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _table_path(self, capacity: int) -> str:
+        return os.path.join(self.path, f"users-{capacity}.bin")
+
+    def meta(self) -> dict:
+        try:
+            mtime = os.stat(self._meta_path()).st_mtime_ns
+        except FileNotFoundError:
+            return _empty_meta()
+        if self._meta_cache is None or self._meta_cache[0] != mtime:
+            with open(self._meta_path()) as f:
+                self._meta_cache = (mtime, json.load(f))
+        return self._meta_cache[1]
+
+    def _save_meta(self, meta: dict) -> None:
+        tmp_path = f"{self._meta_path()}.{WORKER_ID}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f, separators=(",", ":"))
+        os.replace(tmp_path, self._meta_path())
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _open(self, capacity: int) -> np.memmap:
+        # Another worker may have grown the table since we mapped it
+        if self._table is None or len(self._table) != capacity:
+            path = self._table_path(capacity)
+            mode = "r+" if os.path.exists(path) else "w+"
+            self._table = np.memmap(path, dtype=_ROW, mode=mode, shape=(capacity,))
+        return self._table
+
+    @staticmethod
+    def _locate(table: np.ndarray, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows of the (unique, non-zero) `keys`, inserting missing ones with
+        vectorized linear probing. Returns (rows, created).
+        """
+        capacity = len(table)
+        slots = (keys % np.uint64(capacity)).astype(np.int64)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        created = np.zeros(len(keys), dtype=bool)
+        pending = np.arange(len(keys))
+        while len(pending):
+            probe = slots[pending]
+            current = table["key"][probe]
+            found = current == keys[pending]
+            rows[pending[found]] = probe[found]
+            empty = current == 0
+            if empty.any():
+                # Keys probing the same empty slot: the first one claims it,
+                # the others find it taken on the next round and move on
+                claimants, claimed = pending[empty], probe[empty]
+                _, first = np.unique(claimed, return_index=True)
+                winners = claimants[first]
+                table["key"][claimed[first]] = keys[winners]
+                rows[winners] = claimed[first]
+                created[winners] = True
+            taken = ~found & ~empty
+            slots[pending[taken]] = (probe[taken] + 1) % capacity
+            pending = pending[rows[pending] < 0]
+        return rows, created
+
+    def _grow(self, meta: dict, needed: int) -> np.memmap:
+        capacity = meta["capacity"]
+        old = self._open(capacity)
+        while needed > capacity * _MAX_LOAD:
+            capacity *= 2
+        if capacity == meta["capacity"]:
+            return old
+        path = self._table_path(capacity)
+        table = np.memmap(path, dtype=_ROW, mode="w+", shape=(capacity,))
+        for start in range(0, len(old), settings.SEGMENTATION_CHUNK_ROWS):
+            chunk = np.array(old[start:start + settings.SEGMENTATION_CHUNK_ROWS])
+            chunk = chunk[chunk["key"] != 0]
+            rows, _ = self._locate(table, chunk["key"])
+            table[rows] = chunk
+        table.flush()
+        stale = self._table_path(meta["capacity"])
+        meta["capacity"] = capacity
+        self._table = table
+        self._save_meta(meta)
+        os.remove(stale)
+        return table
+
+    @staticmethod
+    def _thresholds(meta: dict) -> List[int]:
+        sessions = np.array(meta["session_histogram"])
+        features = np.array(meta["feature_histogram"])
+        return [
+            _histogram_quantile(sessions, 0.5),
+            _histogram_quantile(sessions, 0.8),
+            _histogram_quantile(features, 0.5),
+        ]
+
+    @staticmethod
+    def _assign(rows: np.ndarray, thresholds: List[int], today: int) -> np.ndarray:
+        median_bin, power_bin, power_features = thresholds
+        session_bin = _session_bins(rows["sessions"])
+        segments = np.full(len(rows), OCCASIONAL, dtype=np.int8)
+        segments[session_bin > median_bin] = REGULAR
+        power = (session_bin >= max(power_bin, median_bin + 1)) & (
+            _popcount(rows["features"]) >= power_features
+        )
+        segments[power] = POWER
+        segments[rows["first_seen"] > today - settings.SEGMENTATION_NEW_USER_DAYS] = NEW
+        return segments
+
+    @staticmethod
+    def _totals(rows: np.ndarray, segments: np.ndarray) -> np.ndarray:
+        """(segments, 4) users, sessions, seconds and features of `rows`."""
+        count = len(SEGMENTS)
+        return np.stack([
+            np.bincount(segments, minlength=count),
+            np.bincount(segments, weights=rows["sessions"], minlength=count),
+            np.bincount(segments, weights=rows["duration"], minlength=count),
+            np.bincount(segments, weights=_popcount(rows["features"]), minlength=count),
+        ], axis=1).astype(np.float64)
+
+    @staticmethod
+    def _histograms(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return (
+            np.bincount(_session_bins(rows["sessions"]), minlength=_SESSION_BINS),
+            np.bincount(_popcount(rows["features"]), minlength=_FEATURE_BINS),
+        )
+
+    def _reassign_all(self, table: np.ndarray, thresholds: List[int], today: int) -> np.ndarray:
+        totals = np.zeros((len(SEGMENTS), 4))
+        for start in range(0, len(table), settings.SEGMENTATION_CHUNK_ROWS):
+            chunk = table[start:start + settings.SEGMENTATION_CHUNK_ROWS]
+            occupied = np.flatnonzero(chunk["key"] != 0)
+            rows = np.array(chunk[occupied])
+            rows["segment"] = self._assign(rows, thresholds, today)
+            chunk["segment"][occupied] = rows["segment"]
+            totals += self._totals(rows, rows["segment"].astype(np.intp))
+        return totals
+
+    def apply(
+        self,
+        keys: np.ndarray,
+        sessions: np.ndarray,
+        durations: np.ndarray,
+        features: np.ndarray,
+        first_seen: np.ndarray,
+        today: Optional[date] = None,
+    ) -> int:
+        """
+        Add session aggregates for a batch of users (one entry per user) and
+        re-segment them; returns how many users were new to the table.
+        """
+        today_index = ((today or date.today()) - date(1970, 1, 1)).days
+        keys = np.where(keys == 0, np.uint64(1), keys)
+        with self._locked():
+            # Copied: the cached meta must not change unless the update lands
+            meta = dict(self.meta())
+            table = self._grow(meta, meta["users"] + len(keys))
+            rows, created = self._locate(table, keys)
+            before = np.array(table[rows])
+            existing = ~created
+
+            after = before.copy()
+            after["key"] = keys
+            after["sessions"] = np.where(existing, before["sessions"], 0) + sessions
+            after["duration"] = np.where(existing, before["duration"], 0) + durations
+            after["features"] = np.where(existing, before["features"], 0) | features
+            after["first_seen"] = np.where(
+                existing, np.minimum(before["first_seen"], first_seen), first_seen
+            )
+
+            session_histogram = np.array(meta["session_histogram"])
+            feature_histogram = np.array(meta["feature_histogram"])
+            removed = self._histograms(before[existing])
+            added = self._histograms(after)
+            session_histogram += added[0] - removed[0]
+            feature_histogram += added[1] - removed[1]
+            meta["session_histogram"] = session_histogram.tolist()
+            meta["feature_histogram"] = feature_histogram.tolist()
+            meta["users"] += int(created.sum())
+
+            thresholds = self._thresholds(meta)
+            if thresholds != meta["thresholds"] or today_index != meta["assigned_day"]:
+                table[rows] = after
+                totals = self._reassign_all(table, thresholds, today_index)
+            else:
+                after["segment"] = self._assign(after, thresholds, today_index)
+                table[rows] = after
+                totals = np.array(meta["totals"])
+                totals -= self._totals(before[existing], before["segment"][existing].astype(np.intp))
+                totals += self._totals(after, after["segment"].astype(np.intp))
+            table.flush()
+            meta.update(thresholds=thresholds, assigned_day=today_index, totals=totals.tolist())
+            self._save_meta(meta)
+            return int(created.sum())
+
+    def summary(self) -> dict:
+        totals = np.array(self.meta()["totals"])
+        users = float(totals[:, 0].sum())
+        segments = []
+        for name, (count, sessions, seconds, features) in zip(SEGMENTS, totals.tolist()):
+            segments.append({
+                "name": name,
+                "count": int(count),
+                "percentage": round(count / users, 2) if users else 0.0,
+                "avg_session_duration": round(seconds / sessions / 60, 1) if sessions else 0.0,
+                "features_used": round(features / count, 1) if count else 0.0,
+            })
+        return {"segments": segments, "total_users": int(users)}
+
+
+class _Pending:
+    """One tenant's buffered sessions, already reduced to one entry per user."""
+
+    __slots__ = ("sessions", "durations", "features", "first_seen")
+
+    def __init__(self):
+        self.sessions: Dict[int, int] = {}
+        self.durations: Dict[int, float] = {}
+        self.features: Dict[int, int] = {}
+        self.first_seen: Dict[int, int] = {}
+
+
+_stores = TTLCache(maxsize=settings.TIMESERIES_OPEN_TENANTS, ttl=float("inf"))
+_stores_lock = threading.Lock()
+
+
+def get_session_store(tenant_id: int) -> SessionStore:
+    store = _stores.get(tenant_id)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(tenant_id)
+            if store is None:
+                series = get_tenant_series(tenant_id)
+                store = SessionStore(os.path.join(series.path, "sessions"))
+                if settings.ANALYTICS_DEMO_DATA:
+                    _seed_demo_sessions(series, store, tenant_id)
+                _stores.set(tenant_id, store)
+    return store
+
+
+class SessionRecorder:
+    """
+    Buffers finished sessions per tenant and periodically applies them to
+    the tenants' session stores, off the event loop.
+    """
+
+    def __init__(self, flush_interval: float = settings.SEGMENTATION_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[int, _Pending] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(
+        self, tenant_id: int, user_id: str, duration: float, features: Iterable[str], day: date
+    ) -> None:
+        key = hash_user(user_id) or 1
+        mask = 0
+        for feature in features:
+            mask |= feature_bit(feature)
+        day_index = (day - date(1970, 1, 1)).days
+        with self._lock:
+            pending = self._pending.get(tenant_id)
+            if pending is None:
+                pending = self._pending[tenant_id] = _Pending()
+            pending.sessions[key] = pending.sessions.get(key, 0) + 1
+            pending.durations[key] = pending.durations.get(key, 0.0) + duration
+            pending.features[key] = pending.features.get(key, 0) | mask
+            pending.first_seen[key] = min(pending.first_seen.get(key, day_index), day_index)
+
+    def _take(self, tenant_id: Optional[int] = None) -> Dict[int, _Pending]:
+        with self._lock:
+            if tenant_id is None:
+                taken, self._pending = self._pending, {}
+                return taken
+            pending = self._pending.pop(tenant_id, None)
+            return {tenant_id: pending} if pending is not None else {}
+
+    def _restore(self, tenant_id: int, pending: _Pending) -> None:
+        with self._lock:
+            current = self._pending.setdefault(tenant_id, _Pending())
+            for key, count in pending.sessions.items():
+                current.sessions[key] = current.sessions.get(key, 0) + count
+                current.durations[key] = current.durations.get(key, 0.0) + pending.durations[key]
+                current.features[key] = current.features.get(key, 0) | pending.features[key]
+                current.first_seen[key] = min(
+                    current.first_seen.get(key, pending.first_seen[key]), pending.first_seen[key]
+                )
+
+    def flush(self, tenant_id: Optional[int] = None) -> int:
+        """Apply buffered sessions (of one tenant, or all); returns the users updated."""
+        updated = 0
+        for tenant, pending in self._take(tenant_id).items():
+            keys = list(pending.sessions)
+            try:
+                get_session_store(tenant).apply(
+                    np.array(keys, dtype=np.uint64),
+                    np.array([pending.sessions[key] for key in keys], dtype=np.uint32),
+                    np.array([pending.durations[key] for key in keys], dtype=np.float32),
+                    np.array([pending.features[key] for key in keys], dtype=np.uint64),
+                    np.array([pending.first_seen[key] for key in keys], dtype=np.int32),
+                )
+            except Exception:
+                logger.exception("Failed to apply sessions for tenant %s; will retry", tenant)
+                self._restore(tenant, pending)
+                continue
+            updated += len(keys)
+        return updated
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await run_in_threadpool(self.flush)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await run_in_threadpool(self.flush)
+
+
+session_recorder = SessionRecorder()
+
+
+def _seed_demo_sessions(series, store: SessionStore, tenant_id: int) -> None:
+    """Deterministic demo end users for new tenants, with ANALYTICS_DEMO_DATA on."""
+    if not seed_once(series, "sessions"):
+        return
+    rng = np.random.default_rng(tenant_id)
+    users = settings.SEGMENTATION_DEMO_USERS
+    today = (date.today() - date(1970, 1, 1)).days
+    sessions = np.maximum(rng.lognormal(1.5, 1.0, users), 1).astype(np.uint32)
+    features = np.zeros(users, dtype=np.uint64)
+    for bit in range(15):
+        # Heavier users try more of the 15 demo features
+        used = rng.random(users) < np.minimum(0.05 * np.log2(sessions + 1) + 0.02 * bit, 0.9)
+        features[used] |= np.uint64(1 << bit)
+    store.apply(
+        rng.integers(1, 2 ** 63, users, dtype=np.uint64),
+        sessions,
+        (sessions * rng.uniform(60, 1800, users)).astype(np.float32),
+        features,
+        (today - rng.integers(0, settings.TIMESERIES_DEMO_DAYS, users)).astype(np.int32),
+    )
+
+
+def user_segments(tenant_id: int) -> dict:
+    """Segment sizes and averages, including this worker's buffered sessions."""
+    session_recorder.flush(tenant_id)
+    return get_session_store(tenant_id).summary()
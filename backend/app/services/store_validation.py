@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.http_client import get_http_client, total_timeout
+from app.services.storefront import detect_shopify
+
+
+@dataclass(frozen=True)
+class ValidationResult:
+    success: bool
+    message: str
+
+
+ValidationKey = Tuple[str, str, str]
+
+# Successes and failures are kept for different TTLs, set per entry
+_results = TTLCache(maxsize=settings.VALIDATION_CACHE_SIZE, ttl=settings.VALIDATION_CACHE_TTL)
+_in_flight: Dict[ValidationKey, "asyncio.Task[ValidationResult]"] = {}
+
+
+def normalize_store_url(store_url: str) -> str:
+    """Case-insensitive scheme and host, no default port, fragment or trailing slash."""
+    try:
+        url = httpx.URL(store_url.strip())
+    except httpx.InvalidURL:
+        return store_url.strip()
+    default_port = {"http": 80, "https": 443}.get(url.scheme)
+    port = f":{url.port}" if url.port not in (None, default_port) else ""
+    query = f"?{url.query.decode()}" if url.query else ""
+    return f"{url.scheme}://{url.host}{port}{url.path.rstrip('/')}{query}"
+
+
+def validation_key(
+    platform: str,
+    store_url: str,
+    client_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+) -> ValidationKey:
+    # Keys only ever appear hashed, and a wrong pair never answers for the right one
+    credentials = (
+        hashlib.sha256(f"{client_key}\0{secret_key}".encode()).hexdigest()
+        if client_key or secret_key else ""
+    )
+    return platform.lower(), normalize_store_url(store_url), credentials
+
+
+async def _check(
+    platform: str,
+    store_url: str,
+    client_key: Optional[str],
+    secret_key: Optional[str],
+) -> ValidationResult:
+    try:
+        if platform == "shopify":
+            is_shopify = await detect_shopify(store_url)
+            if is_shopify is None:
+                return ValidationResult(False, "Could not access the store URL")
+            if not is_shopify:
+                return ValidationResult(False, "The provided URL does not appear to be a Shopify store")
+            return ValidationResult(True, "Successfully connected to Shopify store")
+
+        woo_api_url = f"{store_url.rstrip('/')}/wp-json/wc/v3/products"
+        with total_timeout():
+            response = await get_http_client().get(woo_api_url, auth=(client_key, secret_key))
+        if response.status_code != 200:
+            return ValidationResult(False, "Invalid WooCommerce credentials or API access")
+        return ValidationResult(True, "Successfully connected to WooCommerce store")
+    except (httpx.HTTPError, TimeoutError) as e:
+        return ValidationResult(False, f"Connection failed: {str(e) or 'timed out'}")
+
+
+def _store_result(key: ValidationKey, task: "asyncio.Task[ValidationResult]") -> None:
+    _in_flight.pop(key, None)
+    # Unexpected errors reach the waiting callers and are not cached
+    if task.cancelled() or task.exception() is not None:
+        return
+    result = task.result()
+    ttl = settings.VALIDATION_CACHE_TTL if result.success else settings.VALIDATION_NEGATIVE_CACHE_TTL
+    if ttl > 0:
+        _results.set(key, result, ttl=ttl)
+
+
+async def validate_store(
+    platform: str,
+    store_url: str,
+    client_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    refresh: bool = False,
+) -> ValidationResult:
+    """
+    Check that a store is reachable (and, for WooCommerce, that the keys
+    work), reusing a recent result for the same store and keys unless
+    `refresh` is set. Concurrent checks of the same store share a single
+    upstream request, which runs to completion even if its callers go away.
+    """
+    key = validation_key(platform, store_url, client_key, secret_key)
+    if not refresh:
+        cached = _results.get(key)
+        if cached is not None:
+            return cached
+    # A refresh still joins a check already in flight: its answer is just as fresh
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_check(key[0], store_url, client_key, secret_key))
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _store_result(key, done))
+    return await asyncio.shield(task)
@@ -0,0 +1,82 @@
+import re
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.http_client import get_http_client, total_timeout
+
+_SCRIPT_TAG = re.compile(rb"<script\b[^>]*>", re.IGNORECASE)
+_SHOPIFY_SRC = re.compile(
+    rb"""\ssrc\s*=\s*(?:"[^"]*shopify|'[^']*shopify|[^\s"'>]*shopify)""", re.IGNORECASE
+)
+_HEAD_END = re.compile(rb"</head\s*>|<body\b", re.IGNORECASE)
+# Headers Shopify's storefront servers add to every response
+_SHOPIFY_HEADERS = ("x-shopid", "x-shopify-stage", "x-sorting-hat-shopid", "x-storefront-renderer-rendered")
+# A tag split across chunks is carried over; anything longer is not a tag worth waiting for
+_MAX_TAG = 16 * 1024
+
+
+def shopify_headers(headers: httpx.Headers) -> bool:
+    return (
+        any(name in headers for name in _SHOPIFY_HEADERS)
+        or "shopify" in headers.get("powered-by", "").lower()
+    )
+
+
+class ShopifyDetector:
+    """
+    Incremental scan of a storefront page for `<script src>` tags pointing at
+    Shopify. feed() returns True on the first such tag, False once `<head>`
+    has ended or `max_bytes` have been seen without one, and None while it
+    still needs more of the page.
+    """
+
+    def __init__(self, max_bytes: int = settings.STOREFRONT_DETECT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.seen = 0
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> Optional[bool]:
+        self.seen += len(chunk)
+        data = self._tail + chunk
+        # Scan complete tags only; an unterminated "<..." waits for the next chunk
+        cut = data.rfind(b"<")
+        if cut != -1 and data.find(b">", cut) == -1 and len(data) - cut <= _MAX_TAG:
+            data, self._tail = data[:cut], data[cut:]
+        else:
+            self._tail = b""
+        for tag in _SCRIPT_TAG.finditer(data):
+            if _SHOPIFY_SRC.search(tag.group()):
+                return True
+        if _HEAD_END.search(data) or self.seen >= self.max_bytes:
+            return False
+        return None
+
+    def close(self) -> bool:
+        """Verdict at the end of a page that ran out before one was reached."""
+        return bool(self._tail and self.feed(b">"))
+
+
+async def detect_shopify(url: str) -> Optional[bool]:
+    """
+    Whether `url` serves a Shopify storefront, reading no more of the page
+    than needed: the response headers often settle it, otherwise the
+    download stops at the first Shopify script, the end of `<head>` or
+    STOREFRONT_DETECT_MAX_BYTES. None when the URL does not serve an HTML page.
+    """
+    with total_timeout():
+        async with get_http_client().stream("GET", url) as response:
+            if response.status_code != 200:
+                return None
+            if shopify_headers(response.headers):
+                return True
+            if "text/html" not in response.headers.get("content-type", ""):
+                return None
+            detector = ShopifyDetector()
+            async for chunk in response.aiter_bytes():
+                verdict = detector.feed(chunk)
+                if verdict is not None:
+                    # Leaving the block closes the connection mid-download
+                    return verdict
+            return detector.close()
@@ -0,0 +1,558 @@
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.database import local_data_path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Buckets per yearly file at each granularity (sized for leap years). Weeks
+# are counted from January 1st, so the last one of a year may be short.
+GRANULARITIES: Dict[str, int] = {"hour": 366 * 24, "day": 366, "week": 53, "month": 12}
+
+# Column layout and granularity of each table. A table is stored per tenant
+# and per year as one float64 file of shape (columns, buckets): every column
+# is a contiguous run indexed by bucket, so a time range is a plain slice.
+TABLES: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "product": (("views", "clicks", "conversions"), "day"),
+    "sales": (("revenue", "orders"), "day"),
+    "system": (("response_time", "error_rate", "cpu_usage", "memory_usage", "active_users"), "day"),
+}
+
+# Intent query counts are kept as a category x bucket matrix at every
+# granularity, so each level is read directly instead of re-aggregated
+INTENT_CATEGORIES = (
+    "product deep dive", "product search", "product discovery", "question about store", "normal conversation"
+)
+for _granularity in GRANULARITIES:
+    TABLES[f"intent_{_granularity}"] = (INTENT_CATEGORIES, _granularity)
+
+# Request latency is kept as a log-scale histogram per day, so percentiles
+# over any set of days come from summing columns. Bucket i holds latencies
+# in [edge i-1, edge i); reported values are the bucket's geometric middle,
+# which is within 7.5% of any latency in it.
+LATENCY_EDGES_MS = np.geomspace(0.1, 100_000.0, 100)
+LATENCY_VALUES_MS = np.concatenate((
+    [LATENCY_EDGES_MS[0]],
+    np.sqrt(LATENCY_EDGES_MS[:-1] * LATENCY_EDGES_MS[1:]),
+    [LATENCY_EDGES_MS[-1]],
+))
+TABLES["requests"] = (
+    ("requests", "errors") + tuple(f"latency_{i}" for i in range(len(LATENCY_VALUES_MS))), "day"
+)
+# Host-wide process samples, summed so that any range averages correctly
+TABLES["process"] = (("cpu_sum", "memory_sum", "samples"), "day")
+
+
+def bucket_index(granularity: str, moment: datetime) -> int:
+    """Position of `moment` within its year's file at `granularity`."""
+    if granularity == "month":
+        return moment.month - 1
+    day_index = moment.timetuple().tm_yday - 1
+    if granularity == "hour":
+        return day_index * 24 + moment.hour
+    if granularity == "week":
+        return day_index // 7
+    return day_index
+
+
+def _bucket_indices(granularity: str, hours: np.ndarray, year: int) -> np.ndarray:
+    """Vectorized bucket_index for an array of datetime64[h] within one year."""
+    if granularity == "month":
+        return (hours.astype("datetime64[M]") - np.datetime64(f"{year}-01", "M")).astype(np.int64)
+    offsets = (hours - np.datetime64(f"{year}-01-01T00", "h")).astype(np.int64)
+    if granularity == "hour":
+        return offsets
+    if granularity == "week":
+        return offsets // (24 * 7)
+    return offsets // 24
+
+
+def _as_datetime(moment: Union[date, datetime]) -> datetime:
+    if isinstance(moment, datetime):
+        return moment
+    return datetime.combine(moment, time.min)
+
+
+def _year_spans(granularity: str, start: datetime, end: datetime) -> Iterator[Tuple[int, int, int]]:
+    """(year, first bucket, last bucket + 1) for each year the range touches."""
+    for year in range(start.year, end.year + 1):
+        first = bucket_index(granularity, start) if year == start.year else 0
+        last_moment = end if year == end.year else datetime(year, 12, 31, 23)
+        yield year, first, bucket_index(granularity, last_moment) + 1
+
+
+def _root() -> str:
+    return settings.TIMESERIES_DIR or local_data_path(".timeseries")
+
+
+def _max_open_files() -> int:
+    """TIMESERIES_OPEN_FILES, or a quarter of the process's file descriptor limit."""
+    if settings.TIMESERIES_OPEN_FILES:
+        return settings.TIMESERIES_OPEN_FILES
+    if resource is None:
+        return 256
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return 4096
+    return max(16, soft // 4)
+
+
+# Every mapped file keeps a file descriptor open, so the files of all
+# tenants share one bound; an evicted file is simply mapped again when next
+# read. Writes go to the shared page cache and are not lost with the map.
+_mapped = TTLCache(maxsize=_max_open_files(), ttl=float("inf"))
+
+
+class TenantSeries:
+    """
+    Daily metrics for one tenant, held in memory-mapped NumPy column files.
+    Days without data read as zero. Files are shared with the other worker
+    processes through the page cache, so increments, which read and then
+    write a bucket, are serialized across workers by a lock file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file_path(self, table: str, year: int) -> str:
+        return os.path.join(self.path, str(year), f"{table}.f8")
+
+    def _open(self, table: str, year: int, create: bool) -> Optional[np.memmap]:
+        path = self._file_path(table, year)
+        columns = _mapped.get(path)
+        if columns is not None:
+            return columns
+        with self._lock:
+            columns = _mapped.get(path)
+            if columns is not None:
+                return columns
+            names, granularity = TABLES[table]
+            shape = (len(names), GRANULARITIES[granularity])
+            if not os.path.exists(path):
+                if not create:
+                    return None
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                try:
+                    # O_EXCL: exactly one worker sizes the file
+                    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+                    os.ftruncate(fd, shape[0] * shape[1] * 8)
+                    os.close(fd)
+                except FileExistsError:
+                    pass
+            columns = np.memmap(path, dtype=np.float64, mode="r+", shape=shape)
+            _mapped.set(path, columns)
+            return columns
+
+    def window(
+        self, table: str, start: Union[date, datetime], end: Union[date, datetime]
+    ) -> np.ndarray:
+        """
+        Columns of `table` for every bucket from start to end inclusive, as a
+        (columns, buckets) array. A range inside one year is a view of the
+        mapped file; ranges spanning years are stitched with one copy.
+        """
+        names, granularity = TABLES[table]
+        parts = []
+        for year, first, last in _year_spans(granularity, _as_datetime(start), _as_datetime(end)):
+            columns = self._open(table, year, create=False)
+            if columns is None:
+                parts.append(np.zeros((len(names), last - first)))
+            else:
+                parts.append(columns[:, first:last])
+        if not parts:
+            return np.zeros((len(names), 0))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts, axis=1)
+
+    def write(
+        self, table: str, moment: Union[date, datetime], add: bool = False, **values: float
+    ) -> None:
+        """Set (or with `add`, increment) metric values for one bucket."""
+        moment = _as_datetime(moment)
+        names, granularity = TABLES[table]
+        columns = self._open(table, moment.year, create=True)
+        index = bucket_index(granularity, moment)
+        if not add:
+            for name, value in values.items():
+                columns[names.index(name), index] = value
+            return
+        with self._locked():
+            for name, value in values.items():
+                columns[names.index(name), index] += value
+
+    def write_range(
+        self, table: str, start: Union[date, datetime], values: Dict[str, np.ndarray]
+    ) -> None:
+        """Bulk-set consecutive buckets from `start`, one array per column."""
+        names, granularity = TABLES[table]
+        start = _as_datetime(start)
+        length = len(next(iter(values.values())))
+        year, index, offset = start.year, bucket_index(granularity, start), 0
+        while offset < length:
+            available = bucket_index(granularity, datetime(year, 12, 31, 23)) + 1
+            count = min(length - offset, available - index)
+            columns = self._open(table, year, create=True)
+            for name, array in values.items():
+                columns[names.index(name), index:index + count] = array[offset:offset + count]
+            year, index, offset = year + 1, 0, offset + count
+
+    def add_many(self, table: str, hours: np.ndarray, values: np.ndarray) -> None:
+        """
+        Bulk ingest: add the (columns, n) `values` observed at the n
+        datetime64[h] `hours` into their buckets.
+        """
+        _, granularity = TABLES[table]
+        years = hours.astype("datetime64[Y]").astype(np.int64) + 1970
+        for year in np.unique(years).tolist():
+            in_year = years == year
+            columns = self._open(table, year, create=True)
+            indices = _bucket_indices(granularity, hours[in_year], year)
+            with self._locked():
+                np.add.at(columns, (slice(None), indices), values[:, in_year])
+
+    def flush(self) -> None:
+        years = [int(name) for name in os.listdir(self.path) if name.isdigit()] if os.path.isdir(self.path) else []
+        for year in years:
+            for table in TABLES:
+                columns = _mapped.peek(self._file_path(table, year))
+                if columns is not None:
+                    columns.flush()
+
+
+_series = TTLCache(maxsize=settings.TIMESERIES_OPEN_TENANTS, ttl=float("inf"))
+_series_lock = threading.Lock()
+
+
+def get_host_series() -> TenantSeries:
+    """Series for metrics of the API host itself rather than of a tenant."""
+    series = _series.get("host")
+    if series is None:
+        with _series_lock:
+            series = _series.get("host")
+            if series is None:
+                series = TenantSeries(os.path.join(_root(), "host"))
+                _series.set("host", series)
+    return series
+
+
+def get_tenant_series(tenant_id: int) -> TenantSeries:
+    series = _series.get(tenant_id)
+    if series is None:
+        with _series_lock:
+            series = _series.get(tenant_id)
+            if series is None:
+                series = TenantSeries(os.path.join(_root(), str(tenant_id)))
+                if settings.ANALYTICS_DEMO_DATA:
+                    _seed_demo_history(series, tenant_id)
+                _series.set(tenant_id, series)
+    return series
+
+
+async def open_tenant_series(tenant_id: int) -> TenantSeries:
+    """get_tenant_series for async handlers: a first open, which may seed demo data, runs in a thread."""
+    series = _series.get(tenant_id)
+    if series is None:
+        series = await run_in_threadpool(get_tenant_series, tenant_id)
+    return series
+
+
+def seed_once(series: TenantSeries, name: str) -> bool:
+    """True for exactly one caller (across workers) per tenant and `name`."""
+    os.makedirs(series.path, exist_ok=True)
+    try:
+        fd = os.open(os.path.join(series.path, f".seeded-{name}"), os.O_CREAT | os.O_EXCL)
+        os.close(fd)
+    except FileExistsError:
+        return False
+    return True
+
+
+def _seed_demo_history(series: TenantSeries, tenant_id: int) -> None:
+    """
+    With ANALYTICS_DEMO_DATA on, give each tenant a year of deterministic
+    demo history, written once and then served like real data. Otherwise
+    series start empty and read as zero until real metrics arrive.
+    """
+    days = settings.TIMESERIES_DEMO_DAYS
+    rng = np.random.default_rng(tenant_id)
+    if seed_once(series, "metrics"):
+        start = date.today() - timedelta(days=days - 1)
+        views = rng.integers(100, 1000, days).astype(np.float64)
+        clicks = np.floor(views * rng.uniform(0.1, 0.5, days))
+        orders = rng.integers(10, 100, days).astype(np.float64)
+        series.write_range("product", start, {
+            "views": views,
+            "clicks": clicks,
+            "conversions": np.floor(clicks * rng.uniform(0.05, 0.3, days)),
+        })
+        series.write_range("sales", start, {
+            "revenue": np.round(orders * rng.uniform(50, 200, days), 2),
+            "orders": orders,
+        })
+        series.write_range("system", start, {
+            "response_time": rng.uniform(100, 500, days),
+            "error_rate": rng.uniform(0.001, 0.05, days),
+            "cpu_usage": rng.uniform(20, 80, days),
+            "memory_usage": rng.uniform(30, 90, days),
+            "active_users": rng.integers(100, 1000, days).astype(np.float64),
+        })
+    if seed_once(series, "requests"):
+        # Log-normal latencies around the demo response times, up to
+        # yesterday; today fills in from the request sampler
+        start = date.today() - timedelta(days=days - 1)
+        response_time, error_rate = series.window("system", start, date.today() - timedelta(days=1))[:2]
+        requests = rng.integers(500, 5000, days - 1)
+        histograms = np.zeros((len(LATENCY_VALUES_MS), days - 1))
+        for day, (median, count) in enumerate(zip(response_time.tolist(), requests.tolist())):
+            latencies = rng.lognormal(np.log(max(median, 1.0)), 0.6, count)
+            histograms[:, day] = np.bincount(
+                np.searchsorted(LATENCY_EDGES_MS, latencies, side="right"),
+                minlength=len(LATENCY_VALUES_MS),
+            )
+        columns = {"requests": requests.astype(np.float64), "errors": np.round(requests * error_rate)}
+        columns.update((f"latency_{i}", row) for i, row in enumerate(histograms))
+        series.write_range("requests", start, columns)
+    if seed_once(series, "intents"):
+        now = np.datetime64(datetime.now().replace(microsecond=0), "h")
+        hours = np.arange(now - days * 24 + 1, now + 1, dtype="datetime64[h]")
+        rates = rng.uniform(0.5, 4.0, (len(INTENT_CATEGORIES), 1))
+        counts = rng.poisson(rates, (len(INTENT_CATEGORIES), len(hours))).astype(np.float64)
+        for granularity in GRANULARITIES:
+            series.add_many(f"intent_{granularity}", hours, counts)
+    series.flush()
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    # 0 where the denominator is 0, instead of inf/nan
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+
+_LABEL_FORMATS = {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d", "week": "%Y-%m-%d", "month": "%Y-%m"}
+
+
+@lru_cache(maxsize=64)
+def _year_labels(granularity: str, year: int) -> np.ndarray:
+    # Formatting dates dominates a query, so each year is formatted only once.
+    # Weeks are labelled by the day they start on.
+    first = datetime(year, 1, 1)
+    if granularity == "month":
+        starts = [first.replace(month=month) for month in range(1, 13)]
+    else:
+        step = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(days=7)}[granularity]
+        count = bucket_index(granularity, datetime(year, 12, 31, 23)) + 1
+        starts = [first + step * i for i in range(count)]
+    return np.array([moment.strftime(_LABEL_FORMATS[granularity]) for moment in starts])
+
+
+def bucket_labels(
+    granularity: str, start: Union[date, datetime], end: Union[date, datetime]
+) -> np.ndarray:
+    parts = [
+        _year_labels(granularity, year)[first:last]
+        for year, first, last in _year_spans(granularity, _as_datetime(start), _as_datetime(end))
+    ]
+    if not parts:
+        return np.array([], dtype=str)
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def date_labels(start: date, end: date) -> np.ndarray:
+    return bucket_labels("day", start, end)
+
+
+def product_trends(series: TenantSeries, start: date, end: date) -> Dict[str, np.ndarray]:
+    views, clicks, conversions = series.window("product", start, end)
+    return {
+        "date": date_labels(start, end),
+        "views": views.astype(np.int64),
+        "clicks": clicks.astype(np.int64),
+        "conversions": conversions.astype(np.int64),
+        "engagement_rate": np.round(_ratio(clicks, views), 2),
+    }
+
+
+def sales_performance(series: TenantSeries, start: date, end: date) -> Dict[str, np.ndarray]:
+    # One extra leading day so the first day in range has a growth rate too
+    revenue, orders = series.window("sales", start - timedelta(days=1), end)
+    previous, revenue, orders = revenue[:-1], revenue[1:], orders[1:]
+    return {
+        "date": date_labels(start, end),
+        "revenue": np.round(revenue, 2),
+        "orders": orders.astype(np.int64),
+        "average_order_value": np.round(_ratio(revenue, orders), 2),
+        "growth_rate": np.round(_ratio(revenue - previous, previous), 2),
+    }
+
+
+def latency_percentiles(histograms: np.ndarray, quantiles: Sequence[float]) -> List[np.ndarray]:
+    """Per-column latency quantiles (ms) of (buckets, n) histograms; 0 where empty."""
+    cumulative = np.cumsum(histograms, axis=0)
+    total = cumulative[-1]
+    results = []
+    for quantile in quantiles:
+        index = np.argmax(cumulative >= np.maximum(total * quantile, 1e-9), axis=0)
+        results.append(np.where(total > 0, LATENCY_VALUES_MS[index], 0.0))
+    return results
+
+
+def latency_summary(series: TenantSeries, start: date, end: date) -> Dict[str, float]:
+    """Request count, error rate and latency percentiles over the whole range."""
+    totals = series.window("requests", start, end).sum(axis=1)
+    p50, p95, p99 = latency_percentiles(totals[2:, None], (0.5, 0.95, 0.99))
+    return {
+        "requests": int(totals[0]),
+        "error_rate": round(float(totals[1] / totals[0]), 4) if totals[0] else 0.0,
+        "p50": round(float(p50[0]), 2),
+        "p95": round(float(p95[0]), 2),
+        "p99": round(float(p99[0]), 2),
+    }
+
+
+def system_metrics(
+    series: TenantSeries, start: date, end: date, host: Optional[TenantSeries] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Daily latency percentiles and error rate of the tenant's requests, and
+    the API processes' CPU and memory use from `host`. Days before the
+    sampler has data for them fall back to the stored system columns.
+    """
+    response_time, error_rate, cpu_usage, memory_usage, active_users = series.window(
+        "system", start, end
+    )
+    requests = series.window("requests", start, end)
+    count, errors, histograms = requests[0], requests[1], requests[2:]
+    p50, p95, p99 = latency_percentiles(histograms, (0.5, 0.95, 0.99))
+    measured = count > 0
+    if host is not None:
+        cpu_sum, memory_sum, samples = host.window("process", start, end)
+        sampled = samples > 0
+        cpu_usage = np.where(sampled, _ratio(cpu_sum, samples), cpu_usage)
+        memory_usage = np.where(sampled, _ratio(memory_sum, samples), memory_usage)
+    return {
+        "date": date_labels(start, end),
+        "response_time": np.round(np.where(measured, p50, response_time), 2),
+        "p50": np.round(p50, 2),
+        "p95": np.round(p95, 2),
+        "p99": np.round(p99, 2),
+        "requests": count.astype(np.int64),
+        "error_rate": np.round(np.where(measured, _ratio(errors, count), error_rate), 4),
+        "cpu_usage": np.round(cpu_usage, 2),
+        "memory_usage": np.round(memory_usage, 2),
+        "active_users": active_users.astype(np.int64),
+    }
+
+
+def lttb_indices(values: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Indices of at most `max_points` points of `values` (evenly spaced in x)
+    that keep the shape of the series, by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept, and the rest are split into
+    buckets that each keep their point forming the largest triangle with
+    their neighbours. The left neighbour is the previous bucket's average
+    rather than its chosen point, which lets every bucket be solved at once
+    as one array op instead of a Python loop.
+    """
+    n = len(values)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    y = values.astype(np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    sizes = ends - starts
+
+    # Bucket averages; the outer neighbours are the fixed end points
+    sums = np.add.reduceat(y[1:n - 1], starts - 1)
+    mean_x = np.concatenate(([0.0], (starts + ends - 1) / 2, [n - 1.0]))
+    mean_y = np.concatenate(([y[0]], sums / sizes, [y[-1]]))
+    ax, ay = mean_x[:-2, None], mean_y[:-2, None]
+    cx, cy = mean_x[2:, None], mean_y[2:, None]
+
+    # One row per bucket, padded to the largest bucket
+    candidates = starts[:, None] + np.arange(sizes.max())
+    valid = candidates < ends[:, None]
+    candidates = np.where(valid, candidates, starts[:, None])
+    area = np.abs((ax - cx) * (y[candidates] - ay) - (ax - candidates) * (cy - ay))
+    area[~valid] = -1.0
+    chosen = candidates[np.arange(len(starts)), area.argmax(axis=1)]
+    return np.concatenate(([0], chosen, [n - 1]))
+
+
+def downsample(columns: Dict[str, np.ndarray], by: str, max_points: int) -> Dict[str, np.ndarray]:
+    """Keep the same LTTB-selected rows of every column, chosen on column `by`."""
+    indices = lttb_indices(columns[by], max_points)
+    if len(indices) == len(columns[by]):
+        return columns
+    return {name: column[indices] for name, column in columns.items()}
+
+
+def to_records(columns: Dict[str, np.ndarray]) -> List[dict]:
+    """Turn column arrays into the list-of-rows shape the API returns."""
+    names: Sequence[str] = list(columns)
+    return [dict(zip(names, row)) for row in zip(*(columns[name].tolist() for name in names))]
+
+
+def record_intent_queries(
+    series: TenantSeries, categories: Sequence[str], times: Sequence[datetime]
+) -> None:
+    """Count classified queries at every granularity: one bulk add per level."""
+    rows = np.array([INTENT_CATEGORIES.index(category) for category in categories], dtype=np.intp)
+    counts = np.zeros((len(INTENT_CATEGORIES), len(rows)))
+    counts[rows, np.arange(len(rows))] = 1.0
+    hours = np.array(times, dtype="datetime64[h]")
+    for granularity in GRANULARITIES:
+        series.add_many(f"intent_{granularity}", hours, counts)
+
+
+def intent_counts(
+    series: TenantSeries, start: datetime, end: datetime, granularity: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Bucket labels and the (categories, buckets) count matrix for a range."""
+    counts = series.window(f"intent_{granularity}", start, end).astype(np.int64)
+    return bucket_labels(granularity, start, end), counts
+
+
+def intent_trends(
+    series: TenantSeries, start: datetime, end: datetime, granularity: str
+) -> List[dict]:
+    labels, counts = intent_counts(series, start, end, granularity)
+    totals = counts.sum(axis=0).tolist()
+    per_category = [row.tolist() for row in counts]
+    return [
+        {
+            "date": label,
+            "intents": {category: per_category[c][i] for c, category in enumerate(INTENT_CATEGORIES)},
+            "total_queries": totals[i],
+        }
+        for i, label in enumerate(labels.tolist())
+    ]
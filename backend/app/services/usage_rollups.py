@@ -0,0 +1,208 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, bindparam, func, literal, select, true
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core.config import settings
+from app.db.database import async_engine, upsert_insert
+from app.models.billing import UsageRollupDaily, UsageRollupHourly, UsageStats
+from app.schemas.billing import UsageRollupResponse
+
+logger = logging.getLogger(__name__)
+
+_hourly = UsageRollupHourly.__table__
+_daily = UsageRollupDaily.__table__
+_usage = UsageStats.__table__
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _gauges_from_usage_stats(bucket: datetime, calls):
+    return select(
+        _usage.c.user_id,
+        literal(bucket, _hourly.c.bucket_start.type),
+        calls,
+        func.coalesce(_usage.c.storage_used, 0),
+        func.coalesce(_usage.c.team_members_used, 0),
+    )
+
+
+async def add_hourly_api_calls(
+    conn: AsyncConnection, counts: Sequence[Tuple[int, int]], now: datetime
+) -> None:
+    """
+    Add flushed API calls to the current hour's rollup rows, refreshing the
+    storage/team gauges from usage_stats at the same time. Runs inside the
+    meter's flush transaction so the rollups never drift from the totals.
+    """
+    stmt = upsert_insert(_hourly).from_select(
+        list(_hourly.c.keys()),
+        _gauges_from_usage_stats(hour_bucket(now), bindparam("b_calls")).where(
+            _usage.c.user_id == bindparam("b_user_id")
+        ),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_hourly.c.user_id, _hourly.c.bucket_start],
+        set_={
+            "api_calls": _hourly.c.api_calls + stmt.excluded.api_calls,
+            "storage_used": stmt.excluded.storage_used,
+            "team_members_used": stmt.excluded.team_members_used,
+        },
+    )
+    await conn.execute(
+        stmt, [{"b_user_id": user_id, "b_calls": calls} for user_id, calls in counts]
+    )
+
+
+async def _snapshot_gauges(conn: AsyncConnection, now: datetime) -> None:
+    # Idle users make no API calls but still hold storage and seats
+    stmt = upsert_insert(_hourly).from_select(
+        list(_hourly.c.keys()),
+        _gauges_from_usage_stats(hour_bucket(now), literal(0)).where(true()),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_hourly.c.user_id, _hourly.c.bucket_start],
+        set_={
+            "storage_used": stmt.excluded.storage_used,
+            "team_members_used": stmt.excluded.team_members_used,
+        },
+    )
+    await conn.execute(stmt)
+
+
+async def _fold_day(conn: AsyncConnection, day: datetime) -> None:
+    hours = and_(
+        _hourly.c.bucket_start >= day, _hourly.c.bucket_start < day + timedelta(days=1)
+    )
+    stmt = upsert_insert(_daily).from_select(
+        list(_daily.c.keys()),
+        select(
+            _hourly.c.user_id,
+            literal(day, _daily.c.bucket_start.type),
+            func.sum(_hourly.c.api_calls),
+            func.max(_hourly.c.storage_used),
+            func.max(_hourly.c.team_members_used),
+        )
+        .where(hours)
+        .group_by(_hourly.c.user_id),
+    )
+    # Folding recomputes the whole day, so running it again is harmless
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_daily.c.user_id, _daily.c.bucket_start],
+        set_={
+            "api_calls": stmt.excluded.api_calls,
+            "storage_used": stmt.excluded.storage_used,
+            "team_members_used": stmt.excluded.team_members_used,
+        },
+    )
+    await conn.execute(stmt)
+
+
+class UsageCompactor:
+    """
+    Periodically folds hourly rollups into daily ones and applies retention:
+    hourly rows are kept for USAGE_HOURLY_RETENTION_DAYS, daily rows for
+    USAGE_DAILY_RETENTION_DAYS.
+    """
+
+    def __init__(self, interval: float = settings.USAGE_COMPACTION_INTERVAL):
+        self.interval = interval
+        self._folded_through: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def compact(self, now: Optional[datetime] = None) -> None:
+        now = now or datetime.utcnow()
+        today = day_bucket(now)
+        hourly_cutoff = today - timedelta(days=settings.USAGE_HOURLY_RETENTION_DAYS)
+        daily_cutoff = today - timedelta(days=settings.USAGE_DAILY_RETENTION_DAYS)
+        # Re-fold every day touched since the last pass; on the first pass,
+        # every day that still has its full set of hourly rows
+        day = max(self._folded_through or hourly_cutoff, hourly_cutoff)
+
+        async with async_engine.begin() as conn:
+            await _snapshot_gauges(conn, now)
+            while day <= today:
+                await _fold_day(conn, day)
+                day += timedelta(days=1)
+            await conn.execute(_hourly.delete().where(_hourly.c.bucket_start < hourly_cutoff))
+            await conn.execute(_daily.delete().where(_daily.c.bucket_start < daily_cutoff))
+        self._folded_through = today
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.compact()
+            except Exception:
+                logger.exception("Usage rollup compaction failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+usage_compactor = UsageCompactor()
+
+
+async def get_daily_usage(
+    db: AsyncSession, user_id: int, days: int, pending_calls: int = 0
+) -> List[UsageRollupResponse]:
+    """
+    Per-day usage for the last `days` days, oldest first. Completed days come
+    straight from the daily rollups; today is summed from its hourly rows,
+    plus any calls still buffered in memory.
+    """
+    now = datetime.utcnow()
+    today = day_bucket(now)
+    start = today - timedelta(days=days - 1)
+
+    result = await db.execute(
+        select(UsageRollupDaily)
+        .filter(
+            UsageRollupDaily.user_id == user_id,
+            UsageRollupDaily.bucket_start >= start,
+            UsageRollupDaily.bucket_start < today,
+        )
+        .order_by(UsageRollupDaily.bucket_start)
+    )
+    history = [UsageRollupResponse.model_validate(row) for row in result.scalars()]
+
+    result = await db.execute(
+        select(
+            func.sum(UsageRollupHourly.api_calls),
+            func.max(UsageRollupHourly.storage_used),
+            func.max(UsageRollupHourly.team_members_used),
+        ).filter(
+            UsageRollupHourly.user_id == user_id,
+            UsageRollupHourly.bucket_start >= today,
+        )
+    )
+    api_calls, storage_used, team_members_used = result.one()
+    if api_calls is not None or pending_calls:
+        history.append(
+            UsageRollupResponse(
+                bucket_start=today,
+                api_calls=(api_calls or 0) + pending_calls,
+                storage_used=storage_used or 0,
+                team_members_used=team_members_used or 0,
+            )
+        )
+    return history
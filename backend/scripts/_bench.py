@@ -0,0 +1,102 @@
+"""
+Helpers shared by the benchmark scripts in this directory.
+
+The scripts run the app in-process over an ASGI transport, against a
+throwaway SQLite database unless DATABASE_URL is already set, so they need
+nothing but the app's own requirements. Run them from backend/, e.g.
+
+    python -m scripts.bench_api_load --help
+"""
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Type
+
+
+def use_temp_database() -> str:
+    """Point the app at a fresh SQLite file; call before importing anything from app."""
+    if "app.core.config" in sys.modules:
+        # The settings are read once, at import; it is too late to switch
+        raise RuntimeError("use_temp_database() must run before the app's settings are imported")
+    if "DATABASE_URL" not in os.environ:
+        directory = tempfile.mkdtemp(prefix="perche-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'app.db')}"
+    return os.environ["DATABASE_URL"]
+
+
+@asynccontextmanager
+async def app_client() -> AsyncIterator["httpx.AsyncClient"]:
+    """An httpx client talking to the app in-process, with its lifespan running."""
+    import httpx
+
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            yield client
+
+
+async def sign_in(client, username: str = "admin", password: str = "demo1234") -> Dict[str, str]:
+    response = await client.post("/api/v1/auth/signin", json={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def describe_latencies(latencies: List[float]) -> str:
+    """p50/p99 of latencies in seconds, as milliseconds."""
+    return (
+        f"p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+        f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms"
+    )
+
+
+def best_of(repeat: int, func, *args) -> float:
+    """Fastest of `repeat` timed calls, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Keep-alive handler for stub stores; subclasses implement do_GET."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_body(self, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_stub_store(handler: Type[BaseHTTPRequestHandler]) -> str:
+    """Run a local HTTP server in a daemon thread; returns its base URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
@@ -0,0 +1,56 @@
+"""
+Load an API endpoint with concurrent requests and report throughput and
+latency. Behind the figures for the async SQLAlchemy session change; the
+endpoints are plain HTTP, so it also runs on older checkouts for a
+before/after comparison.
+
+    python -m scripts.bench_api_load --path /api/v1/billing/current-plan \
+        --requests 1000 --concurrency 10 100
+"""
+import argparse
+import asyncio
+import time
+
+from scripts._bench import app_client, describe_latencies, sign_in, use_temp_database
+
+
+async def _load(client, path: str, headers, requests: int, concurrency: int) -> None:
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"concurrency {concurrency}: {requests / elapsed:.0f} req/s, "
+        f"{describe_latencies(latencies)}, {errors} errors"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with app_client() as client:
+        headers = await sign_in(client)
+        # Warm caches and the connection pool first
+        for _ in range(20):
+            await client.get(args.path, headers=headers)
+        for concurrency in args.concurrency:
+            await _load(client, args.path, headers, args.requests, concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/api/v1/billing/current-plan")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100])
+    use_temp_database()
+    asyncio.run(main(parser.parse_args()))
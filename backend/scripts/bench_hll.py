@@ -0,0 +1,76 @@
+"""
+HyperLogLog accuracy, size and speed on random 64-bit hashes: estimate
+error by cardinality, blob sizes, the memory an exact set would take,
+add() throughput, and merging a year of day sketches.
+
+    python -m scripts.bench_hll --trials 20
+"""
+import argparse
+import math
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.services.activity import HyperLogLog
+
+
+def _errors(rng: np.random.Generator, sizes, trials: int) -> None:
+    for n in sizes:
+        errors = []
+        for _ in range(trials):
+            sketch = HyperLogLog()
+            sketch.add_hashes(rng.integers(0, 2**64, n, dtype=np.uint64))
+            errors.append(sketch.count() / n - 1)
+        rms = math.sqrt(sum(error * error for error in errors) / len(errors))
+        print(f"n={n:>9,}  rms error {rms:.2%}, max {max(map(abs, errors)):.2%} ({trials} trials)")
+
+
+def _sizes(rng: np.random.Generator) -> None:
+    for n in (500, 1_000_000):
+        sketch = HyperLogLog()
+        sketch.add_hashes(rng.integers(0, 2**64, n, dtype=np.uint64))
+        print(f"sketch at n={n:,}: {len(sketch.registers) // 1024} KiB raw, {len(sketch.to_bytes()):,} byte blob")
+
+    tracemalloc.start()
+    ids = {f"user-{i}" for i in range(1_000_000)}
+    exact = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del ids
+    print(f"exact set of 1M ids: {exact / 2**20:.0f} MB")
+
+
+def _speed(rng: np.random.Generator) -> None:
+    hashes = rng.integers(0, 2**64, 1_000_000, dtype=np.uint64)
+    sketch = HyperLogLog()
+    start = time.perf_counter()
+    sketch.add_hashes(hashes)
+    print(f"add: {(time.perf_counter() - start) * 1000:.0f}ms per 1M hashes")
+
+    # A year of days, each drawing its users from a shared audience
+    audience = rng.integers(0, 2**64, 200_000, dtype=np.uint64)
+    blobs, seen = [], np.zeros(len(audience), dtype=bool)
+    for _ in range(365):
+        users = rng.choice(len(audience), 3000, replace=False)
+        seen[users] = True
+        day = HyperLogLog()
+        day.add_hashes(audience[users])
+        blobs.append(day.to_bytes())
+    start = time.perf_counter()
+    merged = HyperLogLog()
+    for blob in blobs:
+        merged.merge(HyperLogLog.from_bytes(blob))
+    estimate = merged.count()
+    elapsed = time.perf_counter() - start
+    print(f"merge 365 day blobs: {elapsed * 1000:.0f}ms; {estimate:,} estimated vs {int(seen.sum()):,} true")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=20)
+    args = parser.parse_args()
+    rng = np.random.default_rng(1)
+    _errors(rng, (100, 1_000, 10_000), args.trials)
+    _errors(rng, (100_000, 1_000_000), max(1, args.trials // 4))
+    _sizes(rng)
+    _speed(rng)
@@ -0,0 +1,87 @@
+"""
+The pooled outbound HTTP client against requests, on a local keep-alive
+stub store serving a 1KB products.json: sequential calls, a burst of
+concurrent calls, and the per-host cap against a host that takes 20ms.
+
+    python -m scripts.bench_http_client --calls 300
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from app.core.config import settings
+from app.services.http_client import create_http_client
+from scripts._bench import StubHandler, serve_stub_store
+
+PRODUCTS = json.dumps({
+    "products": [
+        {"id": index, "title": f"Widget {index}", "handle": f"widget-{index}", "variants": []}
+        for index in range(14)
+    ]
+}).encode()
+
+
+class StoreHandler(StubHandler):
+    def do_GET(self) -> None:
+        if self.path.startswith("/slow"):
+            time.sleep(0.02)
+        self.send_body(PRODUCTS, "application/json")
+
+
+async def _pooled(url: str, calls: int):
+    async with create_http_client() as client:
+        await client.get(url)
+        start = time.perf_counter()
+        for _ in range(calls):
+            await client.get(url)
+        sequential = (time.perf_counter() - start) / calls
+        start = time.perf_counter()
+        await asyncio.gather(*(client.get(url) for _ in range(calls)))
+        return sequential, time.perf_counter() - start
+
+
+async def _capped(url: str, calls: int) -> float:
+    async with create_http_client() as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client.get(url) for _ in range(calls)))
+        return time.perf_counter() - start
+
+
+def main(args: argparse.Namespace) -> None:
+    base = serve_stub_store(StoreHandler)
+    url = f"{base}/products.json"
+    print(f"stub store: {len(PRODUCTS)} byte products.json")
+
+    requests.get(url, timeout=10)
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        requests.get(url, timeout=10)
+    sequential = (time.perf_counter() - start) / args.calls
+    with ThreadPoolExecutor(args.threads) as executor:
+        start = time.perf_counter()
+        list(executor.map(lambda _: requests.get(url, timeout=10), range(args.calls)))
+        threaded = time.perf_counter() - start
+
+    pooled_sequential, pooled_concurrent = asyncio.run(_pooled(url, args.calls))
+    print(f"sequential: requests.get {sequential * 1000:.1f}ms/call, pooled client {pooled_sequential * 1000:.1f}ms/call")
+    print(
+        f"{args.calls} concurrent: requests + {args.threads} threads {threaded * 1000:.0f}ms, "
+        f"pooled {pooled_concurrent * 1000:.0f}ms"
+    )
+
+    per_host = settings.HTTP_CLIENT_MAX_PER_HOST
+    elapsed = asyncio.run(_capped(f"{base}/slow/products.json", args.slow_calls))
+    waves = -(-args.slow_calls // per_host)
+    print(f"{args.slow_calls} concurrent to a 20ms host with {per_host}/host cap: {elapsed * 1000:.0f}ms ({waves} waves)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=40, help="threads for the concurrent requests run")
+    parser.add_argument("--slow-calls", type=int, default=60)
+    main(parser.parse_args())
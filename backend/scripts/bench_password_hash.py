@@ -0,0 +1,51 @@
+"""
+Burst of concurrent signins while a probe keeps requesting a cheap
+endpoint: shows whether password hashing starves the rest of the API.
+Behind the figures for the bcrypt process pool; it also runs on older
+checkouts for a before/after comparison.
+
+    python -m scripts.bench_password_hash --signins 60 --probe /api/v1/billing/plans
+"""
+import argparse
+import asyncio
+import time
+
+from scripts._bench import app_client, describe_latencies, sign_in, use_temp_database
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with app_client() as client:
+        headers = await sign_in(client)
+        probe_latencies = []
+        statuses = {}
+        done = asyncio.Event()
+
+        async def probe() -> None:
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get(args.probe, headers=headers)
+                probe_latencies.append(time.perf_counter() - start)
+
+        async def signin() -> None:
+            response = await client.post(
+                "/api/v1/auth/signin", json={"username": "admin", "password": "demo1234"}
+            )
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(signin() for _ in range(args.signins)))
+        burst = time.perf_counter() - start
+        done.set()
+        await prober
+
+        print(f"{args.signins} signins in {burst:.1f}s, statuses {statuses}")
+        print(f"probe completed {len(probe_latencies)} requests, {describe_latencies(probe_latencies)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--signins", type=int, default=60)
+    parser.add_argument("--probe", default="/api/v1/billing/plans")
+    use_temp_database()
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""
+ProductMatcher on a synthetic catalog: batch matching against a naive
+substring scan over every name, and adding products incrementally against
+rebuilding the matcher.
+
+    python -m scripts.bench_product_matcher --products 50000 --queries 2000
+"""
+import argparse
+import random
+import time
+
+from app.services.product_matcher import ProductMatcher, normalize, product_names
+
+_BRANDS = ["acme", "globex", "initech", "umbrella", "stark", "wayne", "wonka", "tyrell", "cyberdyne", "soylent"]
+_KINDS = ["phone", "laptop", "tablet", "watch", "speaker", "camera", "headphones", "monitor", "keyboard", "drone"]
+_WORDS = ["pro", "max", "mini", "air", "ultra", "lite", "plus", "neo", "go", "x"]
+_COLORS = ["black", "white", "silver", "blue", "red", "green"]
+
+
+def _catalog(products: int, rng: random.Random):
+    catalog = []
+    for index in range(products):
+        title = f"{rng.choice(_BRANDS)} {rng.choice(_KINDS)} {rng.choice(_WORDS)} {index}"
+        variants = [{"title": color} for color in rng.sample(_COLORS, rng.randint(0, 2))]
+        catalog.append({"id": index, "title": title, "handle": title.replace(" ", "-"), "variants": variants})
+    return catalog
+
+
+def _queries(catalog, count: int, rng: random.Random):
+    queries = []
+    for _ in range(count):
+        product = rng.choice(catalog)
+        queries.append(f"is the {product['title']} worth it compared to other {rng.choice(_KINDS)}s?")
+    return queries
+
+
+def _naive_match(names, text: str):
+    text = normalize(text)
+    return sorted({name for pattern, name in names if pattern in text})
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(1)
+    catalog = _catalog(args.products, rng)
+    queries = _queries(catalog, args.queries, rng)
+    names = [(pattern, str(product["title"])) for product in catalog for pattern in product_names(product)]
+    print(f"{args.products} products, {len(names)} names, {args.queries} queries")
+
+    matcher = ProductMatcher()
+    start = time.perf_counter()
+    matcher.update(catalog)
+    print(f"build                {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    matches = matcher.match_batch(queries)
+    elapsed = time.perf_counter() - start
+    print(f"batch match          {elapsed / len(queries) * 1e6:.0f}us/query")
+
+    sample = queries[:args.naive_queries]
+    start = time.perf_counter()
+    naive = [_naive_match(names, query) for query in sample]
+    naive_elapsed = (time.perf_counter() - start) / len(sample)
+    # The matcher keeps only the longest of overlapping names, so compare
+    # on the products found rather than on every substring hit
+    agree = sum(set(found) <= set(expected) for found, expected in zip(matches, naive))
+    print(
+        f"naive substring      {naive_elapsed * 1000:.1f}ms/query "
+        f"({naive_elapsed / (elapsed / len(queries)):.0f}x slower), "
+        f"{agree}/{len(sample)} queries agree"
+    )
+
+    added = _catalog(args.products + args.added, rng)[args.products:]
+    start = time.perf_counter()
+    matcher.update(catalog + added)
+    incremental = time.perf_counter() - start
+    start = time.perf_counter()
+    ProductMatcher().update(catalog + added)
+    rebuild = time.perf_counter() - start
+    label = f"add {args.added} products"
+    print(f"{label:<21}{incremental * 1000:.0f}ms incremental vs {rebuild:.1f}s full rebuild")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--naive-queries", type=int, default=200, help="queries timed with the naive scan")
+    parser.add_argument("--added", type=int, default=100)
+    main(parser.parse_args())
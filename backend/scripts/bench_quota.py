@@ -0,0 +1,60 @@
+"""
+Cost of the API call quota: QuotaStore.consume() on its own, and requests
+to a quota-enforced endpoint with the quota on and off.
+
+    python -m scripts.bench_quota --calls 100000 --requests 500
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from scripts._bench import app_client, describe_latencies, sign_in, use_temp_database
+
+
+def _consume(calls: int) -> None:
+    from app.services.quota import QuotaStore
+
+    path = os.path.join(tempfile.mkdtemp(prefix="perche-bench-"), "bench.quota")
+    store = QuotaStore(path, slots=4096, ways=8, stripes=64)
+    store.load(1, limit=calls * 2, used=0, resets_at=0.0)
+    start = time.perf_counter()
+    for _ in range(calls):
+        store.consume(1)
+    elapsed = time.perf_counter() - start
+    store.close()
+    print(f"consume(): {elapsed / calls * 1e6:.1f}us per call")
+
+
+async def _requests(path: str, requests: int) -> None:
+    from sqlalchemy import text
+
+    from app.core.config import settings
+    from app.db.database import engine
+
+    async with app_client() as client:
+        headers = await sign_in(client)
+        # A limit the run cannot reach, so every call is charged and admitted
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE usage_stats SET api_calls_limit = 100000000"))
+        for enabled in (True, False):
+            settings.QUOTA_ENABLED = enabled
+            await client.get(path, headers=headers)
+            latencies = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - start)
+            print(f"{path} with the quota {'on' if enabled else 'off'}: {describe_latencies(latencies)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--path", default="/api/v1/dashboard/stats")
+    args = parser.parse_args()
+    use_temp_database()
+    _consume(args.calls)
+    asyncio.run(_requests(args.path, args.requests))
@@ -0,0 +1,74 @@
+"""
+Database startup cost: ensure_database_ready on an empty and on an
+up-to-date database, the create_all + init_db pass every worker used to
+run at import, and several workers starting together on an empty database.
+
+    python -m scripts.bench_startup --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from scripts._bench import best_of
+
+
+def _fresh_database() -> str:
+    directory = tempfile.mkdtemp(prefix="perche-bench-")
+    return f"sqlite:///{os.path.join(directory, 'app.db')}"
+
+
+def _start_worker(database_url: str, barrier) -> bool:
+    os.environ["DATABASE_URL"] = database_url
+    from app.db.bootstrap import ensure_database_ready
+
+    barrier.wait()
+    return ensure_database_ready()
+
+
+def _timings() -> None:
+    from app.db.bootstrap import ensure_database_ready
+    from app.db.database import Base, SessionLocal, engine
+    from app.db.init_db import init_db
+
+    start = time.perf_counter()
+    ensure_database_ready()
+    print(f"ensure_database_ready, empty database:       {(time.perf_counter() - start) * 1000:.0f}ms")
+    print(f"ensure_database_ready, fingerprint current:  {best_of(5, ensure_database_ready) * 1000:.1f}ms")
+
+    def import_time_init() -> None:
+        Base.metadata.create_all(bind=engine)
+        with SessionLocal() as db:
+            init_db(db)
+
+    print(f"create_all + init_db, as at import before:   {best_of(5, import_time_init) * 1000:.1f}ms")
+
+
+def _concurrent_start(workers: int) -> None:
+    database_url = _fresh_database()
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        barrier = manager.Barrier(workers)
+        with context.Pool(workers) as pool:
+            initialized = pool.starmap(_start_worker, [(database_url, barrier)] * workers)
+
+    from sqlalchemy import create_engine, text
+
+    with create_engine(database_url).connect() as connection:
+        admins = connection.execute(text("SELECT COUNT(*) FROM users WHERE username = 'admin'")).scalar()
+        plans = connection.execute(text("SELECT COUNT(*) FROM billing_plans")).scalar()
+    print(
+        f"{workers} workers started together on an empty database: "
+        f"{sum(initialized)} initialized, {workers - sum(initialized)} skipped, "
+        f"{admins} admin row(s), {plans} plans"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", _fresh_database())
+    _timings()
+    _concurrent_start(args.workers)
@@ -0,0 +1,120 @@
+"""
+Shopify storefront detection on synthetic storefront-sized pages: the
+streaming ShopifyDetector against the BeautifulSoup check it replaced
+(skipped when beautifulsoup4 is not installed), then validate-connection
+end to end against a local stub store.
+
+    python -m scripts.bench_storefront
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from scripts._bench import StubHandler, app_client, serve_stub_store, sign_in, use_temp_database
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:  # no longer a backend requirement
+    BeautifulSoup = None
+
+
+def _css(rules: int) -> str:
+    return "".join(f".c{i}{{margin:{i % 7}px;color:#{i * 2654435761 % 0xffffff:06x}}}" for i in range(rules))
+
+
+def _grid(cards: int) -> str:
+    return "".join(
+        f'<div class="card"><a href="/products/p-{i}"><img src="//cdn.example.net/i/{i}.jpg" alt="Product {i}">'
+        f'</a><h3>Product {i}</h3><span class="price">$ {i % 100}.99</span><p>{"lorem ipsum dolor sit amet " * 8}</p></div>'
+        for i in range(cards)
+    )
+
+
+def shopify_page() -> bytes:
+    head = (
+        '<!doctype html><html><head><meta charset="utf-8"><title>Store</title>'
+        + '<meta property="og:x" content="y">' * 200
+        + f'<style>{_css(3000)}</style><script type="application/ld+json">{json.dumps({"items": list(range(5000))})}</script>'
+        + '<script src="//cdn.shopify.com/s/files/1/0001/t/1/assets/theme.js?v=1" defer></script></head>'
+    )
+    return (head + f"<body>{_grid(6000)}</body></html>").encode()
+
+
+def other_page() -> bytes:
+    head = (
+        '<!DOCTYPE html><html><head><title>WP</title>'
+        + '<link rel="stylesheet" href="/wp-content/x.css">' * 50
+        + f'<style>{_css(1500)}</style><script src="/wp-includes/js/jquery.js"></script></head>'
+    )
+    return (head + f"<body>{_grid(5000)}</body></html>").encode()
+
+
+PAGES = {"/shopify": shopify_page(), "/other": other_page()}
+# Same body as /other; only the response headers say Shopify
+PAGES["/shopify-header"] = PAGES["/other"]
+
+
+class StoreHandler(StubHandler):
+    def do_GET(self) -> None:
+        headers = {"X-ShopId": "1"} if self.path == "/shopify-header" else {}
+        try:
+            self.send_body(PAGES[self.path], "text/html; charset=utf-8", headers)
+        except (BrokenPipeError, ConnectionResetError):
+            # The detector hangs up once it has its answer
+            pass
+
+
+def _detect(page: bytes, chunk: int):
+    from app.services.storefront import ShopifyDetector
+
+    detector = ShopifyDetector()
+    for offset in range(0, len(page), chunk):
+        verdict = detector.feed(page[offset:offset + chunk])
+        if verdict is not None:
+            return verdict, detector.seen
+    return detector.close(), detector.seen
+
+
+def _bs4_detect(page: bytes) -> bool:
+    soup = BeautifulSoup(page.decode(), "html.parser")
+    return bool(soup.find_all("script", {"src": lambda src: src and "shopify" in src.lower()}))
+
+
+def _offline(chunk: int) -> None:
+    for name in ("/shopify", "/other"):
+        page = PAGES[name]
+        _detect(page, chunk)
+        start = time.perf_counter()
+        for _ in range(50):
+            verdict, seen = _detect(page, chunk)
+        detector = (time.perf_counter() - start) / 50
+        line = f"{name} ({len(page) / 2**20:.1f}MB): detector {verdict} {detector * 1000:.2f}ms, {seen // 1024}KB read"
+        if BeautifulSoup is not None:
+            start = time.perf_counter()
+            expected = _bs4_detect(page)
+            line += f"; bs4 {expected} {(time.perf_counter() - start) * 1000:.0f}ms"
+        print(line)
+
+
+async def _endpoint(base: str) -> None:
+    async with app_client() as client:
+        headers = await sign_in(client)
+        for name in ("/shopify", "/other", "/shopify-header"):
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/v1/sdk-wizard/validate-connection",
+                headers=headers,
+                json={"platform": "shopify", "store_url": base + name},
+            )
+            elapsed = time.perf_counter() - start
+            print(f"validate-connection {name}: {response.status_code} in {elapsed * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk", type=int, default=16384, help="bytes fed to the detector at a time")
+    args = parser.parse_args()
+    use_temp_database()
+    _offline(args.chunk)
+    asyncio.run(_endpoint(serve_stub_store(StoreHandler)))
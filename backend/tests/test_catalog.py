@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from app.services import catalog
+from app.services.jobs import FAILED, JobRunner
+
+
+@pytest.fixture
+def failing_writer(monkeypatch):
+    fetched = []
+
+    async def fetch_catalog(store_url, queue, progress):
+        # More pages than the queue holds, so the fetcher is still waiting
+        # on the writer when it fails
+        for page in range(10):
+            await queue.put([{"id": page}])
+            fetched.append(page)
+
+    async def store_pages(user_id, started_at, queue, progress, on_progress):
+        await queue.get()
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(catalog, "_fetch_catalog", fetch_catalog)
+    monkeypatch.setattr(catalog, "_store_pages", store_pages)
+    return fetched
+
+
+def test_writer_failure_is_raised_and_stops_the_fetcher(failing_writer):
+    with pytest.raises(RuntimeError, match="database is locked"):
+        asyncio.run(catalog.extract_shopify_catalog(1, "https://shop.example"))
+    assert len(failing_writer) < 10
+
+
+def test_writer_failure_fails_the_job(failing_writer):
+    updates = []
+
+    async def scenario():
+        runner = JobRunner(workers=1)
+        runner.register(catalog.CATALOG_EXTRACTION, catalog.run_extraction_job)
+
+        async def update(job_id, **values):
+            updates.append(values)
+            return True
+
+        runner._update = update
+        await runner._run_job("job", 1, catalog.CATALOG_EXTRACTION, {"store_url": "https://shop.example"})
+
+    asyncio.run(scenario())
+    assert updates[-1]["status"] == FAILED
+    assert updates[-1]["error"] == "database is locked"
+
+
+def test_handler_cancelled_from_inside_fails_the_job():
+    updates = []
+
+    async def handler(user_id, params, report):
+        raise asyncio.CancelledError()
+
+    async def scenario():
+        runner = JobRunner(workers=1)
+        runner.register("cancelled", handler)
+
+        async def update(job_id, **values):
+            updates.append(values)
+            return True
+
+        runner._update = update
+        await runner._run_job("job", 1, "cancelled", {})
+
+    asyncio.run(scenario())
+    assert updates[-1]["status"] == FAILED
+    assert updates[-1]["error"] == "The job was cancelled"
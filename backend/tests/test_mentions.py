@@ -0,0 +1,62 @@
+import os
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.cache import TTLCache
+from app.services import mentions
+from app.services.mentions import MentionTracker, SpaceSaving, _write_json
+
+
+@pytest.fixture
+def trackers(monkeypatch, tmp_path):
+    monkeypatch.setattr(mentions, "_trackers", TTLCache(maxsize=1, ttl=float("inf")))
+    monkeypatch.setattr(mentions, "_unsaved", {})
+    monkeypatch.setattr(
+        mentions, "get_tenant_series", lambda tenant_id: SimpleNamespace(path=str(tmp_path / str(tenant_id)))
+    )
+    return mentions
+
+
+def _shard(path: str, counts: dict) -> None:
+    sketch = SpaceSaving(10)
+    for item, count in counts.items():
+        sketch.add(item, count)
+    _write_json(path, sketch.to_dict())
+
+
+def test_compacting_already_merged_shards_does_not_count_them_twice(tmp_path):
+    first = MentionTracker(str(tmp_path), 10)
+    second = MentionTracker(str(tmp_path), 10)
+    day = (date.today() - timedelta(days=3)).isoformat()
+    day_path = os.path.join(str(tmp_path), f"{day}.json")
+    shards = [os.path.join(str(tmp_path), f"{day}.{worker}.json") for worker in ("a", "b")]
+    _shard(shards[0], {"iPhone": 2})
+    _shard(shards[1], {"iPhone": 3})
+
+    first._compact_day(day_path, shards)
+    # The other worker listed the shards before they were merged
+    second._compact_day(day_path, shards)
+
+    assert not any(os.path.exists(path) for path in shards)
+    assert second._load(day_path).counts == {"iPhone": 5}
+
+
+def test_evicted_tracker_is_reused_until_checkpointed(trackers):
+    tracker = trackers.get_mention_tracker(1)
+    tracker.record("iPhone")
+    trackers.get_mention_tracker(2)
+
+    # Evicted with a live sketch: the same tracker comes back
+    assert trackers.get_mention_tracker(1) is tracker
+    trackers.get_mention_tracker(2)
+    trackers.checkpoint_mentions()
+    assert set(trackers._unsaved) == {2}
+
+    # A fresh tracker carries on from this worker's checkpoint
+    reopened = trackers.get_mention_tracker(1)
+    assert reopened is not tracker
+    reopened.record("iPhone")
+    today = date.today()
+    assert reopened.top(today, today, 5).counts == {"iPhone": 2}
@@ -0,0 +1,155 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+import pytest
+
+from app.services import metering
+from app.services.metering import UsageMeter
+
+
+class FakeConnection:
+    def __init__(self, engine: "FakeEngine"):
+        self.engine = engine
+
+    async def execute(self, statement, params: List[Dict[str, int]]):
+        self.engine.batches.append({row["b_user_id"]: row["b_calls"] for row in params})
+
+
+class FakeEngine:
+    """Stands in for async_engine; transactions listed in `fail_on` raise."""
+
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.transactions = 0
+        self.batches: List[Dict[int, int]] = []
+
+    @asynccontextmanager
+    async def begin(self):
+        self.transactions += 1
+        if self.transactions in self.fail_on:
+            raise RuntimeError("database is locked")
+        yield FakeConnection(self)
+
+    def totals(self) -> Dict[int, int]:
+        totals: Dict[int, int] = {}
+        for batch in self.batches:
+            for user_id, calls in batch.items():
+                totals[user_id] = totals.get(user_id, 0) + calls
+        return totals
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(metering, "async_engine", engine)
+
+    async def add_hourly_api_calls(conn, counts, now):
+        pass
+
+    monkeypatch.setattr(metering, "add_hourly_api_calls", add_hourly_api_calls)
+    return engine
+
+
+async def _wait_for(condition, timeout: float = 2.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_flush_splits_users_into_batches(engine):
+    meter = UsageMeter(shards=4, batch_size=3)
+    for user_id in range(1, 8):
+        meter.record(user_id)
+    meter.record(1, calls=4)
+
+    assert asyncio.run(meter.flush()) == 7
+    assert [len(batch) for batch in engine.batches] == [3, 3, 1]
+    assert engine.totals() == {1: 5, 2: 1, 3: 1, 4: 1, 5: 1, 6: 1, 7: 1}
+    assert meter.pending() == {}
+
+
+def test_flush_without_pending_calls_skips_the_database(engine):
+    meter = UsageMeter()
+
+    assert asyncio.run(meter.flush()) == 0
+    assert engine.transactions == 0
+
+
+def test_max_pending_users_triggers_early_flush(engine):
+    async def scenario():
+        meter = UsageMeter(flush_interval=3600, max_pending_users=5)
+        meter.start()
+        for user_id in range(1, 5):
+            meter.record(user_id)
+            # More calls from a buffered user do not count towards the limit
+            meter.record(user_id)
+        await asyncio.sleep(0.05)
+        assert engine.batches == []
+
+        meter.record(5)
+        await _wait_for(lambda: engine.batches)
+        assert engine.totals() == {1: 2, 2: 2, 3: 2, 4: 2, 5: 1}
+        assert meter.pending() == {}
+        await meter.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_is_restored_and_retried(engine):
+    engine.fail_on = {2}
+    meter = UsageMeter(shards=1, batch_size=2)
+    for user_id in range(1, 6):
+        meter.record(user_id, calls=user_id)
+
+    # The first batch commits; the second fails, so it and the rest are kept
+    assert asyncio.run(meter.flush()) == 2
+    assert engine.totals() == {1: 1, 2: 2}
+    assert meter.pending() == {3: 3, 4: 4, 5: 5}
+
+    # Calls recorded meanwhile are merged with the restored counts
+    meter.record(3, calls=10)
+    meter.record(6)
+    assert asyncio.run(meter.flush()) == 4
+    assert engine.totals() == {1: 1, 2: 2, 3: 13, 4: 4, 5: 5, 6: 1}
+    assert meter.pending() == {}
+
+
+def test_failed_flush_does_not_wake_the_flusher(engine):
+    engine.fail_on = {1}
+
+    async def scenario():
+        meter = UsageMeter(flush_interval=3600, max_pending_users=2)
+        meter.start()
+        meter.record(1)
+        meter.record(2)
+        await _wait_for(lambda: engine.transactions == 1)
+        # Restored users count as pending again, but a failing database is
+        # retried on the next interval rather than straight away
+        await asyncio.sleep(0.05)
+        assert engine.transactions == 1
+        assert meter.pending() == {1: 1, 2: 1}
+        await meter.stop()
+        assert engine.totals() == {1: 1, 2: 1}
+
+    asyncio.run(scenario())
+
+
+def test_stop_flushes_remaining_calls(engine):
+    async def scenario():
+        meter = UsageMeter(flush_interval=3600, batch_size=2)
+        meter.start()
+        for user_id in range(1, 4):
+            meter.record(user_id)
+        await meter.stop()
+        assert engine.totals() == {1: 1, 2: 1, 3: 1}
+        assert meter.pending() == {}
+
+        # Stopping again, or without ever starting, still flushes
+        meter.record(4)
+        await meter.stop()
+        assert engine.totals()[4] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import plan_catalog
+
+
+class FakeSession:
+    """Answers the catalog query with `plans`, counting the reads."""
+
+    def __init__(self, plans):
+        self.plans = plans
+        self.reads = 0
+
+    async def execute(self, statement):
+        self.reads += 1
+        # Yield like a real query, so concurrent lookups interleave
+        await asyncio.sleep(0)
+        plans = list(self.plans)
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: plans))
+
+
+def _plan(plan_id: int):
+    return SimpleNamespace(
+        id=plan_id, name=f"Plan {plan_id}", description=None, price=1.0, features=[],
+        is_active=True, created_at=datetime(2025, 1, 1), updated_at=None,
+    )
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(plan_catalog, "_catalog", None)
+    monkeypatch.setattr(plan_catalog, "_lock", asyncio.Lock())
+    return FakeSession([_plan(1)])
+
+
+def test_unknown_plans_reload_at_most_once_per_interval(db, monkeypatch):
+    async def scenario():
+        assert (await plan_catalog.get_plan(db, 1)).name == "Plan 1"
+        # The catalog was just loaded, so misses are answered from it
+        for _ in range(10):
+            assert await plan_catalog.get_plan(db, 404) is None
+        assert db.reads == 1
+
+        # Once the interval has passed, a miss reloads, and finds a plan
+        # another worker created
+        monkeypatch.setattr(plan_catalog.settings, "PLAN_CATALOG_MISS_RELOAD_INTERVAL", 0)
+        db.plans.append(_plan(2))
+        assert (await plan_catalog.get_plan(db, 2)).name == "Plan 2"
+        assert db.reads == 2
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_misses_share_one_reload(db, monkeypatch):
+    async def scenario():
+        await plan_catalog.get_plan_catalog(db)
+        monkeypatch.setattr(plan_catalog.settings, "PLAN_CATALOG_MISS_RELOAD_INTERVAL", 60)
+        plan_catalog._catalog.loaded_at -= 120
+        results = await asyncio.gather(*(plan_catalog.get_plan(db, 404) for _ in range(20)))
+        assert results == [None] * 20
+        assert db.reads == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import threading
+
+from app.services.product_matcher import ProductMatcher
+
+
+def _catalog(size: int):
+    return [{"id": str(index), "title": f"Widget {index}"} for index in range(size)]
+
+
+def test_matches_stay_consistent_during_updates():
+    matcher = ProductMatcher()
+    matcher.update(_catalog(200))
+    stop = threading.Event()
+
+    def refresh():
+        size = 200
+        while not stop.is_set():
+            # Grow and shrink the catalog, so levels merge and get rebuilt
+            size = 50 if size == 400 else size + 50
+            matcher.update(_catalog(size))
+
+    updater = threading.Thread(target=refresh)
+    updater.start()
+    try:
+        for _ in range(300):
+            for names in matcher.match_batch(["is the widget 12 any good", "widget 30 vs widget 45"]):
+                assert set(names) <= {"Widget 12", "Widget 30", "Widget 45"}
+    finally:
+        stop.set()
+        updater.join()
+
+    matcher.update(_catalog(50))
+    assert matcher.match_batch(["widget 12 or widget 45"]) == [["Widget 12", "Widget 45"]]
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import quota
+from app.services.metering import UsageMeter
+from app.services.quota import UNLIMITED, QuotaStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "app.quota")
+
+
+def test_calls_beyond_the_limit_are_refused(path):
+    store = QuotaStore(path, slots=64, ways=4, stripes=4)
+    resets_at = time.time() + 3600
+    assert store.load(7, limit=10, used=8, resets_at=resets_at)
+
+    assert store.consume(7).remaining == 1
+    assert store.consume(7).remaining == 0
+    refused = store.consume(7)
+    assert not refused.allowed
+    assert refused.remaining == 0
+    assert 3590 < refused.retry_after <= 3601
+    # Refused calls are not charged, and the quota does not refill
+    assert not store.consume(7).allowed
+
+
+def test_workers_share_the_count(path):
+    first = QuotaStore(path, slots=64, ways=4, stripes=4)
+    second = QuotaStore(path, slots=64, ways=4, stripes=4)
+    first.load(7, limit=3, used=0, resets_at=0.0)
+    # Another worker's load keeps the count already charged
+    first.consume(7)
+    assert second.load(7, limit=3, used=0, resets_at=0.0)
+
+    assert second.consume(7).remaining == 1
+    assert first.consume(7).remaining == 0
+    refused = second.consume(7)
+    assert not refused.allowed
+    assert refused.retry_after is None
+
+
+def test_colliding_users_take_other_ways_instead_of_evicting(path):
+    store = QuotaStore(path, slots=8, ways=2, stripes=4)
+    # slots / ways = 4 buckets: 1, 5 and 9 all hash to bucket 1
+    assert store.load(1, limit=5, used=0, resets_at=0.0)
+    assert store.load(5, limit=5, used=4, resets_at=0.0)
+    assert not store.load(9, limit=5, used=0, resets_at=0.0)
+    assert store.consume(9) is None
+
+    assert store.consume(1).remaining == 4
+    assert store.consume(5).remaining == 0
+
+    # Invalidating a user frees their way for the next one
+    store.invalidate(1)
+    assert store.consume(1) is None
+    assert store.load(9, limit=5, used=0, resets_at=0.0)
+    assert store.consume(9).remaining == 4
+    assert store.consume(5).allowed is False
+
+
+def test_users_without_usage_stats_are_not_limited(path):
+    store = QuotaStore(path, slots=64, ways=4, stripes=4)
+    store.load(3, limit=UNLIMITED, used=0, resets_at=0.0)
+
+    for _ in range(3):
+        decision = store.consume(3)
+        assert decision.allowed
+        assert decision.limit is None
+
+
+@pytest.fixture
+def full_store(monkeypatch, path):
+    """A one-slot store already taken by another user, so check_quota falls back."""
+    store = QuotaStore(path, slots=1, ways=1, stripes=1)
+    store.load(99, limit=10, used=0, resets_at=0.0)
+    meter = UsageMeter()
+    monkeypatch.setattr(quota, "quota_store", store)
+    monkeypatch.setattr(quota, "usage_meter", meter)
+
+    async def load_usage(db, user_id):
+        return 5, 3, 0.0
+
+    monkeypatch.setattr(quota, "_load_usage", load_usage)
+    return meter
+
+
+def test_fallback_counts_unflushed_and_in_flight_calls(full_store):
+    full_store.record(7)
+
+    # 3 stored + 1 unflushed: this call is the last one the limit allows
+    first = asyncio.run(quota.check_quota(None, 7))
+    assert first.allowed and first.remaining == 0
+    # Metered on admission, before its response has been sent
+    assert first.metered
+    assert full_store.pending_calls(7) == 2
+
+    refused = asyncio.run(quota.check_quota(None, 7))
+    assert not refused.allowed and not refused.metered
+    assert full_store.pending_calls(7) == 2
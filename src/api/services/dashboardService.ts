@@ -60,9 +60,10 @@ const getDashboardStats = () =>
 		url: DashboardApi.Stats,
 	});
 
-const getIntentUsageArea = () =>
+const getIntentUsageArea = (year?: number) =>
 	apiClient.get<IntentUsageAreaData>({
 		url: DashboardApi.IntentUsageArea,
+		params: { year },
 	});
 
 const getIntentUsage = () =>
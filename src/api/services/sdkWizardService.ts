@@ -46,6 +46,34 @@ export interface ExtractDataRequest {
 	platform: string;
 }
 
+export interface ExtractionProgress {
+	pages: number;
+	products: number;
+	skipped: number;
+	bytes: number;
+	total: number | null;
+	removed: number;
+	elapsed: number;
+}
+
+export interface ExtractionJob {
+	id: string;
+	kind: string;
+	status: "queued" | "running" | "succeeded" | "failed";
+	progress: ExtractionProgress | null;
+	result: (ExtractionProgress & { data: ExtractedProduct[] }) | null;
+	error: string | null;
+	attempts: number;
+	created_at: string;
+	updated_at: string;
+	started_at: string | null;
+	finished_at: string | null;
+}
+
+const EXTRACTION_POLL_INTERVAL = 1000;
+// Give up on a job that has not finished after this long
+const EXTRACTION_POLL_TIMEOUT = 30 * 60 * 1000;
+
 const sdkWizardService = {
 	validateConnection: (data: ConnectionValidationRequest) => {
 		return apiClient.post<{ success: boolean; message: string }>({
@@ -74,11 +102,38 @@ const sdkWizardService = {
 		});
 	},
 
-	extractData: (data: ExtractDataRequest) => {
-		return apiClient.post<{ success: boolean; data: ExtractedProduct[]; message: string }>({
+	// Extraction runs as a background job; queue it and poll until it finishes
+	extractData: async (
+		data: ExtractDataRequest,
+		onProgress?: (progress: ExtractionProgress) => void,
+	): Promise<{ success: boolean; data: ExtractedProduct[]; total: number; message: string }> => {
+		const { job_id } = await apiClient.post<{ job_id: string }>({
 			url: "/sdk-wizard/extract-data",
 			data,
 		});
+		const deadline = Date.now() + EXTRACTION_POLL_TIMEOUT;
+		while (Date.now() < deadline) {
+			const job = await apiClient.get<ExtractionJob>({
+				url: `/sdk-wizard/extract-data/${job_id}`,
+			});
+			if (job.status === "succeeded" && job.result) {
+				const total = job.result.total ?? job.result.products;
+				return {
+					success: true,
+					data: job.result.data,
+					total,
+					message: `Successfully extracted ${total} products`,
+				};
+			}
+			if (job.status === "failed") {
+				return { success: false, data: [], total: 0, message: job.error || "Failed to extract data" };
+			}
+			if (job.progress && onProgress) {
+				onProgress(job.progress);
+			}
+			await new Promise((resolve) => setTimeout(resolve, EXTRACTION_POLL_INTERVAL));
+		}
+		return { success: false, data: [], total: 0, message: "Extraction is taking too long; please try again later" };
 	},
 
 	completeWizard: () => {
@@ -762,7 +762,7 @@ function DataExtractionStep({ formData, setFormData, isLoading, setIsLoading, se
 
 				setExtractionStats((prev) => ({
 					...prev,
-					totalProducts: response.data.length,
+					totalProducts: response.total,
 					totalFields: Object.keys(extractedFields).length,
 					endTime: Date.now(),
 				}));
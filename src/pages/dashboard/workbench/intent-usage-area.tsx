@@ -6,8 +6,14 @@ import Card from "@/components/card";
 import Chart from "@/components/chart/chart";
 import useChart from "@/components/chart/useChart";
 
+const currentYear = new Date().getFullYear();
+const yearOptions = [0, 1, 2].map((offset) => ({
+	value: currentYear - offset,
+	label: String(currentYear - offset),
+}));
+
 export default function IntentUsageArea() {
-	const [year, setYear] = useState("2022");
+	const [year, setYear] = useState(currentYear);
 	const [loading, setLoading] = useState(true);
 	const [series, setSeries] = useState<IntentUsageAreaData>({});
 
@@ -15,7 +21,7 @@ export default function IntentUsageArea() {
 		const fetchData = async () => {
 			try {
 				setLoading(true);
-				const data = await dashboardService.getIntentUsageArea();
+				const data = await dashboardService.getIntentUsageArea(year);
 				setSeries(data);
 			} catch (error) {
 				console.error("Error fetching intent usage area data:", error);
@@ -25,7 +31,7 @@ export default function IntentUsageArea() {
 		};
 
 		fetchData();
-	}, []);
+	}, [year]);
 
 	return (
 		<Card className="flex-col">
@@ -35,7 +41,7 @@ export default function IntentUsageArea() {
 					size="small"
 					defaultValue={year}
 					onChange={(value) => setYear(value)}
-					options={[{ value: 2022, label: "2022" }]}
+					options={yearOptions}
 				/>
 			</header>
 			<main className="w-full">
@@ -44,7 +50,7 @@ export default function IntentUsageArea() {
 						<Skeleton.Input active style={{ width: "100%", height: "100%" }} />
 					</div>
 				) : (
-					<ChartArea series={series[year] || []} />
+					<ChartArea series={series[String(year)] || []} />
 				)}
 			</main>
 		</Card>